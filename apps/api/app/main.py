@@ -1,15 +1,21 @@
 import csv
 import hashlib
+import io
 import json
 import logging
 import math
+import mmap
+import multiprocessing
 import os
 import re
 import secrets
 import smtplib
 import sqlite3
 import threading
+import time
 import unicodedata
+import zlib
+import numpy as np
 import xlrd
 import pdfplumber
 import urllib.parse
@@ -17,15 +23,43 @@ import urllib.request
 from io import BytesIO
 from datetime import datetime, timedelta, date
 from email.message import EmailMessage
-from contextlib import contextmanager
-
-from fastapi import FastAPI, Header, HTTPException, UploadFile, File, Form
+from collections import OrderedDict
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    CancelledError,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
+from itertools import chain, groupby, islice
+from typing import BinaryIO, Callable, Iterable, Iterator
+from xml.etree import ElementTree
+
+from fastapi import FastAPI, Header, HTTPException, Query, UploadFile, File, Form
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from openpyxl import load_workbook
 
 
-app = FastAPI(title="MyFAInance v2 API")
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):
+    _start_session_sweeper()
+    _resume_background_jobs()
+    yield
+    _stop_session_sweeper()
+    _shutdown_price_refresh_pool()
+    _shutdown_background_jobs()
+    _shutdown_parse_pool()
+    _clear_banking_staging()
+    _close_db_connections()
+
+
+app = FastAPI(title="MyFAInance v2 API", lifespan=_lifespan)
 logger = logging.getLogger("myfainance")
 app.add_middleware(
     CORSMiddleware,
@@ -39,6 +73,8 @@ app.add_middleware(
 EMAIL_REGEX = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 CODE_TTL_MINUTES = 10
 SESSION_TTL_HOURS = 24
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "60"))
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "300"))
 DEFAULT_CATEGORIES = ["Cash", "Emergency Funds", "Retirement Plans", "Stocks"]
 DEFAULT_INVESTMENT_TAGS = [
     "ETF",
@@ -94,6 +130,24 @@ ALLOWED_CURRENCIES = {"EUR", "USD", "GBP"}
 PRICE_API_PROVIDER = os.getenv("PRICE_API_PROVIDER", "twelvedata").lower()
 PRICE_API_KEY = os.getenv("PRICE_API_KEY", "")
 PRICE_CACHE_TTL_MINUTES = int(os.getenv("PRICE_CACHE_TTL_MINUTES", "60"))
+PRICE_REFRESH_MAX_WORKERS = int(os.getenv("PRICE_REFRESH_MAX_WORKERS", "4"))
+PRICE_REFRESH_JOB_TTL_MINUTES = int(os.getenv("PRICE_REFRESH_JOB_TTL_MINUTES", "60"))
+PRICE_PROVIDER_CALLS_PER_MINUTE = {
+    "twelvedata": float(os.getenv("TWELVEDATA_CALLS_PER_MINUTE", "55")),
+    "finnhub": float(os.getenv("FINNHUB_CALLS_PER_MINUTE", "55")),
+    "yfinance": float(os.getenv("YFINANCE_CALLS_PER_MINUTE", "30")),
+}
+TWELVEDATA_BATCH_SIZE = int(os.getenv("TWELVEDATA_BATCH_SIZE", "8"))
+BACKGROUND_JOB_WORKERS = int(os.getenv("BACKGROUND_JOB_WORKERS", "2"))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(os.cpu_count() or 1, 4))))
+PARSE_TIMEOUT_SECONDS = float(os.getenv("PARSE_TIMEOUT_SECONDS", "60"))
+FX_BASE_CURRENCY = "EUR"
+FX_RATES_URL = os.getenv(
+    "FX_RATES_URL", "https://www.ecb.europa.eu/stats/eurofxref/eurofxref-hist-90d.xml"
+)
+FX_RATES_CACHE_SECONDS = int(os.getenv("FX_RATES_CACHE_SECONDS", "300"))
+# Units per USD, used only for currencies that have no row in fx_rates.
+FALLBACK_FX_RATES = {"USD": 1.0, "EUR": 0.92, "GBP": 0.79, "CHF": 0.85, "JPY": 149.0}
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "")
 DB_PATH = os.getenv(
@@ -103,6 +157,40 @@ DB_PATH = os.getenv(
 if not os.path.isabs(DB_PATH):
     # If relative, make it relative to the app directory
     DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", DB_PATH))
+DB_BUSY_TIMEOUT_SECONDS = float(os.getenv("DB_BUSY_TIMEOUT_SECONDS", "30"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))
+DB_MMAP_SIZE_BYTES = int(os.getenv("DB_MMAP_SIZE_BYTES", str(256 * 1024 * 1024)))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").upper()
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "512"))
+BANKING_STAGING_DIR = os.getenv(
+    "BANKING_STAGING_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "banking_staging"),
+)
+BANKING_STAGING_TTL_MINUTES = int(os.getenv("BANKING_STAGING_TTL_MINUTES", "30"))
+BANKING_STAGING_MEMORY_ROWS = int(os.getenv("BANKING_STAGING_MEMORY_ROWS", "2000"))
+BANKING_PREVIEW_SAMPLE_ROWS = int(os.getenv("BANKING_PREVIEW_SAMPLE_ROWS", "50"))
+BANKING_HEADER_SCAN_ROWS = 40
+PARSE_CACHE_SIZE = int(os.getenv("PARSE_CACHE_SIZE", "128"))
+PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", "")
+PARSE_CACHE_DISK_ENTRIES = int(os.getenv("PARSE_CACHE_DISK_ENTRIES", "2048"))
+# Bump when a parser's output changes so spilled results are not reused.
+PARSE_CACHE_VERSION = 1
+HOLDINGS_HISTORY_CACHE_ENTRIES = int(os.getenv("HOLDINGS_HISTORY_CACHE_ENTRIES", "8"))
+HOLDINGS_HISTORY_FREQUENCIES = ("daily", "weekly", "monthly")
+BANKING_TRANSACTIONS_MAX_LIMIT = 5000
+BANKING_STREAM_PAGE_ROWS = 1000
+BANKING_TRANSACTION_FIELDS = (
+    "id",
+    "tx_date",
+    "description",
+    "amount",
+    "balance",
+    "currency",
+    "category",
+    "subcategory",
+    "institution",
+)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 
 BANKING_CATEGORY_TREE = {
     "Sem categoria": ["Sem subcategoria"],
@@ -196,6 +284,9 @@ BANKING_CATEGORY_KEYWORDS = [
     ("Habitacao (recheio)", "Mobilia", ["mobilia", "sofa", "cama"]),
     ("Habitacao (recheio)", "Decoracao", ["decoracao", "ikea"]),
 ]
+# User regex rules run on every imported description, so they are kept short
+# and free of nested quantifiers (the usual catastrophic-backtracking shape).
+BANKING_REGEX_MAX_LENGTH = 200
 
 
 class RegisterRequest(BaseModel):
@@ -417,9 +508,15 @@ class BankingCommitRequest(BaseModel):
     source_file: str
     file_hash: str
     institution: str
-    columns: list[str]
     mapping: dict[str, int | None]
-    rows: list[BankingPreviewRow]
+    # Without columns/rows the rows staged by the preview for file_hash are used,
+    # minus the excluded row indexes.
+    columns: list[str] | None = None
+    rows: list[BankingPreviewRow] | None = None
+    excluded_rows: list[int] = []
+    # "skip" drops rows already stored by an overlapping statement, "reject"
+    # refuses the whole file when any are found.
+    duplicates: str = "skip"
 
 
 class BankingCategoryUpdateRequest(BaseModel):
@@ -427,6 +524,13 @@ class BankingCategoryUpdateRequest(BaseModel):
     subcategory: str | None = None
 
 
+class BankingRuleRequest(BaseModel):
+    match_type: str = "keyword"
+    pattern: str
+    category: str
+    subcategory: str | None = None
+
+
 class BankingBudgetRequest(BaseModel):
     category: str
     amount: float
@@ -492,18 +596,117 @@ class CategoryAddRequest(BaseModel):
     category: str
 
 
-@contextmanager
-def _db_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+_db_local = threading.local()
+_db_pool_lock = threading.Lock()
+_db_pool: dict[int, sqlite3.Connection] = {}
+
+
+def _open_db_connection() -> sqlite3.Connection:
+    # Connections are pinned to one thread by the pool, so the sqlite3 thread
+    # check is only disabled to let shutdown close them from the main thread.
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT_SECONDS,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE_SIZE,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    if DB_SYNCHRONOUS in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size=-{max(DB_CACHE_SIZE_KB, 0)}")
+    conn.execute(f"PRAGMA mmap_size={max(DB_MMAP_SIZE_BYTES, 0)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _thread_db_connection() -> sqlite3.Connection:
+    conn = getattr(_db_local, "conn", None)
+    if conn is not None and getattr(_db_local, "path", None) == DB_PATH:
+        return conn
+    if conn is not None:
+        _release_thread_db_connection()
+    conn = _open_db_connection()
+    _db_local.conn = conn
+    _db_local.path = DB_PATH
+    _db_local.depth = 0
+    with _db_pool_lock:
+        _db_pool[threading.get_ident()] = conn
+    return conn
+
+
+def _release_thread_db_connection() -> None:
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        return
+    with _db_pool_lock:
+        _db_pool.pop(threading.get_ident(), None)
+    _db_local.conn = None
+    _db_local.depth = 0
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+def _close_db_connections() -> None:
+    with _db_pool_lock:
+        connections = list(_db_pool.values())
+        _db_pool.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+    _db_local.conn = None
+    _db_local.depth = 0
+
+
+@contextmanager
+def _db_connection(conn: sqlite3.Connection | None = None) -> sqlite3.Connection:
+    """Yield the calling thread's pooled connection.
+
+    The outermost block owns the transaction and commits or rolls it back on
+    exit. Nested blocks on the same thread, or blocks handed an already-open
+    ``conn``, reuse that connection inside a savepoint, so one request runs on
+    a single connection while inner failures only undo their own statements.
+    Derived tables queued dirty by the write are patched before the commit, so
+    readers never have to write.
+    """
+    if conn is None:
+        conn = _thread_db_connection()
+    pooled = conn is getattr(_db_local, "conn", None)
+    depth = getattr(_db_local, "depth", 0) if pooled else 1
+    if depth == 0:
+        _db_local.depth = 1
+        try:
+            yield conn
+            if conn.in_transaction:
+                _sync_dirty_portfolios(conn)
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            _db_local.depth = 0
+        return
+    savepoint = f"sp_{depth}"
+    if pooled:
+        _db_local.depth = depth + 1
+    conn.execute(f"SAVEPOINT {savepoint}")
     try:
         yield conn
-        conn.commit()
+        conn.execute(f"RELEASE SAVEPOINT {savepoint}")
     except Exception:
-        conn.rollback()
+        try:
+            conn.execute(f"ROLLBACK TO SAVEPOINT {savepoint}")
+            conn.execute(f"RELEASE SAVEPOINT {savepoint}")
+        except sqlite3.Error:
+            pass
         raise
     finally:
-        conn.close()
+        if pooled:
+            _db_local.depth = depth
 
 
 def _init_db() -> None:
@@ -998,106 +1201,1358 @@ def _init_db() -> None:
                 WHERE lower(category) = 'cash' AND is_investment != 0
                 """
             )
+        _apply_schema_migrations(conn)
+        # Queues left behind by releases that synced on read.
+        _sync_dirty_portfolios(conn)
 
 
-def _get_user(email: str) -> sqlite3.Row | None:
-    with _db_connection() as conn:
-        return conn.execute(
-            "SELECT email, salt, password_hash, verified, created_at FROM users WHERE email = ?",
-            (email,),
-        ).fetchone()
-
-
-def _save_user(email: str, salt: str, password_hash: str, verified: bool, created_at: str) -> None:
-    updated_at = datetime.utcnow().isoformat()
-    with _db_connection() as conn:
-        conn.execute(
+# Versioned schema steps applied once per database, in order, after the base
+# tables exist. Each step is either a SQL statement or a callable taking the
+# open connection. Append new versions; never edit or renumber shipped ones.
+SCHEMA_MIGRATIONS: list[tuple[int, str, tuple]] = [
+    (
+        1,
+        "secondary_indexes",
+        (
+            "CREATE INDEX IF NOT EXISTS idx_sessions_email ON sessions(email)",
+            "CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at)",
+            "CREATE INDEX IF NOT EXISTS idx_debts_owner ON debts(owner_email)",
+            "CREATE INDEX IF NOT EXISTS idx_goal_contributions_goal "
+            "ON goal_contributions(goal_id, contribution_date)",
+            "CREATE INDEX IF NOT EXISTS idx_santander_imports_portfolio "
+            "ON santander_imports(portfolio_id, imported_at)",
+            "CREATE INDEX IF NOT EXISTS idx_santander_items_import "
+            "ON santander_items(import_id, category, balance, invested, gains)",
+            "CREATE INDEX IF NOT EXISTS idx_trade_republic_portfolio "
+            "ON trade_republic_entries(portfolio_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_trade_republic_portfolio_source "
+            "ON trade_republic_entries(portfolio_id, source)",
+            "CREATE INDEX IF NOT EXISTS idx_trade_republic_portfolio_hash "
+            "ON trade_republic_entries(portfolio_id, file_hash)",
+            "CREATE INDEX IF NOT EXISTS idx_save_ngrow_entries_portfolio "
+            "ON save_ngrow_entries(portfolio_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_save_ngrow_imports_portfolio "
+            "ON save_ngrow_imports(portfolio_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_save_ngrow_items_import "
+            "ON save_ngrow_items(import_id, category)",
+            "CREATE INDEX IF NOT EXISTS idx_aforronet_imports_portfolio "
+            "ON aforronet_imports(portfolio_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_aforronet_items_import "
+            "ON aforronet_items(import_id)",
+            "CREATE INDEX IF NOT EXISTS idx_bancoinvest_imports_portfolio "
+            "ON bancoinvest_imports(portfolio_id, imported_at)",
+            "CREATE INDEX IF NOT EXISTS idx_bancoinvest_items_import "
+            "ON bancoinvest_items(import_id, category, current_value, invested, gains)",
+            "CREATE INDEX IF NOT EXISTS idx_xtb_imports_portfolio "
+            "ON xtb_imports(portfolio_id, imported_at)",
+            "CREATE INDEX IF NOT EXISTS idx_holdings_imports_portfolio "
+            "ON holdings_imports(portfolio_id, snapshot_date)",
+            "CREATE INDEX IF NOT EXISTS idx_holdings_items_import "
+            "ON holdings_items(import_id, ticker)",
+            "CREATE INDEX IF NOT EXISTS idx_holdings_metadata_portfolio "
+            "ON holdings_metadata(portfolio_id, ticker)",
+            "CREATE INDEX IF NOT EXISTS idx_holding_transactions_portfolio "
+            "ON holding_transactions(portfolio_id, ticker, trade_date)",
+            "CREATE INDEX IF NOT EXISTS idx_holdings_operations_portfolio "
+            "ON holdings_operations(portfolio_id, trade_date)",
+            "CREATE INDEX IF NOT EXISTS idx_holdings_operations_import "
+            "ON holdings_operations(import_id)",
+            "CREATE INDEX IF NOT EXISTS idx_banking_transactions_portfolio_date "
+            "ON banking_transactions(portfolio_id, tx_date)",
+            "CREATE INDEX IF NOT EXISTS idx_banking_transactions_import "
+            "ON banking_transactions(import_id)",
+            "CREATE INDEX IF NOT EXISTS idx_banking_budgets_portfolio_month "
+            "ON banking_budgets(portfolio_id, month)",
+        ),
+    ),
+    (
+        2,
+        "background_jobs",
+        (
             """
-            INSERT OR REPLACE INTO users (email, salt, password_hash, verified, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?)
+            CREATE TABLE IF NOT EXISTS background_jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                owner_email TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload_json TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                checkpoint INTEGER NOT NULL DEFAULT 0,
+                success_count INTEGER NOT NULL DEFAULT 0,
+                errors_json TEXT NOT NULL DEFAULT '[]',
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                updated_at TEXT NOT NULL,
+                finished_at TEXT
+            )
             """,
-            (email, salt, password_hash, 1 if verified else 0, created_at, updated_at),
-        )
+            "CREATE INDEX IF NOT EXISTS idx_background_jobs_status "
+            "ON background_jobs(status, created_at)",
+        ),
+    ),
+    (
+        3,
+        "portfolio_latest_totals",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS portfolio_data_versions (
+                portfolio_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS portfolio_latest_totals (
+                portfolio_id INTEGER NOT NULL,
+                settings_hash TEXT NOT NULL,
+                data_version INTEGER NOT NULL,
+                totals_json TEXT NOT NULL,
+                total_invested REAL NOT NULL,
+                total_profit REAL NOT NULL,
+                investment_current_total REAL NOT NULL,
+                cash_investment INTEGER NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (portfolio_id, settings_hash)
+            )
+            """,
+            lambda conn: _create_portfolio_version_triggers(conn),
+        ),
+    ),
+    (
+        4,
+        "portfolio_history_entries",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS portfolio_history_entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                portfolio_id INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                source_id INTEGER NOT NULL,
+                date_key TEXT NOT NULL,
+                category TEXT NOT NULL,
+                total REAL NOT NULL,
+                invested REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_history_entries_portfolio_date "
+            "ON portfolio_history_entries(portfolio_id, date_key, category, source, total, invested)",
+            "CREATE INDEX IF NOT EXISTS idx_history_entries_source "
+            "ON portfolio_history_entries(portfolio_id, source, source_id)",
+            """
+            CREATE TABLE IF NOT EXISTS portfolio_history_dirty (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                portfolio_id INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                source_id INTEGER NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_history_dirty_portfolio "
+            "ON portfolio_history_dirty(portfolio_id, id)",
+            lambda conn: _create_history_dirty_triggers(conn),
+        ),
+    ),
+    (
+        5,
+        "normalized_snapshot_dates",
+        (lambda conn: _add_snapshot_at_columns(conn),),
+    ),
+    (
+        6,
+        "portfolio_cash_flows",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS portfolio_cash_flows (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                portfolio_id INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                source_id INTEGER NOT NULL,
+                flow_date TEXT NOT NULL,
+                category TEXT NOT NULL,
+                amount REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_cash_flows_portfolio_date "
+            "ON portfolio_cash_flows(portfolio_id, flow_date, category, source, amount)",
+            "CREATE INDEX IF NOT EXISTS idx_cash_flows_source "
+            "ON portfolio_cash_flows(portfolio_id, source, source_id)",
+            """
+            CREATE TABLE IF NOT EXISTS portfolio_cash_flow_dirty (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                portfolio_id INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                source_id INTEGER NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_cash_flow_dirty_portfolio "
+            "ON portfolio_cash_flow_dirty(portfolio_id, id)",
+            lambda conn: _create_cash_flow_dirty_triggers(conn),
+        ),
+    ),
+    (
+        7,
+        "banking_monthly_spend",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS banking_monthly_spend (
+                portfolio_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                category_key TEXT NOT NULL,
+                category TEXT NOT NULL,
+                spent REAL NOT NULL DEFAULT 0,
+                income REAL NOT NULL DEFAULT 0,
+                tx_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (portfolio_id, month, category_key)
+            ) WITHOUT ROWID
+            """,
+            "ALTER TABLE banking_budgets ADD COLUMN category_key TEXT",
+            lambda conn: _backfill_banking_monthly_spend(conn),
+        ),
+    ),
+    (
+        8,
+        "banking_transaction_keys",
+        (
+            """
+            ALTER TABLE banking_transactions ADD COLUMN month TEXT
+            GENERATED ALWAYS AS (substr(tx_date, 1, 7)) VIRTUAL
+            """,
+            "ALTER TABLE banking_transactions ADD COLUMN category_key TEXT",
+            "ALTER TABLE banking_transactions ADD COLUMN subcategory_key TEXT",
+            lambda conn: _backfill_banking_transaction_keys(conn),
+            "CREATE INDEX IF NOT EXISTS idx_banking_transactions_month "
+            "ON banking_transactions(portfolio_id, month, tx_date)",
+            "CREATE INDEX IF NOT EXISTS idx_banking_transactions_category "
+            "ON banking_transactions(portfolio_id, category_key, subcategory_key, tx_date)",
+        ),
+    ),
+    (
+        9,
+        "banking_transactions_fts",
+        (
+            "ALTER TABLE banking_transactions ADD COLUMN description_key TEXT",
+            lambda conn: _backfill_banking_description_keys(conn),
+            # External-content index over the normalized description; the
+            # triggers below keep it in step with the base table.
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS banking_transactions_fts USING fts5(
+                description_key,
+                content='banking_transactions',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS banking_transactions_fts_insert
+            AFTER INSERT ON banking_transactions
+            BEGIN
+                INSERT INTO banking_transactions_fts (rowid, description_key)
+                VALUES (new.id, new.description_key);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS banking_transactions_fts_delete
+            AFTER DELETE ON banking_transactions
+            BEGIN
+                INSERT INTO banking_transactions_fts (banking_transactions_fts, rowid, description_key)
+                VALUES ('delete', old.id, old.description_key);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS banking_transactions_fts_update
+            AFTER UPDATE OF description, description_key ON banking_transactions
+            BEGIN
+                INSERT INTO banking_transactions_fts (banking_transactions_fts, rowid, description_key)
+                VALUES ('delete', old.id, old.description_key);
+                INSERT INTO banking_transactions_fts (rowid, description_key)
+                VALUES (new.id, new.description_key);
+            END
+            """,
+            "INSERT INTO banking_transactions_fts (banking_transactions_fts) VALUES ('rebuild')",
+        ),
+    ),
+    (
+        10,
+        "banking_transaction_fingerprints",
+        (
+            "ALTER TABLE banking_transactions ADD COLUMN fingerprint TEXT",
+            lambda conn: _backfill_banking_fingerprints(conn),
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_banking_transactions_fingerprint "
+            "ON banking_transactions(portfolio_id, fingerprint)",
+        ),
+    ),
+    (
+        11,
+        "banking_compact_raw",
+        (
+            "ALTER TABLE banking_imports ADD COLUMN columns_json TEXT",
+            "ALTER TABLE banking_transactions ADD COLUMN raw_cells BLOB",
+            lambda conn: _compact_banking_raw_json(conn),
+        ),
+    ),
+    (
+        12,
+        "fx_rates",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS fx_rates (
+                base TEXT NOT NULL,
+                quote TEXT NOT NULL,
+                rate_date TEXT NOT NULL,
+                rate REAL NOT NULL,
+                source TEXT,
+                PRIMARY KEY (base, quote, rate_date)
+            ) WITHOUT ROWID
+            """,
+        ),
+    ),
+    (
+        13,
+        "price_history",
+        (
+            # Clustered on (ticker, price_date): the table is its own covering
+            # index for range scans and as-of lookups.
+            """
+            CREATE TABLE IF NOT EXISTS price_history (
+                ticker TEXT NOT NULL,
+                price_date TEXT NOT NULL,
+                close REAL NOT NULL,
+                currency TEXT,
+                source TEXT,
+                PRIMARY KEY (ticker, price_date)
+            ) WITHOUT ROWID
+            """,
+            """
+            INSERT OR IGNORE INTO price_history (ticker, price_date, close, currency, source)
+            SELECT ticker, substr(updated_at, 1, 10), price, currency, 'latest'
+            FROM holdings_prices
+            WHERE price > 0
+            """,
+            lambda conn: _create_price_history_triggers(conn),
+        ),
+    ),
+    (
+        14,
+        "market_data_version",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS market_data_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+            """,
+            lambda conn: _create_market_data_version_triggers(conn),
+        ),
+    ),
+    (
+        15,
+        "portfolio_totals_dirty",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS portfolio_totals_dirty (
+                portfolio_id INTEGER PRIMARY KEY
+            )
+            """,
+            lambda conn: _create_totals_dirty_triggers(conn),
+            "INSERT OR IGNORE INTO portfolio_totals_dirty (portfolio_id) SELECT id FROM portfolios",
+        ),
+    ),
+    (
+        16,
+        "portfolio_cash_flow_category_keys",
+        (
+            "ALTER TABLE portfolio_cash_flows ADD COLUMN category_key TEXT",
+            lambda conn: _backfill_cash_flow_category_keys(conn),
+            "DROP INDEX IF EXISTS idx_cash_flows_portfolio_date",
+            "CREATE INDEX IF NOT EXISTS idx_cash_flows_portfolio_category_key "
+            "ON portfolio_cash_flows(portfolio_id, category_key, flow_date, source, amount)",
+        ),
+    ),
+    (
+        17,
+        "portfolio_history_revisions",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS portfolio_history_revisions (
+                portfolio_id INTEGER PRIMARY KEY,
+                revision INTEGER NOT NULL
+            )
+            """,
+        ),
+    ),
+]
 
 
-def _set_verified(email: str, verified: bool) -> None:
-    with _db_connection() as conn:
-        conn.execute(
-            "UPDATE users SET verified = ?, updated_at = ? WHERE email = ?",
-            (1 if verified else 0, datetime.utcnow().isoformat(), email),
-        )
+# Tables whose rows feed portfolio totals and history. Every write to them
+# bumps portfolio_data_versions through triggers, which is what invalidates the
+# materialized per-portfolio caches. Child tables resolve the portfolio through
+# their import.
+PORTFOLIO_SOURCE_TABLES: dict[str, str | None] = {
+    "santander_imports": None,
+    "santander_items": "santander_imports",
+    "trade_republic_entries": None,
+    "save_ngrow_entries": None,
+    "save_ngrow_imports": None,
+    "save_ngrow_items": "save_ngrow_imports",
+    "aforronet_imports": None,
+    "aforronet_items": "aforronet_imports",
+    "bancoinvest_imports": None,
+    "bancoinvest_items": "bancoinvest_imports",
+    "xtb_imports": None,
+    "holdings_imports": None,
+    "holdings_items": "holdings_imports",
+    "holding_transactions": None,
+    "holdings_operations": None,
+}
 
 
-def _set_password(email: str, salt: str, password_hash: str) -> None:
-    with _db_connection() as conn:
-        conn.execute(
-            "UPDATE users SET salt = ?, password_hash = ?, updated_at = ? WHERE email = ?",
-            (salt, password_hash, datetime.utcnow().isoformat(), email),
-                )
+# Per-import contributions to the daily history, as (date value, category,
+# total, invested) rows for one source row id. Santander, Save'n'Grow and
+# BancoInvest contributions come from the import's items.
+HISTORY_SOURCE_QUERIES: dict[str, str] = {
+    "santander_imports": """
+        SELECT imp.imported_at AS date_value,
+               items.category AS category,
+               SUM(items.balance) AS total,
+               SUM(COALESCE(items.invested, 0)) AS invested
+        FROM santander_imports AS imp
+        JOIN santander_items AS items ON items.import_id = imp.id
+        WHERE imp.id = ?
+        GROUP BY items.category
+    """,
+    "trade_republic_entries": """
+        SELECT COALESCE(snapshot_date, created_at) AS date_value,
+               COALESCE(NULLIF(category, ''), 'Cash') AS category,
+               value AS total,
+               COALESCE(invested, 0) AS invested
+        FROM trade_republic_entries
+        WHERE id = ?
+    """,
+    "save_ngrow_imports": """
+        SELECT COALESCE(imp.snapshot_date, imp.created_at) AS date_value,
+               items.category AS category,
+               SUM(items.current_value) AS total,
+               SUM(COALESCE(items.invested, 0)) AS invested
+        FROM save_ngrow_imports AS imp
+        JOIN save_ngrow_items AS items ON items.import_id = imp.id
+        WHERE imp.id = ?
+        GROUP BY items.category
+    """,
+    "save_ngrow_entries": """
+        SELECT COALESCE(snapshot_date, created_at) AS date_value,
+               'Retirement Plans' AS category,
+               current_value AS total,
+               COALESCE(invested, 0) AS invested
+        FROM save_ngrow_entries
+        WHERE id = ?
+    """,
+    "aforronet_imports": """
+        SELECT COALESCE(snapshot_date, created_at) AS date_value,
+               COALESCE(NULLIF(category, ''), 'Emergency Funds') AS category,
+               current_value_total AS total,
+               COALESCE(invested_total, 0) AS invested
+        FROM aforronet_imports
+        WHERE id = ?
+    """,
+    "bancoinvest_imports": """
+        SELECT COALESCE(imp.snapshot_date, imp.imported_at) AS date_value,
+               COALESCE(NULLIF(items.category, ''), 'Retirement Plans') AS category,
+               SUM(items.current_value) AS total,
+               SUM(COALESCE(items.invested, 0)) AS invested
+        FROM bancoinvest_imports AS imp
+        JOIN bancoinvest_items AS items ON items.import_id = imp.id
+        WHERE imp.id = ?
+        GROUP BY COALESCE(NULLIF(items.category, ''), 'Retirement Plans')
+    """,
+    "xtb_imports": """
+        SELECT imported_at AS date_value,
+               COALESCE(NULLIF(category, ''), 'Stocks') AS category,
+               current_value AS total,
+               COALESCE(invested, 0) AS invested
+        FROM xtb_imports
+        WHERE id = ?
+    """,
+}
 
 
-def _get_profile_age(email: str) -> int | None:
-    with _db_connection() as conn:
-        row = conn.execute(
-            "SELECT age FROM user_profiles WHERE email = ?",
-            (email,),
-        ).fetchone()
-    return row["age"] if row and row["age"] is not None else None
+def _create_dirty_queue_triggers(
+    conn: sqlite3.Connection, queue_table: str, sources: set[str], suffix: str
+) -> None:
+    """Queue (portfolio_id, source, source_id) in queue_table on every write to sources.
 
+    Existing rows are queued too, so the first sync backfills the derived store.
+    """
+    for table, parent in PORTFOLIO_SOURCE_TABLES.items():
+        source = parent or table
+        if source not in sources:
+            continue
+        for event, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            if parent:
+                portfolio_expr = f"(SELECT portfolio_id FROM {parent} WHERE id = {ref}.import_id)"
+                source_id = f"{ref}.import_id"
+            else:
+                portfolio_expr = f"{ref}.portfolio_id"
+                source_id = f"{ref}.id"
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_{suffix}
+                AFTER {event} ON {table}
+                WHEN {portfolio_expr} IS NOT NULL
+                BEGIN
+                    INSERT INTO {queue_table} (portfolio_id, source, source_id)
+                    VALUES ({portfolio_expr}, '{source}', {source_id});
+                END
+                """
+            )
+        if not parent:
+            conn.execute(
+                f"""
+                INSERT INTO {queue_table} (portfolio_id, source, source_id)
+                SELECT portfolio_id, '{table}', id FROM {table}
+                """
+            )
 
-def _set_profile_age(email: str, age: int | None) -> None:
-    with _db_connection() as conn:
-        conn.execute(
-            """
-            INSERT OR REPLACE INTO user_profiles (email, age, updated_at)
-            VALUES (?, ?, ?)
-            """,
-            (email, age, datetime.utcnow().isoformat()),
-        )
 
+def _create_history_dirty_triggers(conn: sqlite3.Connection) -> None:
+    _create_dirty_queue_triggers(
+        conn, "portfolio_history_dirty", set(HISTORY_SOURCE_QUERIES), "history"
+    )
 
-def _get_debt(email: str, debt_id: int) -> dict | None:
-    with _db_connection() as conn:
-        row = conn.execute(
-            """
-            SELECT id, name, original_amount, current_balance, monthly_payment, created_at, updated_at
-            FROM debts
-            WHERE id = ? AND owner_email = ?
-            """,
-            (debt_id, email),
-        ).fetchone()
-    if not row:
-        return None
-    age = _get_profile_age(email)
-    original_amount = float(row["original_amount"] or 0)
-    current_balance = float(row["current_balance"] or 0)
-    monthly_payment = float(row["monthly_payment"] or 0)
-    percent_paid = 0.0
-    if original_amount > 0:
-        percent_paid = (original_amount - current_balance) / original_amount * 100
-    months_remaining = None
-    if monthly_payment > 0:
-        months_remaining = int((current_balance + monthly_payment - 1) // monthly_payment)
-    payoff_age = None
-    if age is not None and months_remaining is not None:
-        payoff_age = age + months_remaining / 12
-    return {
-        "id": row["id"],
-        "name": row["name"],
-        "original_amount": original_amount,
-        "current_balance": current_balance,
-        "monthly_payment": monthly_payment,
-        "percent_paid": percent_paid,
-        "months_remaining": months_remaining,
-        "payoff_age": payoff_age,
-        "created_at": row["created_at"],
-        "updated_at": row["updated_at"],
-    }
 
+def _create_cash_flow_dirty_triggers(conn: sqlite3.Connection) -> None:
+    _create_dirty_queue_triggers(
+        conn,
+        "portfolio_cash_flow_dirty",
+        set(CASH_FLOW_SNAPSHOT_QUERIES) | set(CASH_FLOW_ROW_QUERIES),
+        "cash_flows",
+    )
 
-def _list_debts(email: str) -> list[dict]:
-    with _db_connection() as conn:
-        rows = conn.execute(
+
+def _to_datetime(value: str | None) -> datetime:
+    if not value:
+        return datetime.min
+    if isinstance(value, datetime):
+        return value
+    text = str(value).strip()
+    if not text:
+        return datetime.min
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    match = re.search(r"(\d{2})-(\d{2})-(\d{4})", text)
+    if match:
+        day, month, year = (int(part) for part in match.groups())
+        try:
+            return datetime(year, month, day)
+        except ValueError:
+            return datetime.min
+    return datetime.min
+
+
+def _date_key(value: str | None) -> str | None:
+    if not value:
+        return None
+    timestamp = _to_datetime(value)
+    if timestamp == datetime.min:
+        return None
+    return timestamp.date().isoformat()
+
+
+def _sync_portfolio_history(conn: sqlite3.Connection, portfolio_id: int) -> None:
+    """Patch portfolio_history_entries for the imports changed since the last sync.
+
+    Triggers on the import tables queue the touched (source, id) pairs in
+    portfolio_history_dirty; only those imports are recomputed. Any change
+    that is not a pure append past the latest date bumps the portfolio's
+    history revision, which invalidates since= deltas held by clients.
+    """
+    dirty = conn.execute(
+        """
+        SELECT id, source, source_id
+        FROM portfolio_history_dirty
+        WHERE portfolio_id = ?
+        ORDER BY id
+        """,
+        (portfolio_id,),
+    ).fetchall()
+    if not dirty:
+        return
+    previous_latest = _max_history_date(conn, portfolio_id)
+    touched: set[str] = set()
+    with _db_connection(conn):
+        for source, source_id in dict.fromkeys((row["source"], row["source_id"]) for row in dirty):
+            touched.update(
+                row["date_key"]
+                for row in conn.execute(
+                    """
+                    SELECT DISTINCT date_key
+                    FROM portfolio_history_entries
+                    WHERE portfolio_id = ? AND source = ? AND source_id = ?
+                    """,
+                    (portfolio_id, source, source_id),
+                )
+            )
+            if source == "save_ngrow_imports":
+                # The first or last Save N Grow import hides or reveals every
+                # manual Save N Grow entry (see _HISTORY_ENTRIES_FILTER).
+                touched.update(
+                    row["date_key"]
+                    for row in conn.execute(
+                        """
+                        SELECT DISTINCT date_key
+                        FROM portfolio_history_entries
+                        WHERE portfolio_id = ? AND source = 'save_ngrow_entries'
+                        """,
+                        (portfolio_id,),
+                    )
+                )
+            conn.execute(
+                """
+                DELETE FROM portfolio_history_entries
+                WHERE portfolio_id = ? AND source = ? AND source_id = ?
+                """,
+                (portfolio_id, source, source_id),
+            )
+            query = HISTORY_SOURCE_QUERIES.get(source)
+            if not query:
+                continue
+            entries = []
+            for row in conn.execute(query, (source_id,)).fetchall():
+                date_key = _date_key(row["date_value"])
+                if not date_key or not row["category"]:
+                    continue
+                entries.append(
+                    (
+                        portfolio_id,
+                        source,
+                        source_id,
+                        date_key,
+                        row["category"],
+                        float(row["total"] or 0),
+                        float(row["invested"] or 0),
+                    )
+                )
+            conn.executemany(
+                """
+                INSERT INTO portfolio_history_entries (
+                    portfolio_id, source, source_id, date_key, category, total, invested
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                entries,
+            )
+            touched.update(entry[3] for entry in entries)
+        if previous_latest and touched and min(touched) <= previous_latest:
+            if (
+                min(touched) < previous_latest
+                or _max_history_date(conn, portfolio_id) != previous_latest
+            ):
+                conn.execute(
+                    """
+                    INSERT INTO portfolio_history_revisions (portfolio_id, revision)
+                    VALUES (?, 1)
+                    ON CONFLICT(portfolio_id) DO UPDATE SET revision = revision + 1
+                    """,
+                    (portfolio_id,),
+                )
+        conn.execute(
+            "DELETE FROM portfolio_history_dirty WHERE portfolio_id = ? AND id <= ?",
+            (portfolio_id, dirty[-1]["id"]),
+        )
+
+
+
+
+# Snapshot sources contribute their invested deltas between consecutive imports,
+# per (account, category) series, as (source_id, date_value, account, category,
+# invested) rows for one portfolio.
+CASH_FLOW_SNAPSHOT_QUERIES: dict[str, str] = {
+    "santander_imports": """
+        SELECT imp.id AS source_id, imp.imported_at AS date_value, '' AS account,
+               items.category AS category, SUM(items.invested) AS invested
+        FROM santander_imports AS imp
+        JOIN santander_items AS items ON items.import_id = imp.id
+        WHERE imp.portfolio_id = ?
+        GROUP BY imp.id, items.category
+    """,
+    "trade_republic_entries": """
+        SELECT id AS source_id, COALESCE(snapshot_date, created_at) AS date_value,
+               '' AS account, COALESCE(NULLIF(category, ''), 'Cash') AS category,
+               invested
+        FROM trade_republic_entries
+        WHERE portfolio_id = ?
+    """,
+    "save_ngrow_imports": """
+        SELECT imp.id AS source_id, COALESCE(imp.snapshot_date, imp.created_at) AS date_value,
+               '' AS account, items.category AS category, SUM(items.invested) AS invested
+        FROM save_ngrow_imports AS imp
+        JOIN save_ngrow_items AS items ON items.import_id = imp.id
+        WHERE imp.portfolio_id = ?
+        GROUP BY imp.id, items.category
+    """,
+    "save_ngrow_entries": """
+        SELECT id AS source_id, COALESCE(snapshot_date, created_at) AS date_value,
+               '' AS account, 'Retirement Plans' AS category, invested
+        FROM save_ngrow_entries
+        WHERE portfolio_id = ?
+    """,
+    "aforronet_imports": """
+        SELECT id AS source_id, COALESCE(snapshot_date, created_at) AS date_value,
+               '' AS account, COALESCE(NULLIF(category, ''), 'Emergency Funds') AS category,
+               invested_total AS invested
+        FROM aforronet_imports
+        WHERE portfolio_id = ?
+    """,
+    "bancoinvest_imports": """
+        SELECT imp.id AS source_id, COALESCE(imp.snapshot_date, imp.imported_at) AS date_value,
+               '' AS account,
+               COALESCE(NULLIF(items.category, ''), 'Retirement Plans') AS category,
+               SUM(items.invested) AS invested
+        FROM bancoinvest_imports AS imp
+        JOIN bancoinvest_items AS items ON items.import_id = imp.id
+        WHERE imp.portfolio_id = ?
+        GROUP BY imp.id, COALESCE(NULLIF(items.category, ''), 'Retirement Plans')
+    """,
+    "xtb_imports": """
+        SELECT id AS source_id, imported_at AS date_value,
+               COALESCE(account_type, '') AS account,
+               COALESCE(NULLIF(category, ''), 'Stocks') AS category, invested
+        FROM xtb_imports
+        WHERE portfolio_id = ?
+    """,
+}
+
+# Transaction-level sources map one row to at most one external flow.
+CASH_FLOW_ROW_QUERIES: dict[str, str] = {
+    "holding_transactions": """
+        SELECT trade_date AS date_value, category, operation, shares, price, fee
+        FROM holding_transactions
+        WHERE id = ?
+    """,
+    "holdings_operations": """
+        SELECT trade_date AS date_value, 'Stocks' AS category, operation_type, amount
+        FROM holdings_operations
+        WHERE id = ?
+    """,
+}
+
+
+def _snapshot_cash_flows(rows: list[sqlite3.Row]) -> list[tuple[int, str, str, float]]:
+    """Turn a source's snapshot series into (source_id, date, category, amount) flows.
+
+    An increase in invested between consecutive snapshots of the same
+    (account, category) is a contribution (negative flow); a decrease is a withdrawal.
+    """
+    ordered = sorted(
+        (
+            (_to_datetime(row["date_value"]), row)
+            for row in rows
+            if row["invested"] is not None and row["category"]
+        ),
+        key=lambda item: (item[0], item[1]["source_id"]),
+    )
+    previous: dict[tuple[str, str], float] = {}
+    flows = []
+    for timestamp, row in ordered:
+        if timestamp == datetime.min:
+            continue
+        key = (row["account"], row["category"])
+        invested = float(row["invested"])
+        delta = invested - previous.get(key, 0.0)
+        previous[key] = invested
+        if abs(delta) >= 0.005:
+            flows.append((row["source_id"], timestamp.date().isoformat(), row["category"], -delta))
+    return flows
+
+
+def _row_cash_flow(source: str, row: sqlite3.Row) -> tuple[str, str, float] | None:
+    flow_date = _date_key(row["date_value"])
+    if not flow_date or not row["category"]:
+        return None
+    if source == "holding_transactions":
+        amount = float(row["shares"] or 0) * float(row["price"] or 0)
+        fee = float(row["fee"] or 0)
+        operation = (row["operation"] or "").strip().lower()
+        if operation == "buy":
+            return flow_date, row["category"], -(amount + fee)
+        if operation == "sell":
+            return flow_date, row["category"], amount - fee
+        return None
+    # XTB cash operations: only deposits and withdrawals cross the portfolio boundary.
+    operation = _normalize_text(row["operation_type"] or "")
+    if row["amount"] is None or not any(
+        marker in operation for marker in ("deposit", "withdraw", "levantamento")
+    ):
+        return None
+    return flow_date, row["category"], -float(row["amount"])
+
+
+def _sync_portfolio_cash_flows(conn: sqlite3.Connection, portfolio_id: int) -> None:
+    """Patch the cash-flow ledger for the rows queued since the last sync.
+
+    Snapshot sources are rebuilt per source (deltas depend on the neighbouring
+    snapshots); transaction sources are patched row by row.
+    """
+    dirty = conn.execute(
+        """
+        SELECT id, source, source_id
+        FROM portfolio_cash_flow_dirty
+        WHERE portfolio_id = ?
+        ORDER BY id
+        """,
+        (portfolio_id,),
+    ).fetchall()
+    if not dirty:
+        return
+    snapshot_sources = {row["source"] for row in dirty if row["source"] in CASH_FLOW_SNAPSHOT_QUERIES}
+    row_sources = dict.fromkeys(
+        (row["source"], row["source_id"]) for row in dirty if row["source"] in CASH_FLOW_ROW_QUERIES
+    )
+    entries = []
+    with _db_connection(conn):
+        for source in snapshot_sources:
+            conn.execute(
+                "DELETE FROM portfolio_cash_flows WHERE portfolio_id = ? AND source = ?",
+                (portfolio_id, source),
+            )
+            rows = conn.execute(CASH_FLOW_SNAPSHOT_QUERIES[source], (portfolio_id,)).fetchall()
+            for source_id, flow_date, category, amount in _snapshot_cash_flows(rows):
+                entries.append(
+                    (
+                        portfolio_id,
+                        source,
+                        source_id,
+                        flow_date,
+                        category,
+                        _normalize_text(category),
+                        amount,
+                    )
+                )
+        for source, source_id in row_sources:
+            conn.execute(
+                """
+                DELETE FROM portfolio_cash_flows
+                WHERE portfolio_id = ? AND source = ? AND source_id = ?
+                """,
+                (portfolio_id, source, source_id),
+            )
+            row = conn.execute(CASH_FLOW_ROW_QUERIES[source], (source_id,)).fetchone()
+            flow = _row_cash_flow(source, row) if row else None
+            if flow:
+                flow_date, category, amount = flow
+                entries.append(
+                    (
+                        portfolio_id,
+                        source,
+                        source_id,
+                        flow_date,
+                        category,
+                        _normalize_text(category),
+                        amount,
+                    )
+                )
+        conn.executemany(
+            """
+            INSERT INTO portfolio_cash_flows (
+                portfolio_id, source, source_id, flow_date, category, category_key, amount
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            entries,
+        )
+        conn.execute(
+            "DELETE FROM portfolio_cash_flow_dirty WHERE portfolio_id = ? AND id <= ?",
+            (portfolio_id, dirty[-1]["id"]),
+        )
+
+
+def _sync_dirty_portfolios(conn: sqlite3.Connection) -> None:
+    """Drain the history, cash-flow and latest-totals queues of every portfolio touched."""
+    for row in conn.execute(
+        "SELECT DISTINCT portfolio_id FROM portfolio_history_dirty"
+    ).fetchall():
+        _sync_portfolio_history(conn, row["portfolio_id"])
+    for row in conn.execute(
+        "SELECT DISTINCT portfolio_id FROM portfolio_cash_flow_dirty"
+    ).fetchall():
+        _sync_portfolio_cash_flows(conn, row["portfolio_id"])
+    dirty_totals = conn.execute("SELECT portfolio_id FROM portfolio_totals_dirty").fetchall()
+    for row in dirty_totals:
+        _sync_latest_totals(conn, row["portfolio_id"])
+    if dirty_totals:
+        conn.execute("DELETE FROM portfolio_totals_dirty")
+
+
+def _create_portfolio_version_triggers(conn: sqlite3.Connection) -> None:
+    for table, parent in PORTFOLIO_SOURCE_TABLES.items():
+        for event, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            if parent:
+                portfolio_expr = f"(SELECT portfolio_id FROM {parent} WHERE id = {ref}.import_id)"
+            else:
+                portfolio_expr = f"{ref}.portfolio_id"
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                WHEN {portfolio_expr} IS NOT NULL
+                BEGIN
+                    INSERT INTO portfolio_data_versions (portfolio_id, version)
+                    VALUES ({portfolio_expr}, 1)
+                    ON CONFLICT(portfolio_id) DO UPDATE SET version = version + 1;
+                END
+                """
+            )
+
+
+# Raw snapshot date expression of each import table; mirrored by the virtual
+# snapshot_at column so monthly reductions can run entirely in SQL.
+SNAPSHOT_DATE_COLUMNS: dict[str, str] = {
+    "santander_imports": "imported_at",
+    "trade_republic_entries": "COALESCE(snapshot_date, created_at)",
+    "save_ngrow_imports": "COALESCE(snapshot_date, created_at)",
+    "save_ngrow_entries": "COALESCE(snapshot_date, created_at)",
+    "aforronet_imports": "COALESCE(snapshot_date, created_at)",
+    "bancoinvest_imports": "COALESCE(snapshot_date, imported_at)",
+    "xtb_imports": "imported_at",
+}
+
+
+def _normalized_timestamp_sql(expr: str) -> str:
+    """SQL twin of _to_datetime: ISO text or dd-mm-yyyy to 'YYYY-MM-DD HH:MM:SS', else NULL."""
+    value = f"trim({expr})"
+    return f"""
+        CASE
+            WHEN {value} GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+                THEN replace({value}, 'T', ' ')
+            WHEN {value} GLOB '[0-9][0-9]-[0-9][0-9]-[0-9][0-9][0-9][0-9]*'
+                THEN substr({value}, 7, 4) || '-' || substr({value}, 4, 2) || '-' || substr({value}, 1, 2)
+        END
+    """
+
+
+def _add_snapshot_at_columns(conn: sqlite3.Connection) -> None:
+    for table, expr in SNAPSHOT_DATE_COLUMNS.items():
+        conn.execute(
+            f"""
+            ALTER TABLE {table} ADD COLUMN snapshot_at TEXT
+            GENERATED ALWAYS AS ({_normalized_timestamp_sql(expr)}) VIRTUAL
+            """
+        )
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_snapshot_at "
+            f"ON {table}(portfolio_id, snapshot_at)"
+        )
+
+
+def _normalize_text(value: str | None) -> str:
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        value = str(value)
+    normalized = unicodedata.normalize("NFKD", value)
+    cleaned = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return cleaned.strip().lower()
+
+
+def _normalize_banking_description(value: str | None) -> str | None:
+    if not value:
+        return None
+    return _normalize_text(value)
+
+
+def _add_banking_monthly_spend(
+    conn: sqlite3.Connection,
+    transactions: Iterable[tuple[int, str, str, float]],
+    sign: int = 1,
+) -> None:
+    """Fold (portfolio, date, category, amount) rows into the monthly rollup.
+
+    A sign of -1 takes previously added rows back out.
+    """
+    totals: dict[tuple[int, str, str], list] = {}
+    for portfolio_id, tx_date, category, amount in transactions:
+        key = (portfolio_id, str(tx_date)[:7], _normalize_text(category))
+        entry = totals.setdefault(key, [category, 0.0, 0.0, 0])
+        amount = float(amount or 0)
+        if amount < 0:
+            entry[1] -= amount * sign
+        else:
+            entry[2] += amount * sign
+        entry[3] += sign
+    if not totals:
+        return
+    conn.executemany(
+        """
+        INSERT INTO banking_monthly_spend (
+            portfolio_id, month, category_key, category, spent, income, tx_count
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(portfolio_id, month, category_key) DO UPDATE SET
+            spent = spent + excluded.spent,
+            income = income + excluded.income,
+            tx_count = tx_count + excluded.tx_count
+        """,
+        [(*key, *entry) for key, entry in totals.items()],
+    )
+    if sign < 0:
+        conn.executemany(
+            """
+            DELETE FROM banking_monthly_spend
+            WHERE portfolio_id = ? AND month = ? AND category_key = ? AND tx_count <= 0
+            """,
+            list(totals),
+        )
+
+
+def _backfill_banking_monthly_spend(conn: sqlite3.Connection) -> None:
+    budgets = conn.execute("SELECT id, category FROM banking_budgets").fetchall()
+    conn.executemany(
+        "UPDATE banking_budgets SET category_key = ? WHERE id = ?",
+        [(_normalize_text(row["category"]), row["id"]) for row in budgets],
+    )
+    _add_banking_monthly_spend(
+        conn,
+        conn.execute(
+            "SELECT portfolio_id, tx_date, category, amount FROM banking_transactions"
+        ),
+    )
+
+
+def _backfill_banking_transaction_keys(conn: sqlite3.Connection) -> None:
+    rows = conn.execute(
+        "SELECT id, category, subcategory FROM banking_transactions"
+    ).fetchall()
+    conn.executemany(
+        "UPDATE banking_transactions SET category_key = ?, subcategory_key = ? WHERE id = ?",
+        [
+            (_normalize_text(row["category"]), _normalize_text(row["subcategory"]), row["id"])
+            for row in rows
+        ],
+    )
+
+
+def _backfill_cash_flow_category_keys(conn: sqlite3.Connection) -> None:
+    rows = conn.execute("SELECT id, category FROM portfolio_cash_flows").fetchall()
+    conn.executemany(
+        "UPDATE portfolio_cash_flows SET category_key = ? WHERE id = ?",
+        [(_normalize_text(row["category"]), row["id"]) for row in rows],
+    )
+
+
+def _backfill_banking_description_keys(conn: sqlite3.Connection) -> None:
+    rows = conn.execute("SELECT id, description FROM banking_transactions").fetchall()
+    conn.executemany(
+        "UPDATE banking_transactions SET description_key = ? WHERE id = ?",
+        [(_normalize_banking_description(row["description"]), row["id"]) for row in rows],
+    )
+
+
+def _banking_fingerprints(
+    rows: Iterable[tuple[str, float, str | None, float | None]], institution: str
+) -> list[str]:
+    """Fingerprint (date, amount, description, balance) rows of one statement.
+
+    Identical rows within the statement get an occurrence number, so two real
+    coffees on the same day stay apart while the same rows from an
+    overlapping export collide.
+    """
+    seen: dict[str, int] = {}
+    fingerprints = []
+    for tx_date, amount, description, balance in rows:
+        key = "|".join(
+            (
+                str(tx_date)[:10],
+                f"{float(amount or 0):.2f}",
+                _normalize_banking_description(description) or "",
+                f"{float(balance):.2f}" if balance is not None else "",
+                _normalize_text(institution),
+            )
+        )
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        payload = f"{key}|{occurrence}"
+        fingerprints.append(hashlib.sha1(payload.encode("utf-8")).hexdigest())
+    return fingerprints
+
+
+def _backfill_banking_fingerprints(conn: sqlite3.Connection) -> None:
+    # Duplicates already stored by earlier overlapping imports keep a NULL
+    # fingerprint so the unique index can be built over the first copy.
+    rows = conn.execute(
+        """
+        SELECT id, portfolio_id, import_id, institution, tx_date, amount, description, balance
+        FROM banking_transactions
+        ORDER BY import_id, id
+        """
+    ).fetchall()
+    known: set[tuple[int, str]] = set()
+    updates = []
+    for (import_id, institution), group in groupby(
+        rows, key=lambda row: (row["import_id"], row["institution"])
+    ):
+        group = list(group)
+        fingerprints = _banking_fingerprints(
+            (
+                (row["tx_date"], row["amount"], row["description"], row["balance"])
+                for row in group
+            ),
+            institution,
+        )
+        for row, fingerprint in zip(group, fingerprints):
+            key = (row["portfolio_id"], fingerprint)
+            if key in known:
+                continue
+            known.add(key)
+            updates.append((fingerprint, row["id"]))
+    conn.executemany(
+        "UPDATE banking_transactions SET fingerprint = ? WHERE id = ?", updates
+    )
+
+
+def _pack_banking_cells(cells: list | None) -> bytes | None:
+    """Raw statement cells as a JSON array, zlib-compressed when that is smaller."""
+    if not cells:
+        return None
+    packed = json.dumps(cells, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    compressed = zlib.compress(packed, 9)
+    return compressed if len(compressed) < len(packed) else packed
+
+
+def _unpack_banking_cells(value: bytes | None) -> list:
+    if not value:
+        return []
+    # Plain arrays start with "["; anything else is a zlib stream.
+    if value[:1] != b"[":
+        value = zlib.decompress(value)
+    return json.loads(value)
+
+
+def _compact_banking_raw_json(conn: sqlite3.Connection) -> None:
+    # The header moves to the import and each row keeps only its cells.
+    import_ids = [
+        row["import_id"]
+        for row in conn.execute(
+            "SELECT DISTINCT import_id FROM banking_transactions WHERE raw_json IS NOT NULL"
+        ).fetchall()
+    ]
+    for import_id in import_ids:
+        rows = conn.execute(
+            """
+            SELECT id, raw_json FROM banking_transactions
+            WHERE import_id = ? AND raw_json IS NOT NULL
+            ORDER BY id
+            """,
+            (import_id,),
+        ).fetchall()
+        raws = [(row["id"], json.loads(row["raw_json"]) or {}) for row in rows]
+        columns = next((list(raw) for _, raw in raws if raw), [])
+        conn.execute(
+            "UPDATE banking_imports SET columns_json = ? WHERE id = ?",
+            (json.dumps(columns) if columns else None, import_id),
+        )
+        conn.executemany(
+            "UPDATE banking_transactions SET raw_cells = ?, raw_json = NULL WHERE id = ?",
+            [
+                (_pack_banking_cells([raw.get(column, "") for column in columns]), tx_id)
+                for tx_id, raw in raws
+            ],
+        )
+
+
+def _create_price_history_triggers(conn: sqlite3.Connection) -> None:
+    """Record every latest-price write as that day's close."""
+    for event in ("INSERT", "UPDATE"):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_holdings_prices_{event.lower()}_history
+            AFTER {event} ON holdings_prices
+            WHEN NEW.price > 0
+            BEGIN
+                INSERT INTO price_history (ticker, price_date, close, currency, source)
+                VALUES (NEW.ticker, substr(NEW.updated_at, 1, 10), NEW.price, NEW.currency, 'latest')
+                ON CONFLICT(ticker, price_date) DO UPDATE SET
+                    close = excluded.close,
+                    currency = excluded.currency,
+                    source = excluded.source;
+            END
+            """
+        )
+
+
+def _create_market_data_version_triggers(conn: sqlite3.Connection) -> None:
+    """Bump market_data_version on every price or FX rate write."""
+    for table in ("price_history", "fx_rates"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO market_data_version (id, version) VALUES (1, 1)
+                    ON CONFLICT(id) DO UPDATE SET version = version + 1;
+                END
+                """
+            )
+
+
+def _create_totals_dirty_triggers(conn: sqlite3.Connection) -> None:
+    """Queue a latest-totals rebuild when a portfolio's data or category settings change."""
+    for table, events in (
+        ("portfolio_data_versions", (("INSERT", "NEW"), ("UPDATE", "NEW"))),
+        (
+            "portfolio_category_settings",
+            (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")),
+        ),
+    ):
+        for event, ref in events:
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_totals_dirty
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO portfolio_totals_dirty (portfolio_id)
+                    VALUES ({ref}.portfolio_id)
+                    ON CONFLICT(portfolio_id) DO NOTHING;
+                END
+                """
+            )
+
+
+def _schema_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(version) AS version FROM schema_migrations").fetchone()
+    return int(row["version"] or 0) if row else 0
+
+
+def _apply_schema_migrations(conn: sqlite3.Connection) -> int:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        """
+    )
+    applied = {
+        row["version"] for row in conn.execute("SELECT version FROM schema_migrations")
+    }
+    pending = [entry for entry in SCHEMA_MIGRATIONS if entry[0] not in applied]
+    for version, name, steps in sorted(pending, key=lambda entry: entry[0]):
+        with _db_connection(conn):
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, datetime.utcnow().isoformat()),
+            )
+        logger.info("Applied schema migration %s (%s)", version, name)
+    version = _schema_version(conn)
+    conn.execute(f"PRAGMA user_version = {version}")
+    if pending:
+        conn.execute("PRAGMA optimize")
+    return version
+
+
+def _get_user(email: str) -> sqlite3.Row | None:
+    with _db_connection() as conn:
+        return conn.execute(
+            "SELECT email, salt, password_hash, verified, created_at FROM users WHERE email = ?",
+            (email,),
+        ).fetchone()
+
+
+def _save_user(email: str, salt: str, password_hash: str, verified: bool, created_at: str) -> None:
+    updated_at = datetime.utcnow().isoformat()
+    with _db_connection() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO users (email, salt, password_hash, verified, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (email, salt, password_hash, 1 if verified else 0, created_at, updated_at),
+        )
+
+
+def _set_verified(email: str, verified: bool) -> None:
+    with _db_connection() as conn:
+        conn.execute(
+            "UPDATE users SET verified = ?, updated_at = ? WHERE email = ?",
+            (1 if verified else 0, datetime.utcnow().isoformat(), email),
+        )
+
+
+def _set_password(email: str, salt: str, password_hash: str) -> None:
+    with _db_connection() as conn:
+        conn.execute(
+            "UPDATE users SET salt = ?, password_hash = ?, updated_at = ? WHERE email = ?",
+            (salt, password_hash, datetime.utcnow().isoformat(), email),
+                )
+
+
+def _get_profile_age(email: str) -> int | None:
+    with _db_connection() as conn:
+        row = conn.execute(
+            "SELECT age FROM user_profiles WHERE email = ?",
+            (email,),
+        ).fetchone()
+    return row["age"] if row and row["age"] is not None else None
+
+
+def _set_profile_age(email: str, age: int | None) -> None:
+    with _db_connection() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO user_profiles (email, age, updated_at)
+            VALUES (?, ?, ?)
+            """,
+            (email, age, datetime.utcnow().isoformat()),
+        )
+
+
+def _get_debt(email: str, debt_id: int) -> dict | None:
+    with _db_connection() as conn:
+        row = conn.execute(
+            """
+            SELECT id, name, original_amount, current_balance, monthly_payment, created_at, updated_at
+            FROM debts
+            WHERE id = ? AND owner_email = ?
+            """,
+            (debt_id, email),
+        ).fetchone()
+    if not row:
+        return None
+    age = _get_profile_age(email)
+    original_amount = float(row["original_amount"] or 0)
+    current_balance = float(row["current_balance"] or 0)
+    monthly_payment = float(row["monthly_payment"] or 0)
+    percent_paid = 0.0
+    if original_amount > 0:
+        percent_paid = (original_amount - current_balance) / original_amount * 100
+    months_remaining = None
+    if monthly_payment > 0:
+        months_remaining = int((current_balance + monthly_payment - 1) // monthly_payment)
+    payoff_age = None
+    if age is not None and months_remaining is not None:
+        payoff_age = age + months_remaining / 12
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "original_amount": original_amount,
+        "current_balance": current_balance,
+        "monthly_payment": monthly_payment,
+        "percent_paid": percent_paid,
+        "months_remaining": months_remaining,
+        "payoff_age": payoff_age,
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def _list_debts(email: str) -> list[dict]:
+    with _db_connection() as conn:
+        rows = conn.execute(
             """
             SELECT id, name, original_amount, current_balance, monthly_payment, created_at, updated_at
             FROM debts
@@ -1274,6 +2729,22 @@ def _parse_iso_date(value: str) -> date:
         raise HTTPException(status_code=400, detail="Invalid date format.") from exc
 
 
+def _parse_month(value: str) -> str:
+    try:
+        return datetime.strptime(value, "%Y-%m").strftime("%Y-%m")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid month format.") from exc
+
+
+def _months_between(start: str, end: str) -> list[str]:
+    year, month = int(start[:4]), int(start[5:7])
+    months: list[str] = []
+    while f"{year:04d}-{month:02d}" <= end:
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
 def _ensure_default_goal(email: str) -> None:
     with _db_connection() as conn:
         _ensure_goal_input_columns(conn)
@@ -1883,41 +3354,106 @@ def _goal_years_elapsed(start_date: date, now_date: date) -> float:
     return (now_date - start_date).days / 365.25
 
 
-def _xirr(flows: list[tuple[date, float]], guess: float = 0.1) -> float | None:
-    if not flows:
-        return None
-    flows = sorted(flows, key=lambda item: item[0])
-    start_date = flows[0][0]
-    if all(amount >= 0 for _, amount in flows) or all(amount <= 0 for _, amount in flows):
-        return None
+# XIRR is solved in log space, x = log(1 + rate), over rates in (-99.99%, +100000%).
+XIRR_MIN_LOG_RATE = math.log(1e-4)
+XIRR_MAX_LOG_RATE = math.log(1e3)
+XIRR_NEWTON_ITERATIONS = 50
+XIRR_BISECTION_ITERATIONS = 80
+XIRR_TOLERANCE = 1e-9
+XIRR_BRACKET_GRID = np.linspace(XIRR_MIN_LOG_RATE, XIRR_MAX_LOG_RATE, 400)
 
-    def npv(rate: float) -> float:
-        total = 0.0
-        for dt_value, amount in flows:
-            days = (dt_value - start_date).days / 365.25
-            total += amount / ((1 + rate) ** days)
-        return total
-
-    def d_npv(rate: float) -> float:
-        total = 0.0
-        for dt_value, amount in flows:
-            days = (dt_value - start_date).days / 365.25
-            total -= (days * amount) / ((1 + rate) ** (days + 1))
-        return total
-
-    rate = guess
-    for _ in range(50):
-        value = npv(rate)
-        deriv = d_npv(rate)
-        if abs(value) < 1e-6:
-            return rate
-        if deriv == 0:
-            break
-        rate_next = rate - value / deriv
-        if rate_next <= -0.9999 or math.isnan(rate_next) or math.isinf(rate_next):
-            break
-        rate = rate_next
-    return None
+
+def _xirr_batch(
+    series: list[list[tuple[date, float]]], guess: float = 0.1
+) -> list[float | None]:
+    """Solve XIRR for many cash-flow series at once.
+
+    Newton runs vectorized over every series; the ones that diverge fall back to a
+    sign-change bracket on a rate grid narrowed by bisection. None means no root.
+    """
+    results: list[float | None] = [None] * len(series)
+    valid = [
+        index
+        for index, flows in enumerate(series)
+        if flows
+        and any(amount > 0 for _, amount in flows)
+        and any(amount < 0 for _, amount in flows)
+    ]
+    if not valid:
+        return results
+
+    width = max(len(series[index]) for index in valid)
+    times = np.zeros((len(valid), width))
+    amounts = np.zeros((len(valid), width))
+    for row, index in enumerate(valid):
+        flows = series[index]
+        start_date = min(dt_value for dt_value, _ in flows)
+        times[row, : len(flows)] = [(dt_value - start_date).days / 365.25 for dt_value, _ in flows]
+        amounts[row, : len(flows)] = [amount for _, amount in flows]
+    tolerance = XIRR_TOLERANCE * np.maximum(np.abs(amounts).sum(axis=1), 1.0)
+
+    solved = np.zeros(len(valid), dtype=bool)
+    active = np.ones(len(valid), dtype=bool)
+    x = np.full(len(valid), math.log1p(guess))
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        for _ in range(XIRR_NEWTON_ITERATIONS):
+            discounted = amounts * np.exp(-times * x[:, None])
+            value = discounted.sum(axis=1)
+            deriv = -(times * discounted).sum(axis=1)
+            solved |= active & (np.abs(value) <= tolerance)
+            active &= ~solved
+            if not active.any():
+                break
+            x_next = x - value / deriv
+            stepped = (
+                np.isfinite(x_next)
+                & (x_next > XIRR_MIN_LOG_RATE)
+                & (x_next < XIRR_MAX_LOG_RATE)
+            )
+            active &= stepped
+            x = np.where(active, x_next, x)
+
+        fallback = np.flatnonzero(~solved)
+        if fallback.size:
+            low = np.full(fallback.size, np.nan)
+            high = np.full(fallback.size, np.nan)
+            target = math.log1p(guess)
+            for position, row in enumerate(fallback):
+                grid_values = (
+                    amounts[row] * np.exp(-np.outer(XIRR_BRACKET_GRID, times[row]))
+                ).sum(axis=1)
+                signs = np.sign(grid_values)
+                crossings = np.flatnonzero(signs[:-1] * signs[1:] <= 0)
+                if not crossings.size:
+                    continue
+                midpoints = (XIRR_BRACKET_GRID[crossings] + XIRR_BRACKET_GRID[crossings + 1]) / 2
+                chosen = crossings[np.argmin(np.abs(midpoints - target))]
+                low[position] = XIRR_BRACKET_GRID[chosen]
+                high[position] = XIRR_BRACKET_GRID[chosen + 1]
+            bracketed = np.isfinite(low)
+            rows = fallback[bracketed]
+            low, high = low[bracketed], high[bracketed]
+            if rows.size:
+                low_value = (amounts[rows] * np.exp(-times[rows] * low[:, None])).sum(axis=1)
+                for _ in range(XIRR_BISECTION_ITERATIONS):
+                    mid = (low + high) / 2
+                    mid_value = (amounts[rows] * np.exp(-times[rows] * mid[:, None])).sum(axis=1)
+                    same_side = np.sign(mid_value) == np.sign(low_value)
+                    low = np.where(same_side, mid, low)
+                    low_value = np.where(same_side, mid_value, low_value)
+                    high = np.where(same_side, high, mid)
+                x[rows] = (low + high) / 2
+                solved[rows] = True
+
+    rates = np.expm1(x)
+    for row, index in enumerate(valid):
+        if solved[row] and math.isfinite(rates[row]):
+            results[index] = float(rates[row])
+    return results
+
+
+def _xirr(flows: list[tuple[date, float]], guess: float = 0.1) -> float | None:
+    return _xirr_batch([flows], guess)[0]
 
 
 def _nper(rate: float, payment: float, present: float, future: float) -> float | None:
@@ -2356,8 +3892,6 @@ def _goal_summary(
     }
 
 
-_init_db()
-
 
 def _store_code(table: str, email: str, code: str, expires_at: str) -> None:
     with _db_connection() as conn:
@@ -2401,15 +3935,68 @@ def _get_session(token: str) -> sqlite3.Row | None:
 
 
 def _delete_session(token: str) -> None:
+    _invalidate_cached_session(token)
     with _db_connection() as conn:
         conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
 
 
 def _delete_sessions_for_email(email: str) -> None:
+    _invalidate_cached_sessions_for_email(email)
     with _db_connection() as conn:
         conn.execute("DELETE FROM sessions WHERE email = ?", (email,))
 
 
+# Validated sessions keyed by token, with the monotonic time the entry stops
+# being trusted. Entries never outlive the session's own expires_at; other API
+# processes see a logout at most SESSION_CACHE_TTL_SECONDS late.
+_session_cache: dict[str, tuple[float, sqlite3.Row]] = {}
+_session_cache_lock = threading.Lock()
+
+
+def _get_cached_session(token: str) -> sqlite3.Row | None:
+    with _session_cache_lock:
+        entry = _session_cache.get(token)
+        if not entry:
+            return None
+        if entry[0] <= time.monotonic():
+            _session_cache.pop(token, None)
+            return None
+        return entry[1]
+
+
+def _cache_session(token: str, session: sqlite3.Row) -> None:
+    if SESSION_CACHE_TTL_SECONDS <= 0:
+        return
+    ttl = SESSION_CACHE_TTL_SECONDS
+    if session["expires_at"]:
+        remaining = (
+            datetime.fromisoformat(session["expires_at"]) - datetime.utcnow()
+        ).total_seconds()
+        ttl = min(ttl, remaining)
+    if ttl <= 0:
+        return
+    with _session_cache_lock:
+        _session_cache[token] = (time.monotonic() + ttl, session)
+
+
+def _invalidate_cached_session(token: str) -> None:
+    with _session_cache_lock:
+        _session_cache.pop(token, None)
+
+
+def _invalidate_cached_sessions_for_email(email: str) -> None:
+    with _session_cache_lock:
+        for token in [
+            token for token, entry in _session_cache.items() if entry[1]["email"] == email
+        ]:
+            _session_cache.pop(token, None)
+
+
+def _clear_session_cache() -> None:
+    with _session_cache_lock:
+        _session_cache.clear()
+
+
 def _cleanup_expired_sessions() -> None:
     now = datetime.utcnow().isoformat()
     with _db_connection() as conn:
@@ -2423,6 +4010,38 @@ def _cleanup_expired_codes() -> None:
         conn.execute("DELETE FROM reset_codes WHERE expires_at <= ?", (now,))
 
 
+_session_sweeper_stop = threading.Event()
+_session_sweeper_thread: threading.Thread | None = None
+
+
+def _sweep_expired_sessions() -> None:
+    while not _session_sweeper_stop.wait(SESSION_SWEEP_INTERVAL_SECONDS):
+        try:
+            _cleanup_expired_sessions()
+            _cleanup_expired_codes()
+        except sqlite3.Error:
+            logger.exception("Expired session sweep failed.")
+        finally:
+            _release_thread_db_connection()
+
+
+def _start_session_sweeper() -> None:
+    global _session_sweeper_thread
+    if _session_sweeper_thread and _session_sweeper_thread.is_alive():
+        return
+    _session_sweeper_stop.clear()
+    _session_sweeper_thread = threading.Thread(
+        target=_sweep_expired_sessions, name="session-sweeper", daemon=True
+    )
+    _session_sweeper_thread.start()
+
+
+def _stop_session_sweeper() -> None:
+    _session_sweeper_stop.set()
+    if _session_sweeper_thread:
+        _session_sweeper_thread.join(timeout=5)
+
+
 def _validate_email(email: str) -> None:
     if not EMAIL_REGEX.match(email):
         raise HTTPException(status_code=400, detail="Invalid email format.")
@@ -2560,13 +4179,16 @@ def _require_token(authorization: str | None) -> str:
 
 def _require_session(authorization: str | None) -> sqlite3.Row:
     token = _require_token(authorization)
-    _cleanup_expired_sessions()
+    session = _get_cached_session(token)
+    if session:
+        return session
     session = _get_session(token)
     if not session:
         raise HTTPException(status_code=401, detail="Invalid session.")
     if session["expires_at"] and datetime.fromisoformat(session["expires_at"]) < datetime.utcnow():
         _delete_session(token)
         raise HTTPException(status_code=401, detail="Session expired.")
+    _cache_session(token, session)
     return session
 
 
@@ -2886,16 +4508,6 @@ def _get_portfolio(portfolio_id: int, owner_email: str) -> sqlite3.Row | None:
 
 
 
-def _normalize_text(value: str | None) -> str:
-    if value is None:
-        return ""
-    if not isinstance(value, str):
-        value = str(value)
-    normalized = unicodedata.normalize("NFKD", value)
-    cleaned = "".join(ch for ch in normalized if not unicodedata.combining(ch))
-    return cleaned.strip().lower()
-
-
 def _normalize_optional_text(value: str | None) -> str | None:
     if value is None:
         return None
@@ -3263,45 +4875,432 @@ def _detect_delimiter(sample: str) -> str:
     return ","
 
 
-def _load_rows_from_text(text: str) -> list[list[str | None]]:
-    rows: list[list[str | None]] = []
-    sample = text.splitlines()[0] if text.splitlines() else ""
-    delimiter = _detect_delimiter(sample)
-    for row in csv.reader(text.splitlines(), delimiter=delimiter):
-        rows.append([_fix_mojibake(cell) for cell in row])
-    return rows
+def _spreadsheet_stream(source: bytes | BinaryIO) -> BinaryIO:
+    if isinstance(source, (bytes, bytearray)):
+        return BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def _hash_upload(stream: BinaryIO) -> str:
+    """SHA-256 of an upload read in chunks; the stream is rewound for parsing."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+# Parsed uploads keyed by (parser, SHA-256 of the file). Results are plain
+# JSON values held serialized, so every hit hands out a fresh copy the caller
+# may edit; entries evicted from memory spill to PARSE_CACHE_DIR when it is set.
+# JSON (not pickle) keeps a writable cache directory from running code.
+_parse_cache: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+_parse_cache_lock = threading.Lock()
+PARSE_CACHE_FILE_PATTERN = re.compile(r"^\w+-v\d+-[0-9a-f]{64}\.json$")
+
+
+def _parse_cache_path(kind: str, file_hash: str) -> str:
+    return os.path.join(PARSE_CACHE_DIR, f"{kind}-v{PARSE_CACHE_VERSION}-{file_hash}.json")
+
+
+def _spill_parsed_upload(kind: str, file_hash: str, payload: bytes) -> None:
+    path = _parse_cache_path(kind, file_hash)
+    if os.path.exists(path):
+        return
+    try:
+        os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as handle:
+            handle.write(payload)
+        os.replace(temp_path, path)
+        # Only cache files are pruned; anything else in the directory is left alone.
+        entries = sorted(
+            (
+                entry
+                for entry in os.scandir(PARSE_CACHE_DIR)
+                if PARSE_CACHE_FILE_PATTERN.match(entry.name)
+            ),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in entries[: max(len(entries) - PARSE_CACHE_DISK_ENTRIES, 0)]:
+            os.remove(entry.path)
+    except OSError:
+        # The cache only saves work; a full or read-only disk must not fail the upload.
+        pass
+
+
+def _store_parsed_upload(key: tuple[str, str], payload: bytes) -> None:
+    evicted: list[tuple[tuple[str, str], bytes]] = []
+    with _parse_cache_lock:
+        _parse_cache[key] = payload
+        _parse_cache.move_to_end(key)
+        while len(_parse_cache) > max(PARSE_CACHE_SIZE, 0):
+            evicted.append(_parse_cache.popitem(last=False))
+    if PARSE_CACHE_DIR:
+        for (kind, file_hash), data in evicted:
+            _spill_parsed_upload(kind, file_hash, data)
+
+
+def _get_parsed_upload(kind: str, file_hash: str) -> object | None:
+    key = (kind, file_hash)
+    with _parse_cache_lock:
+        payload = _parse_cache.get(key)
+        if payload is not None:
+            _parse_cache.move_to_end(key)
+    if payload is None:
+        if not PARSE_CACHE_DIR:
+            return None
+        try:
+            with open(_parse_cache_path(kind, file_hash), "rb") as handle:
+                payload = handle.read()
+        except OSError:
+            return None
+        _store_parsed_upload(key, payload)
+    try:
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _put_parsed_upload(kind: str, file_hash: str, value: object) -> None:
+    payload = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    _store_parsed_upload((kind, file_hash), payload)
+
+
+def _cached_parse(kind: str, file_hash: str, parse: Callable[[], object]) -> object:
+    """Return the cached result of `parse` for this content, running it on a miss."""
+    cached = _get_parsed_upload(kind, file_hash)
+    if cached is not None:
+        return cached
+    result = parse()
+    _put_parsed_upload(kind, file_hash, result)
+    return result
+
+
+def _clear_parse_cache() -> None:
+    with _parse_cache_lock:
+        _parse_cache.clear()
+
+
+# Where each importer records the file_hash of committed uploads.
+COMMITTED_UPLOAD_TABLES = {
+    "xtb": "xtb_imports",
+    "savengrow": "save_ngrow_imports",
+    "bancoinvest": "bancoinvest_imports",
+    "aforronet": "aforronet_imports",
+    "trade_republic": "trade_republic_entries",
+}
+
+
+def _reject_committed_uploads(
+    kind: str, portfolio_id: int, uploads: list[tuple[str, str]]
+) -> None:
+    """Refuse (filename, file_hash) uploads already committed, before parsing them."""
+    hashes = [file_hash for _, file_hash in uploads]
+    if not hashes:
+        return
+    with _db_connection() as conn:
+        committed = {
+            row["file_hash"]
+            for row in conn.execute(
+                f"""
+                SELECT file_hash FROM {COMMITTED_UPLOAD_TABLES[kind]}
+                WHERE portfolio_id = ? AND file_hash IN ({", ".join("?" * len(hashes))})
+                """,
+                (portfolio_id, *hashes),
+            )
+        }
+    for filename, file_hash in uploads:
+        if file_hash in committed:
+            raise HTTPException(status_code=409, detail=f"File already imported: {filename}")
+
+
+# Upload parsing is CPU-bound (workbook loads, PDF text extraction), so
+# previews fan their files out to a process pool instead of holding the
+# request thread. Results go through the parse cache above.
+def _report_parse_worker(worker_pids: multiprocessing.SimpleQueue) -> None:
+    worker_pids.put(os.getpid())
+
+
+class _ParsePool(ProcessPoolExecutor):
+    """Process pool whose workers are terminated once it is retired and drained.
+
+    Workers report their pid when they start. Retiring the pool stops it taking
+    work; the futures it is told to abandon (a timed-out parse may never
+    return) are not waited for, and its workers are killed as soon as every
+    other outstanding future has finished.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self._worker_pids = multiprocessing.SimpleQueue()
+        super().__init__(
+            max_workers=max_workers,
+            initializer=_report_parse_worker,
+            initargs=(self._worker_pids,),
+        )
+        self._futures_lock = threading.Lock()
+        self._outstanding: set[Future] = set()
+        self._retired = False
+        self._pids: set[int] = set()
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        future = super().submit(fn, *args, **kwargs)
+        with self._futures_lock:
+            self._outstanding.add(future)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future: Future) -> None:
+        with self._futures_lock:
+            self._outstanding.discard(future)
+            drained = self._retired and not self._outstanding
+        if drained:
+            self._terminate_workers()
+
+    def retire(self, abandoned: Iterable[Future] = ()) -> None:
+        with self._futures_lock:
+            self._retired = True
+            self._outstanding.difference_update(abandoned)
+            drained = not self._outstanding
+        self.shutdown(wait=False)
+        if drained:
+            self._terminate_workers()
+
+    def _terminate_workers(self) -> None:
+        with self._futures_lock:
+            while not self._worker_pids.empty():
+                self._pids.add(self._worker_pids.get())
+            pids = set(self._pids)
+        for process in multiprocessing.active_children():
+            if process.pid in pids:
+                process.terminate()
+
+
+_parse_pool_lock = threading.Lock()
+_parse_executor: _ParsePool | None = None
+
+
+def _parse_pool() -> _ParsePool | None:
+    global _parse_executor
+    if PARSE_WORKERS <= 0:
+        return None
+    with _parse_pool_lock:
+        if _parse_executor is None:
+            _parse_executor = _ParsePool(max_workers=PARSE_WORKERS)
+        return _parse_executor
+
+
+def _retire_parse_pool(executor: _ParsePool, abandoned: Iterable[Future] = ()) -> None:
+    """Stop handing out `executor` and terminate its workers once it has drained.
+
+    Only the given executor is retired, so a fresh pool another request has
+    just created is left alone. Parses of other requests already on it still
+    finish; `abandoned` futures are not waited for.
+    """
+    global _parse_executor
+    with _parse_pool_lock:
+        if _parse_executor is executor:
+            _parse_executor = None
+    executor.retire(abandoned)
+
+
+def _shutdown_parse_pool() -> None:
+    global _parse_executor
+    with _parse_pool_lock:
+        executor = _parse_executor
+        _parse_executor = None
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_upload_parser(
+    parse: Callable[[bytes, str], object], file_bytes: bytes, filename: str
+) -> tuple[bool, object]:
+    # HTTPException does not survive unpickling, so it travels back as a tuple.
+    try:
+        return True, parse(file_bytes, filename)
+    except HTTPException as exc:
+        return False, (exc.status_code, exc.detail)
+
+
+def _finish_upload_parse(kind: str, file_hash: str, outcome: tuple[bool, object]) -> object:
+    ok, value = outcome
+    if not ok:
+        status_code, detail = value
+        return HTTPException(status_code=status_code, detail=detail)
+    _put_parsed_upload(kind, file_hash, value)
+    return value
 
 
-def _load_rows_from_excel(file_bytes: bytes, filename: str) -> list[list[str | float | int | None]]:
-    rows: list[list[str | float | int | None]] = []
+def _parse_uploads(
+    kind: str,
+    parse: Callable[[bytes, str], object],
+    uploads: list[tuple[str, str, bytes]],
+) -> Iterator[tuple[int, object]]:
+    """Yield (index, result) for (filename, file_hash, bytes) uploads as each is parsed.
+
+    A failed upload yields its exception as the result without stopping the
+    others. When no upload finishes within PARSE_TIMEOUT_SECONDS the ones
+    still running fail with 504 and new requests get a fresh pool; parses of
+    other requests already on the old pool are left to finish. A broken or
+    shut-down pool fails its uploads with 503.
+    """
+    pending: dict[str, list[int]] = {}
+    for index, (_, file_hash, _) in enumerate(uploads):
+        cached = _get_parsed_upload(kind, file_hash)
+        if cached is not None:
+            yield index, cached
+        else:
+            pending.setdefault(file_hash, []).append(index)
+    pool = _parse_pool() if pending else None
+    if pool is None:
+        for file_hash, indexes in pending.items():
+            filename, _, file_bytes = uploads[indexes[0]]
+            try:
+                outcome = _run_upload_parser(parse, file_bytes, filename)
+                result = _finish_upload_parse(kind, file_hash, outcome)
+            except Exception as exc:
+                result = exc
+            for index in indexes:
+                yield index, result
+        return
+    unavailable = HTTPException(
+        status_code=503, detail="File parser is restarting, please retry."
+    )
+    futures: dict[Future, str] = {}
+    for file_hash, indexes in pending.items():
+        filename, _, file_bytes = uploads[indexes[0]]
+        try:
+            futures[pool.submit(_run_upload_parser, parse, file_bytes, filename)] = file_hash
+        except (BrokenProcessPool, RuntimeError):
+            # Another request retired this pool between _parse_pool() and submit().
+            _retire_parse_pool(pool)
+            for index in indexes:
+                yield index, unavailable
+    remaining = set(futures)
+    try:
+        while remaining:
+            done, remaining = wait(
+                remaining, timeout=PARSE_TIMEOUT_SECONDS, return_when=FIRST_COMPLETED
+            )
+            if not done:
+                _retire_parse_pool(pool, remaining)
+                for future in remaining:
+                    for index in pending[futures[future]]:
+                        yield index, HTTPException(
+                            status_code=504, detail=f"Timed out reading {uploads[index][0]}."
+                        )
+                return
+            for future in done:
+                try:
+                    result = _finish_upload_parse(kind, futures[future], future.result())
+                except (BrokenProcessPool, CancelledError):
+                    _retire_parse_pool(pool)
+                    result = unavailable
+                except Exception as exc:
+                    result = exc
+                for index in pending[futures[future]]:
+                    yield index, result
+    finally:
+        for future in remaining:
+            future.cancel()
+
+
+def _open_xls_workbook(source: bytes | BinaryIO) -> xlrd.book.Book:
+    """Open a legacy workbook loading sheets on demand; on-disk uploads are mapped."""
+    if isinstance(source, (bytes, bytearray)):
+        return xlrd.open_workbook(file_contents=source, on_demand=True)
+    try:
+        contents = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        contents = _spreadsheet_stream(source).read()
+    return xlrd.open_workbook(file_contents=contents, on_demand=True)
+
+
+def _iter_sheet_rows(
+    source: bytes | BinaryIO, filename: str, max_col: int | None = None
+) -> Iterator[list]:
+    """Yield the first sheet row by row without materialising the workbook."""
     if filename.lower().endswith(".xls"):
-        book = xlrd.open_workbook(file_contents=file_bytes)
-        sheet = book.sheet_by_index(0)
-        for row_idx in range(sheet.nrows):
-            rows.append([_fix_mojibake(cell) for cell in sheet.row_values(row_idx)])
-        return rows
-    workbook = load_workbook(BytesIO(file_bytes), data_only=True)
-    sheet = workbook.active
-    for row in sheet.iter_rows(values_only=True):
-        rows.append([_fix_mojibake(cell) for cell in row])
-    return rows
+        book = _open_xls_workbook(source)
+        try:
+            sheet = book.sheet_by_index(0)
+            for row_idx in range(sheet.nrows):
+                yield sheet.row_values(row_idx, start_colx=0, end_colx=max_col)
+        finally:
+            book.release_resources()
+        return
+    workbook = load_workbook(
+        filename=_spreadsheet_stream(source), data_only=True, read_only=True
+    )
+    try:
+        for row in workbook.active.iter_rows(max_col=max_col, values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def _iter_upload_lines(source: bytes | BinaryIO) -> Iterator[str]:
+    """Decode an upload line by line as UTF-8, falling back to Latin-1 per line."""
+    stream = _spreadsheet_stream(source)
+    reader = io.TextIOWrapper(
+        stream, encoding="utf-8-sig", errors="surrogateescape", newline=None
+    )
+    try:
+        for line in reader:
+            if not line.isascii():
+                try:
+                    line.encode("utf-8")
+                except UnicodeEncodeError:
+                    line = line.encode("utf-8", "surrogateescape").decode("latin-1")
+            yield line
+    finally:
+        reader.detach()
+
+
+def _iter_text_rows(lines: Iterable[str]) -> Iterator[list[str | None]]:
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    delimiter = _detect_delimiter(first)
+    for row in csv.reader(chain([first], lines), delimiter=delimiter):
+        yield [_fix_mojibake(cell) for cell in row]
+
+
+def _iter_excel_rows(
+    source: bytes | BinaryIO, filename: str
+) -> Iterator[list[str | float | int | None]]:
+    for row in _iter_sheet_rows(source, filename):
+        yield [_fix_mojibake(cell) for cell in row]
 
 
 def _split_csv_column_rows(
-    rows: list[list[str | float | int | None]],
-) -> list[list[str | float | int | None]]:
-    if not rows:
-        return rows
-    if not all(len(row) == 1 and isinstance(row[0], str) for row in rows):
-        return rows
-    if not rows[0] or "," not in str(rows[0][0]):
-        return rows
-    parsed: list[list[str | None]] = []
-    for row in rows:
-        value = str(row[0]) if row and row[0] is not None else ""
+    rows: Iterable[list[str | float | int | None]],
+) -> Iterator[list[str | float | int | None]]:
+    """Split CSV lines that were exported into a single spreadsheet column.
+
+    The decision is made on the header scan window so the rest of the file can
+    be streamed through untouched.
+    """
+    rows = iter(rows)
+    head = list(islice(rows, BANKING_HEADER_SCAN_ROWS))
+    single_column = bool(head) and all(
+        len(row) == 1 and isinstance(row[0], str) for row in head
+    )
+    if not single_column or "," not in str(head[0][0]):
+        yield from head
+        yield from rows
+        return
+    for row in chain(head, rows):
+        if len(row) != 1 or not isinstance(row[0], str):
+            yield row
+            continue
+        value = row[0]
         for csv_row in csv.reader([value], delimiter=_detect_delimiter(value)):
-            parsed.append([_fix_mojibake(cell) for cell in csv_row])
-    return parsed
+            yield [_fix_mojibake(cell) for cell in csv_row]
 
 
 def _find_header_row(rows: list[list[str | float | int | None]]) -> int | None:
@@ -3323,7 +5322,7 @@ def _find_header_row(rows: list[list[str | float | int | None]]) -> int | None:
         "debit": {"debito"},
         "credit": {"credito"},
     }
-    for idx, row in enumerate(rows[:40]):
+    for idx, row in enumerate(rows[:BANKING_HEADER_SCAN_ROWS]):
         hits = 0
         for cell in row:
             if not cell:
@@ -3383,9 +5382,50 @@ def _normalize_mapping(mapping: dict[str, int | None]) -> dict[str, int | None]:
     return normalized
 
 
+def _banking_item_from_cells(
+    cells: list[str | float | int],
+    mapping: dict[str, int | None],
+    currency_fallback: str,
+) -> dict | None:
+    def cell_at(key: str) -> str | float | int | None:
+        col_idx = mapping.get(key)
+        if col_idx is None or col_idx >= len(cells):
+            return None
+        return cells[col_idx]
+
+    date_value = _parse_transaction_date(cell_at("date"))
+    description_value = _normalize_optional_text(_fix_mojibake(cell_at("description")))
+    debit_value = _parse_number(cell_at("debit")) if mapping.get("debit") is not None else None
+    credit_value = (
+        _parse_number(cell_at("credit")) if mapping.get("credit") is not None else None
+    )
+    if debit_value is not None or credit_value is not None:
+        debit_value = debit_value or 0.0
+        credit_value = credit_value or 0.0
+        amount_value = credit_value - abs(debit_value)
+    else:
+        amount_value = _parse_number(cell_at("amount"))
+    balance_value = _parse_number(cell_at("balance"))
+    currency_value = (
+        _normalize_optional_text(_fix_mojibake(cell_at("currency")))
+        or currency_fallback
+    )
+    if not date_value or not description_value or amount_value is None:
+        return None
+    return {
+        "tx_date": date_value,
+        "description": description_value,
+        "amount": float(amount_value),
+        "balance": float(balance_value) if balance_value is not None else None,
+        "currency": currency_value,
+        "category": BANKING_DEFAULT_CATEGORY,
+        "subcategory": BANKING_DEFAULT_SUBCATEGORY,
+        "cells": cells,
+    }
+
+
 def _build_banking_items(
-    rows: list[list[str | float | int | None]],
-    columns: list[str],
+    rows: Iterable[list[str | float | int | None]],
     mapping: dict[str, int | None],
     currency_fallback: str,
 ) -> tuple[list[dict], list[str]]:
@@ -3394,45 +5434,11 @@ def _build_banking_items(
     mapping = _normalize_mapping(mapping)
     for idx, row in enumerate(rows):
         cells = [cell if cell is not None else "" for cell in row]
-
-        def cell_at(key: str) -> str | float | int | None:
-            col_idx = mapping.get(key)
-            if col_idx is None or col_idx >= len(cells):
-                return None
-            return cells[col_idx]
-
-        date_value = _parse_transaction_date(cell_at("date"))
-        description_value = _normalize_optional_text(_fix_mojibake(cell_at("description")))
-        debit_value = _parse_number(cell_at("debit")) if mapping.get("debit") is not None else None
-        credit_value = (
-            _parse_number(cell_at("credit")) if mapping.get("credit") is not None else None
-        )
-        if debit_value is not None or credit_value is not None:
-            debit_value = debit_value or 0.0
-            credit_value = credit_value or 0.0
-            amount_value = credit_value - abs(debit_value)
-        else:
-            amount_value = _parse_number(cell_at("amount"))
-        balance_value = _parse_number(cell_at("balance"))
-        currency_value = (
-            _normalize_optional_text(_fix_mojibake(cell_at("currency")))
-            or currency_fallback
-        )
-        if not date_value or not description_value or amount_value is None:
+        item = _banking_item_from_cells(cells, mapping, currency_fallback)
+        if item is None:
             warnings.append(f"Row {idx + 1} skipped: missing required values.")
             continue
-        items.append(
-            {
-                "tx_date": date_value,
-                "description": description_value,
-                "amount": float(amount_value),
-                "balance": float(balance_value) if balance_value is not None else None,
-                "currency": currency_value,
-                "category": BANKING_DEFAULT_CATEGORY,
-                "subcategory": BANKING_DEFAULT_SUBCATEGORY,
-                "raw": dict(zip(columns, cells)),
-            }
-        )
+        items.append(item)
     return items, warnings
 
 
@@ -3500,76 +5506,90 @@ def _list_banking_categories(portfolio_id: int) -> list[dict]:
     return result
 
 
-def _normalize_banking_description(value: str | None) -> str | None:
-    if not value:
-        return None
-    return _normalize_text(value)
-
-
-def _upsert_banking_category(
-    portfolio_id: int, category: str | None, subcategory: str | None = None
+def _upsert_banking_categories(
+    conn: sqlite3.Connection,
+    portfolio_id: int,
+    pairs: list[tuple[str | None, str | None]],
 ) -> None:
-    category_name = (category or "").strip()
-    if not category_name:
+    """Create the missing (category, subcategory) pairs with one executemany per level."""
+    wanted: dict[str, tuple[str, set[str]]] = {}
+    for category, subcategory in pairs:
+        category_name = (category or "").strip()
+        if not category_name:
+            continue
+        entry = wanted.setdefault(_normalize_text(category_name), (category_name, set()))
+        subcategory_name = (subcategory or "").strip()
+        if subcategory_name:
+            entry[1].add(subcategory_name)
+    if not wanted:
         return
-    subcategory_name = (subcategory or "").strip()
+
+    def load_tree() -> tuple[dict[str, int], set[tuple[int, str]]]:
+        parents: dict[str, int] = {}
+        children: set[tuple[int, str]] = set()
+        for row in conn.execute(
+            "SELECT id, parent_id, name FROM banking_categories WHERE portfolio_id = ? ORDER BY id",
+            (portfolio_id,),
+        ):
+            if row["parent_id"] is None:
+                parents.setdefault(_normalize_text(row["name"]), row["id"])
+            else:
+                children.add((row["parent_id"], row["name"]))
+        return parents, children
+
     now = datetime.utcnow().isoformat()
-    with _db_connection() as conn:
-        parent_row = conn.execute(
-            """
-            SELECT id
-            FROM banking_categories
-            WHERE portfolio_id = ? AND parent_id IS NULL AND lower(name) = ?
-            """,
-            (portfolio_id, _normalize_text(category_name)),
-        ).fetchone()
-        if parent_row:
-            parent_id = parent_row["id"]
-        else:
-            conn.execute(
+    with _db_connection(conn):
+        parents, children = load_tree()
+        missing_parents = [
+            (portfolio_id, name, now) for key, (name, _) in wanted.items() if key not in parents
+        ]
+        if missing_parents:
+            conn.executemany(
                 """
                 INSERT OR IGNORE INTO banking_categories (portfolio_id, parent_id, name, is_default, created_at)
                 VALUES (?, NULL, ?, 0, ?)
                 """,
-                (portfolio_id, category_name, now),
-            )
-            parent_id = conn.execute(
-                """
-                SELECT id
-                FROM banking_categories
-                WHERE portfolio_id = ? AND parent_id IS NULL AND lower(name) = ?
-                """,
-                (portfolio_id, _normalize_text(category_name)),
-            ).fetchone()["id"]
-        if subcategory_name:
-            conn.execute(
-                """
-                INSERT OR IGNORE INTO banking_categories (portfolio_id, parent_id, name, is_default, created_at)
-                VALUES (?, ?, ?, 0, ?)
-                """,
-                (portfolio_id, parent_id, subcategory_name, now),
+                missing_parents,
             )
+            parents, children = load_tree()
+        missing_children = [
+            (portfolio_id, parents[key], name, now)
+            for key, (_, subcategories) in wanted.items()
+            for name in sorted(subcategories)
+            if (parents[key], name) not in children
+        ]
+        conn.executemany(
+            """
+            INSERT OR IGNORE INTO banking_categories (portfolio_id, parent_id, name, is_default, created_at)
+            VALUES (?, ?, ?, 0, ?)
+            """,
+            missing_children,
+        )
 
 
-def _find_banking_rule(
-    portfolio_id: int, institution: str, description: str | None
-) -> dict | None:
-    normalized_desc = _normalize_banking_description(description)
-    if not normalized_desc:
-        return None
-    normalized_inst = _normalize_text(institution or "")
+def _upsert_banking_category(
+    portfolio_id: int, category: str | None, subcategory: str | None = None
+) -> None:
     with _db_connection() as conn:
-        row = conn.execute(
-            """
-            SELECT category, subcategory
-            FROM banking_category_rules
-            WHERE portfolio_id = ? AND institution = ? AND match_type = 'exact' AND match_value = ?
-            """,
-            (portfolio_id, normalized_inst, normalized_desc),
-        ).fetchone()
-    if not row:
-        return None
-    return {"category": row["category"], "subcategory": row["subcategory"]}
+        _upsert_banking_categories(conn, portfolio_id, [(category, subcategory)])
+
+
+def _load_banking_rules(
+    conn: sqlite3.Connection, portfolio_id: int, institution: str
+) -> dict[str, dict]:
+    """Exact-match rules of one institution, keyed by normalized description."""
+    rows = conn.execute(
+        """
+        SELECT match_value, category, subcategory
+        FROM banking_category_rules
+        WHERE portfolio_id = ? AND institution = ? AND match_type = 'exact'
+        """,
+        (portfolio_id, _normalize_text(institution or "")),
+    ).fetchall()
+    return {
+        row["match_value"]: {"category": row["category"], "subcategory": row["subcategory"]}
+        for row in rows
+    }
 
 
 def _learn_banking_rule(
@@ -3617,42 +5637,309 @@ def _learn_banking_rule(
         )
 
 
-def _suggest_banking_category(description: str | None) -> tuple[str, str] | None:
-    normalized_desc = _normalize_banking_description(description)
-    if not normalized_desc:
-        return None
+def _keyword_trie_pattern(keywords: list[str]) -> str:
+    """Regex alternation shaped as a trie, so matching cost tracks text length, not rule count."""
+    trie: dict = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+def _compile_banking_regex(pattern: str) -> re.Pattern:
+    """Compile a user regex to run against normalized (lower-case, unaccented) descriptions."""
+    normalized = unicodedata.normalize("NFKD", pattern)
+    unaccented = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return re.compile(unaccented, re.IGNORECASE)
+
+
+def _has_nested_quantifier(pattern: str) -> bool:
+    """True if a repeated group (`*`, `+` or `{n,}`) itself contains a repetition."""
+    stack = [False]
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\":
+            index += 2
+            continue
+        if char == "[":
+            # Skip the character class; quantifier characters inside it are literals.
+            index += 2 if pattern[index + 1 : index + 2] == "]" else 1
+            while index < len(pattern) and pattern[index] != "]":
+                index += 2 if pattern[index] == "\\" else 1
+        elif char == "(":
+            stack.append(False)
+        elif char == ")" and len(stack) > 1:
+            repeated_inside = stack.pop()
+            following = pattern[index + 1 : index + 2]
+            if repeated_inside and (following in ("*", "+") or following == "{"):
+                return True
+            stack[-1] = stack[-1] or repeated_inside
+        elif char in "*+{":
+            stack[-1] = True
+        index += 1
+    return False
+
+
+class _BankingMatcher:
+    """Compiled keyword/regex classifier; the lowest priority index among all matches wins.
+
+    Rules are (priority, kind, pattern, category, subcategory) with kind 'substring'
+    (built-in keywords), 'word' (whole-word keywords) or 'regex'. Keywords of each
+    kind share one trie-shaped regex scanned with a lookahead at every position.
+    """
+
+    def __init__(self, rules: list[tuple[int, str, str, str, str]]) -> None:
+        self.results: dict[int, tuple[str, str]] = {}
+        keyword_priority: dict[str, dict[str, int]] = {"substring": {}, "word": {}}
+        regex_rules: list[tuple[int, str]] = []
+        for priority, kind, pattern, category, subcategory in sorted(rules):
+            self.results[priority] = (category, subcategory)
+            if kind == "regex":
+                regex_rules.append((priority, pattern))
+            elif pattern:
+                keyword_priority[kind].setdefault(pattern, priority)
+
+        self.keyword_patterns: list[tuple[re.Pattern, dict[str, int]]] = []
+        for kind, priorities in keyword_priority.items():
+            if not priorities:
+                continue
+            body = _keyword_trie_pattern(list(priorities))
+            if kind == "word":
+                body = rf"\b{body}\b"
+            # The trie returns the longest keyword at a position; shorter keywords that
+            # also match there are its prefixes, so fold their priorities in up front.
+            best: dict[str, int] = {}
+            for keyword in priorities:
+                best[keyword] = min(
+                    priorities[keyword[:size]]
+                    for size in range(1, len(keyword) + 1)
+                    if keyword[:size] in priorities
+                    and (
+                        kind == "substring"
+                        or size == len(keyword)
+                        or keyword[size - 1].isalnum() != keyword[size].isalnum()
+                    )
+                )
+            self.keyword_patterns.append((re.compile(f"(?=({body}))"), best))
+
+        self.regex_rules = [
+            (priority, _compile_banking_regex(pattern)) for priority, pattern in regex_rules
+        ]
+
+    def match(self, normalized_desc: str) -> tuple[str, str] | None:
+        best: int | None = None
+        for pattern, priorities in self.keyword_patterns:
+            for found in pattern.finditer(normalized_desc):
+                priority = priorities[found.group(1)]
+                if best is None or priority < best:
+                    best = priority
+        # Regex rules are checked in priority order, only while they could still win.
+        for priority, pattern in self.regex_rules:
+            if best is not None and priority >= best:
+                break
+            if pattern.search(normalized_desc):
+                best = priority
+                break
+        return self.results[best] if best is not None else None
+
+
+_banking_matchers: dict[int | None, tuple[tuple, _BankingMatcher]] = {}
+_banking_matchers_lock = threading.Lock()
+
+
+def _banking_matcher(conn: sqlite3.Connection | None, portfolio_id: int | None) -> _BankingMatcher:
+    """Matcher for a portfolio's custom rules plus the built-in keywords.
+
+    Compiled once per rule-set version (count, last id, last update) and reused.
+    """
+    version: tuple = ()
+    rows: list = []
+    if portfolio_id is not None:
+        with _db_connection(conn) as conn:
+            row = conn.execute(
+                """
+                SELECT COUNT(*) AS total, MAX(id) AS last_id, MAX(updated_at) AS updated_at
+                FROM banking_category_rules
+                WHERE portfolio_id = ? AND match_type IN ('keyword', 'regex')
+                """,
+                (portfolio_id,),
+            ).fetchone()
+            version = (row["total"], row["last_id"], row["updated_at"])
+            with _banking_matchers_lock:
+                cached = _banking_matchers.get(portfolio_id)
+            if cached and cached[0] == version:
+                return cached[1]
+            rows = conn.execute(
+                """
+                SELECT match_type, match_value, category, subcategory
+                FROM banking_category_rules
+                WHERE portfolio_id = ? AND match_type IN ('keyword', 'regex')
+                ORDER BY id
+                """,
+                (portfolio_id,),
+            ).fetchall()
+    else:
+        with _banking_matchers_lock:
+            cached = _banking_matchers.get(None)
+        if cached:
+            return cached[1]
+
+    rules: list[tuple[int, str, str, str, str]] = []
+    for row in rows:
+        kind = "regex" if row["match_type"] == "regex" else "word"
+        rules.append(
+            (
+                len(rules),
+                kind,
+                row["match_value"],
+                row["category"],
+                row["subcategory"] or BANKING_DEFAULT_SUBCATEGORY,
+            )
+        )
     for category, subcategory, keywords in BANKING_CATEGORY_KEYWORDS:
+        priority = len(rules)
         for keyword in keywords:
-            if keyword in normalized_desc:
-                return category, subcategory
-    return None
+            rules.append((priority, "substring", keyword, category, subcategory))
+    matcher = _BankingMatcher(rules)
+    with _banking_matchers_lock:
+        _banking_matchers[portfolio_id] = (version, matcher)
+    return matcher
+
+
+def _list_banking_keyword_rules(portfolio_id: int) -> list[dict]:
+    with _db_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT id, match_type, match_value, category, subcategory
+            FROM banking_category_rules
+            WHERE portfolio_id = ? AND match_type IN ('keyword', 'regex')
+            ORDER BY id
+            """,
+            (portfolio_id,),
+        ).fetchall()
+    return [
+        {
+            "id": row["id"],
+            "match_type": row["match_type"],
+            "pattern": row["match_value"],
+            "category": row["category"],
+            "subcategory": row["subcategory"],
+        }
+        for row in rows
+    ]
+
+
+def _save_banking_keyword_rule(portfolio_id: int, payload: BankingRuleRequest) -> dict:
+    match_type = (payload.match_type or "").strip().lower()
+    if match_type not in {"keyword", "regex"}:
+        raise HTTPException(status_code=400, detail="match_type must be keyword or regex.")
+    category_name = (payload.category or "").strip()
+    if not category_name:
+        raise HTTPException(status_code=400, detail="Category is required.")
+    subcategory_name = (payload.subcategory or BANKING_DEFAULT_SUBCATEGORY).strip()
+    if match_type == "keyword":
+        pattern = _normalize_banking_description(payload.pattern)
+    else:
+        pattern = (payload.pattern or "").strip()
+        if len(pattern) > BANKING_REGEX_MAX_LENGTH:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Regex must be at most {BANKING_REGEX_MAX_LENGTH} characters.",
+            )
+        if _has_nested_quantifier(pattern):
+            raise HTTPException(
+                status_code=400, detail="Regex must not repeat a group that repeats itself."
+            )
+        try:
+            _compile_banking_regex(pattern)
+        except re.error as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid regex: {exc}") from exc
+    if not pattern:
+        raise HTTPException(status_code=400, detail="Pattern is required.")
+    now = datetime.utcnow().isoformat()
+    with _db_connection() as conn:
+        _upsert_banking_categories(conn, portfolio_id, [(category_name, subcategory_name)])
+        row = conn.execute(
+            """
+            INSERT INTO banking_category_rules (
+                portfolio_id,
+                institution,
+                match_type,
+                match_value,
+                category,
+                subcategory,
+                updated_at
+            )
+            VALUES (?, '', ?, ?, ?, ?, ?)
+            ON CONFLICT(portfolio_id, institution, match_type, match_value)
+            DO UPDATE SET
+                category = excluded.category,
+                subcategory = excluded.subcategory,
+                updated_at = excluded.updated_at
+            RETURNING id
+            """,
+            (portfolio_id, match_type, pattern, category_name, subcategory_name, now),
+        ).fetchone()
+    return {
+        "id": row["id"],
+        "match_type": match_type,
+        "pattern": pattern,
+        "category": category_name,
+        "subcategory": subcategory_name,
+    }
+
+
+def _delete_banking_keyword_rule(portfolio_id: int, rule_id: int) -> bool:
+    with _db_connection() as conn:
+        cursor = conn.execute(
+            """
+            DELETE FROM banking_category_rules
+            WHERE id = ? AND portfolio_id = ? AND match_type IN ('keyword', 'regex')
+            """,
+            (rule_id, portfolio_id),
+        )
+    return cursor.rowcount > 0
 
 
 def _apply_banking_category_rules(
-    portfolio_id: int, institution: str, items: list[dict]
+    portfolio_id: int,
+    institution: str,
+    items: list[dict],
+    conn: sqlite3.Connection | None = None,
 ) -> None:
-    for item in items:
-        category = item.get("category") or BANKING_DEFAULT_CATEGORY
-        subcategory = item.get("subcategory") or BANKING_DEFAULT_SUBCATEGORY
-        if _normalize_text(category) == _normalize_text(BANKING_DEFAULT_CATEGORY):
-            rule = _find_banking_rule(portfolio_id, institution, item.get("description"))
-            if rule:
-                category = rule["category"]
-                subcategory = rule.get("subcategory") or BANKING_DEFAULT_SUBCATEGORY
-                item["category"] = category
-                item["subcategory"] = subcategory
-            else:
-                suggestion = _suggest_banking_category(item.get("description"))
-                if suggestion:
-                    category, subcategory = suggestion
-                    item["category"] = category
-                    item["subcategory"] = subcategory
+    with _db_connection(conn) as conn:
+        rules = _load_banking_rules(conn, portfolio_id, institution)
+        matcher = _banking_matcher(conn, portfolio_id)
+        default_key = _normalize_text(BANKING_DEFAULT_CATEGORY)
+        pairs: dict[tuple[str, str], None] = {}
+        for item in items:
+            category = item.get("category") or BANKING_DEFAULT_CATEGORY
+            subcategory = item.get("subcategory") or BANKING_DEFAULT_SUBCATEGORY
+            if _normalize_text(category) == default_key:
+                description = _normalize_banking_description(item.get("description"))
+                rule = rules.get(description) if description else None
+                if rule:
+                    category = rule["category"]
+                    subcategory = rule.get("subcategory") or BANKING_DEFAULT_SUBCATEGORY
                 else:
-                    item["category"] = category
-                    item["subcategory"] = subcategory
-        else:
+                    suggestion = matcher.match(description) if description else None
+                    if suggestion:
+                        category, subcategory = suggestion
+                item["category"] = category
             item["subcategory"] = subcategory
-        _upsert_banking_category(portfolio_id, category, subcategory)
+            pairs[(category, subcategory)] = None
+        _upsert_banking_categories(conn, portfolio_id, list(pairs))
 
 
 def _upsert_banking_institution(portfolio_id: int, name: str) -> None:
@@ -3681,63 +5968,182 @@ def _list_banking_institutions(portfolio_id: int) -> list[str]:
     return [row["name"] for row in rows]
 
 
-def _load_banking_rows(
-    file_bytes: bytes | None, filename: str | None, text: str | None
-) -> list[list[str | float | int | None]]:
+def _iter_banking_rows(
+    source: bytes | BinaryIO | None, filename: str | None, text: str | None
+) -> Iterator[list[str | float | int | None]]:
     if text:
-        return _load_rows_from_text(text)
-    if not file_bytes or not filename:
-        return []
-    if file_bytes[:2] == b"PK":
-        rows = _load_rows_from_excel(file_bytes, f"{filename}.xlsx")
+        return _iter_text_rows(io.StringIO(text, newline=None))
+    if source is None or not filename:
+        return iter(())
+    stream = _spreadsheet_stream(source)
+    signature = stream.read(2)
+    stream.seek(0)
+    if signature == b"PK":
+        rows = _iter_excel_rows(stream, f"{filename}.xlsx")
     elif filename.lower().endswith((".xls", ".xlsx")):
-        rows = _load_rows_from_excel(file_bytes, filename)
+        rows = _iter_excel_rows(stream, filename)
     else:
-        for encoding in ("utf-8-sig", "latin-1"):
-            try:
-                decoded = file_bytes.decode(encoding)
-                rows = _load_rows_from_text(decoded)
-                break
-            except UnicodeError:
-                rows = []
-        else:
-            rows = []
-    rows = _split_csv_column_rows(rows)
-    return rows
+        rows = _iter_text_rows(_iter_upload_lines(stream))
+    return _split_csv_column_rows(rows)
 
 
-def _trim_empty_rows(rows: list[list[str | float | int | None]]) -> list[list]:
-    trimmed: list[list] = []
+def _skip_empty_rows(rows: Iterable[list[str | float | int | None]]) -> Iterator[list]:
     for row in rows:
         if any(str(cell).strip() if cell is not None else "" for cell in row):
-            trimmed.append(row)
-    return trimmed
+            yield row
+
+
+_banking_staging: dict[tuple[int, str], dict] = {}
+_banking_staging_lock = threading.Lock()
+# Staged rows are keyed by the upload's SHA-256; commit requests echo it back,
+# so it is checked before it becomes part of a file name.
+BANKING_FILE_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _banking_staging_path(portfolio_id: int, file_hash: str) -> str:
+    return os.path.join(BANKING_STAGING_DIR, f"{portfolio_id}-{file_hash}.jsonl")
+
+
+def _evict_banking_staging(now: datetime | None = None) -> None:
+    now = now or datetime.utcnow()
+    with _banking_staging_lock:
+        expired = [key for key, entry in _banking_staging.items() if entry["expires_at"] <= now]
+        for key in expired:
+            _banking_staging.pop(key, None)
+    for key in expired:
+        _remove_banking_staging_file(*key)
+
+
+def _remove_banking_staging_file(portfolio_id: int, file_hash: str) -> None:
+    try:
+        os.remove(_banking_staging_path(portfolio_id, file_hash))
+    except FileNotFoundError:
+        pass
+
+
+def _staging_line(row: list) -> str:
+    return json.dumps(row, separators=(",", ":")) + "\n"
+
+
+def _stage_banking_rows(
+    portfolio_id: int,
+    file_hash: str,
+    source_file: str,
+    columns: list[str],
+    rows: Iterable[list],
+) -> dict:
+    """Keep parsed preview rows server-side until commit; large files go to disk.
+
+    Rows are consumed once. Past BANKING_STAGING_MEMORY_ROWS they are streamed
+    to a JSON-lines file, so staging never holds a large upload in memory.
+    """
+    _evict_banking_staging()
+    path = _banking_staging_path(portfolio_id, file_hash)
+    sample: list[list] = []
+    buffered: list[list] | None = []
+    total_rows = 0
+    handle = None
+    try:
+        for row in rows:
+            if total_rows < BANKING_PREVIEW_SAMPLE_ROWS:
+                sample.append(row)
+            total_rows += 1
+            if handle is not None:
+                handle.write(_staging_line(row))
+                continue
+            buffered.append(row)
+            if len(buffered) > BANKING_STAGING_MEMORY_ROWS:
+                os.makedirs(BANKING_STAGING_DIR, exist_ok=True)
+                handle = open(f"{path}.tmp", "w", encoding="utf-8")
+                handle.writelines(_staging_line(staged) for staged in buffered)
+                buffered = None
+    except BaseException:
+        if handle is not None:
+            handle.close()
+            os.remove(f"{path}.tmp")
+        raise
+    if handle is not None:
+        handle.close()
+        os.replace(f"{path}.tmp", path)
+    else:
+        _remove_banking_staging_file(portfolio_id, file_hash)
+    expires_at = datetime.utcnow() + timedelta(minutes=BANKING_STAGING_TTL_MINUTES)
+    with _banking_staging_lock:
+        _banking_staging[(portfolio_id, file_hash)] = {
+            "source_file": source_file,
+            "columns": columns,
+            "rows": buffered,
+            "expires_at": expires_at,
+        }
+    return {"expires_at": expires_at, "total_rows": total_rows, "sample": sample}
+
+
+def _iter_staged_banking_file(path: str) -> Iterator[list]:
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            yield json.loads(line)
+
+
+def _get_staged_banking_rows(portfolio_id: int, file_hash: str) -> dict | None:
+    """Return the staged entry; spilled rows are read back lazily from disk."""
+    _evict_banking_staging()
+    with _banking_staging_lock:
+        entry = _banking_staging.get((portfolio_id, file_hash))
+    if not entry:
+        return None
+    rows = entry["rows"]
+    if rows is None:
+        path = _banking_staging_path(portfolio_id, file_hash)
+        if not os.path.exists(path):
+            return None
+        rows = _iter_staged_banking_file(path)
+    return {**entry, "rows": rows}
+
+
+def _drop_staged_banking_rows(portfolio_id: int, file_hash: str) -> None:
+    with _banking_staging_lock:
+        _banking_staging.pop((portfolio_id, file_hash), None)
+    _remove_banking_staging_file(portfolio_id, file_hash)
+
+
+def _clear_banking_staging() -> None:
+    """Drop every staged preview; the in-memory index does not survive a restart."""
+    with _banking_staging_lock:
+        keys = list(_banking_staging)
+        _banking_staging.clear()
+    for key in keys:
+        _remove_banking_staging_file(*key)
 
 
 def _build_banking_preview(
-    rows: list[list[str | float | int | None]],
+    rows: Iterable[list[str | float | int | None]],
     currency_fallback: str,
-) -> tuple[list[str], list[dict], dict[str, int | None], list[str]]:
-    rows = _trim_empty_rows(rows)
-    header_row = _find_header_row(rows)
+) -> tuple[list[str], Iterator[list], dict[str, int | None], list[str]]:
+    """Detect the header in the first rows and stream the data rows behind it.
+
+    Warnings are appended while the returned rows are consumed.
+    """
+    rows = _skip_empty_rows(rows)
+    head = list(islice(rows, BANKING_HEADER_SCAN_ROWS))
+    header_row = _find_header_row(head)
     if header_row is None:
-        return [], [], _suggest_banking_mapping([]), ["No header row detected."]
+        return [], iter(()), _suggest_banking_mapping([]), ["No header row detected."]
     columns = [
         _normalize_optional_text(_fix_mojibake(cell)) or ""
-        for cell in rows[header_row]
+        for cell in head[header_row]
     ]
-    data_rows = rows[header_row + 1 :]
     mapping = _suggest_banking_mapping(columns)
-    items, warnings = _build_banking_items(data_rows, columns, mapping, currency_fallback)
-    preview_rows: list[dict] = []
-    for row in data_rows:
-        preview_rows.append(
-            {
-                "cells": [cell if cell is not None else "" for cell in row],
-                "include": True,
-            }
-        )
-    return columns, preview_rows, mapping, warnings
+    warnings: list[str] = []
+
+    def preview_rows() -> Iterator[list]:
+        for idx, row in enumerate(chain(head[header_row + 1 :], rows)):
+            cells = [cell if cell is not None else "" for cell in row]
+            if _banking_item_from_cells(cells, mapping, currency_fallback) is None:
+                warnings.append(f"Row {idx + 1} skipped: missing required values.")
+            # Cells are stored exactly as a client would have echoed them back.
+            yield jsonable_encoder(cells)
+
+    return columns, preview_rows(), mapping, warnings
 
 
 def _map_santander_category(account: str) -> str:
@@ -3762,30 +6168,10 @@ def _map_santander_category(account: str) -> str:
 
 
 
-def _iter_santander_rows(file_bytes: bytes, filename: str) -> list[list[object]]:
-    if filename.lower().endswith(".xls"):
-        workbook = xlrd.open_workbook(file_contents=file_bytes)
-        sheet = workbook.sheet_by_index(0)
-        return [
-            sheet.row_values(row_index, start_colx=0, end_colx=4)
-            for row_index in range(sheet.nrows)
-        ]
-    workbook = load_workbook(filename=BytesIO(file_bytes), data_only=True, read_only=True)
-    try:
-        sheet = workbook.active
-        return [
-            [cell.value for cell in row]
-            for row in sheet.iter_rows(min_row=1, max_row=sheet.max_row, max_col=4)
-        ]
-    finally:
-        workbook.close()
-
-
-
 def _parse_santander_sheet(
-    file_bytes: bytes, filename: str
+    source: bytes | BinaryIO, filename: str
 ) -> tuple[list[SantanderItem], list[str]]:
-    rows = _iter_santander_rows(file_bytes, filename)
+    rows = _iter_sheet_rows(source, filename, max_col=4)
     items: list[SantanderItem] = []
     warnings: list[str] = []
     current_section = ""
@@ -4300,42 +6686,22 @@ def _parse_date_value(value: object) -> str | None:
             try:
                 return datetime.strptime(stripped, fmt).date().isoformat()
             except ValueError:
-                continue
-    return None
-
-
-def _read_savengrow_cells(file_bytes: bytes, filename: str) -> dict:
-    if filename.lower().endswith(".xls"):
-        workbook = xlrd.open_workbook(file_contents=file_bytes)
-        sheet = workbook.sheet_by_index(0)
-        rows = [
-            sheet.row_values(row_index, start_colx=0, end_colx=8)
-            for row_index in range(sheet.nrows)
-        ]
-    else:
-        workbook = load_workbook(filename=BytesIO(file_bytes), data_only=True, read_only=True)
-        try:
-            sheet = workbook.active
-            rows = [
-                [cell.value for cell in row]
-                for row in sheet.iter_rows(min_row=1, max_row=sheet.max_row, max_col=8)
-            ]
-        finally:
-            workbook.close()
+                continue
+    return None
 
-    total_row_idx = None
-    for idx, row in enumerate(rows):
+
+def _read_savengrow_cells(source: bytes | BinaryIO, filename: str) -> dict:
+    rows = _iter_sheet_rows(source, filename, max_col=8)
+    for row in rows:
         cell_a = row[0] if len(row) > 0 else None
         if isinstance(cell_a, str) and _normalize_text(cell_a) == "total":
-            total_row_idx = idx
             break
-
-    if total_row_idx is None:
+    else:
         raise HTTPException(status_code=400, detail="Save N Grow missing TOTAL row.")
 
     items: list[dict] = []
     snapshot_date = None
-    for row in rows[total_row_idx + 1 :]:
+    for row in rows:
         name_raw = row[0] if len(row) > 0 else None
         name = str(name_raw).strip() if name_raw else ""
         if not name:
@@ -4397,29 +6763,27 @@ def _parse_aforronet_units(value: str) -> float | None:
     return _parse_number(text)
 
 
-def _parse_aforronet_pdf(file_bytes: bytes, filename: str) -> dict:
+def _parse_aforronet_pages(pages: list[str], filename: str) -> dict:
     total_units = 0.0
     total_value = 0.0
     rows_found = 0
-    with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text() or ""
-            for line in text.splitlines():
-                line = line.strip()
-                if not line:
-                    continue
-                if not re.match(r"\d{2}-\d{2}-\d{4}", line):
-                    continue
-                parts = re.split(r"\s+", line)
-                if len(parts) < 5:
-                    continue
-                units = _parse_aforronet_units(parts[-2])
-                value = _parse_number(parts[-1])
-                if units is None or value is None:
-                    continue
-                total_units += units
-                total_value += value
-                rows_found += 1
+    for text in pages:
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if not re.match(r"\d{2}-\d{2}-\d{4}", line):
+                continue
+            parts = re.split(r"\s+", line)
+            if len(parts) < 5:
+                continue
+            units = _parse_aforronet_units(parts[-2])
+            value = _parse_number(parts[-1])
+            if units is None or value is None:
+                continue
+            total_units += units
+            total_value += value
+            rows_found += 1
     if rows_found == 0:
         raise HTTPException(
             status_code=400,
@@ -4441,9 +6805,8 @@ def _extract_currency_values(text: str) -> list[float]:
     return values
 
 
-def _parse_trade_republic_pdf(file_bytes: bytes, filename: str) -> dict:
-    with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-        text = "\n".join(page.extract_text() or "" for page in pdf.pages)
+def _parse_trade_republic_pages(pages: list[str], filename: str) -> dict:
+    text = "\n".join(pages)
     lines = [line.strip() for line in text.splitlines() if line.strip()]
     available_cash = None
     for line in lines:
@@ -4479,30 +6842,32 @@ def _parse_trade_republic_pdf(file_bytes: bytes, filename: str) -> dict:
     }
 
 
-def _read_bancoinvest_cells(file_bytes: bytes, filename: str) -> dict:
-    if filename.lower().endswith(".xls"):
-        workbook = xlrd.open_workbook(file_contents=file_bytes)
-        sheet = workbook.sheet_by_index(0)
-        rows = [
-            sheet.row_values(row_index, start_colx=0, end_colx=12)
-            for row_index in range(sheet.nrows)
-        ]
-    else:
-        workbook = load_workbook(filename=BytesIO(file_bytes), data_only=True, read_only=True)
-        try:
-            sheet = workbook.active
-            rows = [
-                [cell.value for cell in row]
-                for row in sheet.iter_rows(min_row=1, max_row=sheet.max_row, max_col=12)
-            ]
-        finally:
-            workbook.close()
+def _extract_pdf_pages(file_bytes: bytes, filename: str) -> list[str]:
+    with pdfplumber.open(BytesIO(file_bytes)) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
 
+def _extract_pdf_batch(files: list[tuple[str, str, bytes]]) -> list[list[str]]:
+    """Page texts for each (filename, file_hash, bytes), extracted in parallel."""
+    pages: list = [None] * len(files)
+    for index, result in _parse_uploads("pdf_pages", _extract_pdf_pages, files):
+        pages[index] = result
+    for result in pages:
+        if isinstance(result, Exception):
+            raise result
+    return pages
+
+
+def _read_bancoinvest_cells(source: bytes | BinaryIO, filename: str) -> dict:
+    rows = _iter_sheet_rows(source, filename, max_col=12)
+    head: list[list] = []
     header_idx = None
     holder_idx = None
     var_idx = None
     value_idx = None
     for idx, row in enumerate(rows):
+        if idx < 10:
+            head.append(row)
         for col_idx, cell in enumerate(row):
             if not cell:
                 continue
@@ -4522,8 +6887,10 @@ def _read_bancoinvest_cells(file_bytes: bytes, filename: str) -> dict:
     if header_idx is None or holder_idx is None or value_idx is None:
         raise HTTPException(status_code=400, detail="BancoInvest header not found.")
 
+    # The snapshot date sits in the first ten rows, which may run past the header.
+    data_head = list(islice(rows, max(0, 10 - len(head))))
     snapshot_date = None
-    for row in rows[:10]:
+    for row in head + data_head:
         for cell in row:
             parsed = _parse_date_value(cell)
             if parsed:
@@ -4533,7 +6900,7 @@ def _read_bancoinvest_cells(file_bytes: bytes, filename: str) -> dict:
             break
 
     items: list[dict] = []
-    for row in rows[header_idx + 1 :]:
+    for row in chain(data_head, rows):
         holder_raw = row[holder_idx] if len(row) > holder_idx else None
         holder = str(holder_raw).strip() if holder_raw else ""
         if not holder:
@@ -4983,52 +7350,123 @@ def _aggregate_xtb_positions(positions: list[dict]) -> list[dict]:
     return items
 
 
-def _parse_xtb_file(file_bytes: bytes, filename: str) -> dict:
+def _xtb_preview_entry(filename: str, file_hash: str, parsed: dict) -> dict:
+    """Preview item, holdings, cash operations and warnings of one XTB workbook."""
+    holdings = [
+        {
+            "source_file": filename,
+            "ticker": position["ticker"],
+            "name": position.get("name"),
+            "shares": position["shares"],
+            "open_price": position["open_price"],
+            "purchase_value": position.get("purchase_value"),
+            "current_price": position.get("current_price"),
+            "category": "Stocks",
+        }
+        for position in _aggregate_xtb_positions(parsed.get("positions", []))
+    ]
+    operations = [
+        {
+            "source_file": filename,
+            "ticker": operation.get("ticker"),
+            "operation_type": operation.get("operation_type"),
+            "operation_kind": operation.get("operation_kind"),
+            "description": operation.get("description"),
+            "amount": operation.get("amount"),
+            "trade_date": operation.get("trade_date"),
+            "currency": "EUR",
+        }
+        for operation in parsed.get("operations", [])
+    ]
+    return {
+        "item": {
+            "filename": filename,
+            "file_hash": file_hash,
+            "account_type": _xtb_account_type(filename),
+            "category": "Stocks",
+            "current_value": parsed["current_value"],
+            "cash_value": parsed["cash_value"],
+            "invested": parsed["invested"],
+            "profit_value": parsed["profit_value"],
+            "profit_percent": parsed["profit_percent"],
+        },
+        "holdings": holdings,
+        "operations": operations,
+        "warnings": parsed["warnings"],
+    }
+
+
+def _stream_xtb_preview(
+    uploads: list[tuple[str, str, bytes]], results: Iterator[tuple[int, object]]
+) -> Iterator[bytes]:
+    """One NDJSON line per workbook as soon as it is parsed; `index` keeps upload order."""
+    for index, result in results:
+        filename, file_hash, _ = uploads[index]
+        if isinstance(result, HTTPException):
+            line = {"status_code": result.status_code, "detail": result.detail}
+        elif isinstance(result, Exception):
+            logger.error("XTB preview of %s failed: %r", filename, result)
+            line = {"status_code": 500, "detail": f"Unable to read {filename}."}
+        else:
+            line = _xtb_preview_entry(filename, file_hash, result)
+        line = {"index": index, "filename": filename, **line}
+        yield (json.dumps(jsonable_encoder(line), separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _parse_xtb_file(source: bytes | BinaryIO, filename: str) -> dict:
     warnings: list[str] = []
     operations: list[dict] = []
     if filename.lower().endswith(".xls"):
-        workbook = xlrd.open_workbook(file_contents=file_bytes)
-        cash_sheet = _xtb_sheet_by_name_xls(workbook, "CASH OPERATION HISTORY")
-        if cash_sheet is None:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing CASH OPERATION HISTORY sheet in {filename}.",
-            )
-        cash_value = _parse_number(cash_sheet.cell_value(7, 3))
-        current_value = _parse_number(cash_sheet.cell_value(7, 4))
-        if current_value is None:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Missing current value (E8) in {filename}.",
-            )
-        invested_total = 0.0
-        for row_idx in range(cash_sheet.nrows):
-            type_value = cash_sheet.cell_value(row_idx, 2)
-            if isinstance(type_value, str) and type_value.strip().lower() in {
-                "stock purchase",
-                "stock sale",
-            }:
-                amount = _parse_number(cash_sheet.cell_value(row_idx, 6))
-                if amount is not None:
-                    invested_total += float(amount)
-        operations = _xtb_cash_operations_from_xls(cash_sheet)
-        open_sheets = [
-            workbook.sheet_by_name(name)
-            for name in workbook.sheet_names()
-            if _normalize_text(name).startswith("open position")
-        ]
-        positions: list[dict] = []
-        profit_values: list[float] = []
-        for sheet in open_sheets:
-            positions.extend(_xtb_positions_from_xls(sheet))
-            for row_idx in range(sheet.nrows):
-                if sheet.ncols <= 15:
-                    continue
-                value = _parse_number(sheet.cell_value(row_idx, 15))
-                if value is not None:
-                    profit_values.append(float(value))
+        workbook = _open_xls_workbook(source)
+        try:
+            cash_sheet = _xtb_sheet_by_name_xls(workbook, "CASH OPERATION HISTORY")
+            if cash_sheet is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Missing CASH OPERATION HISTORY sheet in {filename}.",
+                )
+            cash_value = _parse_number(cash_sheet.cell_value(7, 3))
+            current_value = _parse_number(cash_sheet.cell_value(7, 4))
+            if current_value is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Missing current value (E8) in {filename}.",
+                )
+            invested_total = 0.0
+            for row_idx in range(cash_sheet.nrows):
+                type_value = cash_sheet.cell_value(row_idx, 2)
+                if isinstance(type_value, str) and type_value.strip().lower() in {
+                    "stock purchase",
+                    "stock sale",
+                }:
+                    amount = _parse_number(cash_sheet.cell_value(row_idx, 6))
+                    if amount is not None:
+                        invested_total += float(amount)
+            operations = _xtb_cash_operations_from_xls(cash_sheet)
+            workbook.unload_sheet(cash_sheet.name)
+            open_sheets = [
+                name
+                for name in workbook.sheet_names()
+                if _normalize_text(name).startswith("open position")
+            ]
+            positions: list[dict] = []
+            profit_values: list[float] = []
+            for name in open_sheets:
+                sheet = workbook.sheet_by_name(name)
+                positions.extend(_xtb_positions_from_xls(sheet))
+                for row_idx in range(sheet.nrows):
+                    if sheet.ncols <= 15:
+                        continue
+                    value = _parse_number(sheet.cell_value(row_idx, 15))
+                    if value is not None:
+                        profit_values.append(float(value))
+                workbook.unload_sheet(name)
+        finally:
+            workbook.release_resources()
     else:
-        workbook = load_workbook(filename=BytesIO(file_bytes), data_only=True, read_only=True)
+        workbook = load_workbook(
+            filename=_spreadsheet_stream(source), data_only=True, read_only=True
+        )
         try:
             cash_sheet = _xtb_sheet_by_name_xlsx(workbook, "CASH OPERATION HISTORY")
             if cash_sheet is None:
@@ -5749,6 +8187,34 @@ def _delete_portfolio(portfolio_id: int) -> bool:
             "DELETE FROM portfolio_category_settings WHERE portfolio_id = ?",
             (portfolio_id,),
         )
+        conn.execute(
+            "DELETE FROM portfolio_latest_totals WHERE portfolio_id = ?",
+            (portfolio_id,),
+        )
+        conn.execute(
+            "DELETE FROM portfolio_data_versions WHERE portfolio_id = ?",
+            (portfolio_id,),
+        )
+        conn.execute(
+            "DELETE FROM portfolio_history_entries WHERE portfolio_id = ?",
+            (portfolio_id,),
+        )
+        conn.execute(
+            "DELETE FROM portfolio_history_dirty WHERE portfolio_id = ?",
+            (portfolio_id,),
+        )
+        conn.execute(
+            "DELETE FROM portfolio_history_revisions WHERE portfolio_id = ?",
+            (portfolio_id,),
+        )
+        conn.execute(
+            "DELETE FROM portfolio_cash_flows WHERE portfolio_id = ?",
+            (portfolio_id,),
+        )
+        conn.execute(
+            "DELETE FROM portfolio_cash_flow_dirty WHERE portfolio_id = ?",
+            (portfolio_id,),
+        )
         cursor = conn.execute(
             "DELETE FROM portfolios WHERE id = ?",
             (portfolio_id,),
@@ -5756,48 +8222,6 @@ def _delete_portfolio(portfolio_id: int) -> bool:
         return cursor.rowcount > 0
 
 
-def _to_datetime(value: str | None) -> datetime:
-    if not value:
-        return datetime.min
-    if isinstance(value, datetime):
-        return value
-    text = str(value).strip()
-    if not text:
-        return datetime.min
-    try:
-        return datetime.fromisoformat(text)
-    except ValueError:
-        pass
-    match = re.search(r"(\d{2})-(\d{2})-(\d{4})", text)
-    if match:
-        day, month, year = (int(part) for part in match.groups())
-        try:
-            return datetime(year, month, day)
-        except ValueError:
-            return datetime.min
-    return datetime.min
-
-
-
-def _date_key(value: str | None) -> str | None:
-    if not value:
-        return None
-    timestamp = _to_datetime(value)
-    if timestamp == datetime.min:
-        return None
-    return timestamp.date().isoformat()
-
-
-
-def _month_key(value: str | None) -> str | None:
-    if not value:
-        return None
-    timestamp = _to_datetime(value)
-    if timestamp == datetime.min:
-        return None
-    return timestamp.strftime("%Y-%m")
-
-
 def _latest_month_values(entries: list[tuple[datetime, float]]) -> tuple[float | None, float | None]:
     by_month: dict[str, tuple[datetime, float]] = {}
     for timestamp, value in entries:
@@ -6142,6 +8566,108 @@ def _upsert_price(ticker: str, price: float, currency: str | None = None) -> Non
         )
 
 
+def _save_price_history(
+    rows: Iterable[tuple[str, str, float, str | None]], source: str
+) -> int:
+    """Bulk load (ticker, date, close, currency) rows; a repeated day replaces the close."""
+    with _db_connection() as conn:
+        cursor = conn.executemany(
+            """
+            INSERT INTO price_history (ticker, price_date, close, currency, source)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(ticker, price_date) DO UPDATE SET
+                close = excluded.close,
+                currency = excluded.currency,
+                source = excluded.source
+            """,
+            (
+                (ticker.upper(), price_date, close, currency, source)
+                for ticker, price_date, close, currency in rows
+            ),
+        )
+        return cursor.rowcount
+
+
+def _load_price_history(
+    tickers: Iterable[str], start: str, end: str
+) -> list[tuple[str, str, float, str | None]]:
+    """Closes of the tickers between start and end (inclusive), by ticker then date."""
+    tickers = sorted({ticker.upper() for ticker in tickers})
+    if not tickers:
+        return []
+    placeholders = ",".join("?" * len(tickers))
+    with _db_connection() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT ticker, price_date, close, currency
+            FROM price_history
+            WHERE ticker IN ({placeholders}) AND price_date BETWEEN ? AND ?
+            ORDER BY ticker, price_date
+            """,
+            [*tickers, start, end],
+        ).fetchall()
+    return [tuple(row) for row in rows]
+
+
+def _prices_as_of(tickers: Iterable[str], on: str) -> dict[str, dict]:
+    """Latest close on or before `on` for each ticker that has one.
+
+    One descending primary-key seek per ticker, so the cost does not grow with
+    the length of the history.
+    """
+    prices: dict[str, dict] = {}
+    with _db_connection() as conn:
+        for ticker in sorted({ticker.upper() for ticker in tickers}):
+            row = conn.execute(
+                """
+                SELECT price_date, close, currency
+                FROM price_history
+                WHERE ticker = ? AND price_date <= ?
+                ORDER BY price_date DESC
+                LIMIT 1
+                """,
+                (ticker, on),
+            ).fetchone()
+            if row:
+                prices[ticker] = {
+                    "date": row["price_date"],
+                    "close": float(row["close"]),
+                    "currency": row["currency"],
+                }
+    return prices
+
+
+def _iter_price_history_rows(
+    source: bytes | BinaryIO, filename: str
+) -> Iterator[tuple[str, str, float, str | None]]:
+    """Rows of a Ticker/Date/Close[/Currency] sheet or CSV; bad rows are skipped."""
+    if filename.lower().endswith(".csv"):
+        rows = _iter_text_rows(_iter_upload_lines(source))
+    else:
+        rows = _iter_sheet_rows(source, filename)
+    header = [_normalize_text(str(cell or "")) for cell in next(rows, None) or []]
+    close_column = "close" if "close" in header else "price"
+    if not {"ticker", "date", close_column} <= set(header):
+        raise HTTPException(
+            status_code=400, detail="Missing required columns. Expected: ticker, date, close"
+        )
+    ticker_idx, date_idx = header.index("ticker"), header.index("date")
+    close_idx = header.index(close_column)
+    currency_idx = header.index("currency") if "currency" in header else None
+    for row in rows:
+        if len(row) <= max(ticker_idx, date_idx, close_idx):
+            continue
+        ticker = str(row[ticker_idx] or "").strip().upper()
+        price_date = _parse_date_value(row[date_idx])
+        close = _parse_number(row[close_idx])
+        if not ticker or not price_date or not close or close <= 0:
+            continue
+        currency = None
+        if currency_idx is not None and currency_idx < len(row) and row[currency_idx]:
+            currency = str(row[currency_idx]).strip().upper()
+        yield ticker, price_date, close, currency
+
+
 def _list_holdings_metadata(portfolio_id: int) -> dict[str, dict]:
     """Lista metadados dos holdings, priorizando ticker_metadata global sobre holdings_metadata por portfolio."""
     tags_map = _list_holding_tags(portfolio_id)
@@ -6205,6 +8731,7 @@ def _save_banking_import(
     source_file: str,
     file_hash: str,
     row_count: int,
+    columns: list[str] | None = None,
 ) -> int:
     now = datetime.utcnow().isoformat()
     with _db_connection() as conn:
@@ -6216,54 +8743,185 @@ def _save_banking_import(
                 source_file,
                 file_hash,
                 imported_at,
-                row_count
-            ) VALUES (?, ?, ?, ?, ?, ?)
+                row_count,
+                columns_json
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
-            (portfolio_id, institution, source_file, file_hash, now, row_count),
+            (
+                portfolio_id,
+                institution,
+                source_file,
+                file_hash,
+                now,
+                row_count,
+                json.dumps(columns) if columns else None,
+            ),
         )
         return int(cursor.lastrowid)
 
 
-def _save_banking_transactions(
-    portfolio_id: int, import_id: int, institution: str, items: list[dict]
-) -> None:
-    now = datetime.utcnow().isoformat()
-    with _db_connection() as conn:
-        conn.executemany(
-            """
-            INSERT INTO banking_transactions (
-                import_id,
-                portfolio_id,
-                institution,
-                tx_date,
-                description,
-                amount,
-                balance,
-                currency,
-                category,
-                subcategory,
-                raw_json,
-                created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            [
-                (
-                    import_id,
-                    portfolio_id,
-                    institution,
-                    item["tx_date"],
-                    item["description"],
-                    float(item["amount"]),
-                    float(item["balance"]) if item.get("balance") is not None else None,
-                    item.get("currency") or "EUR",
-                    item.get("category") or BANKING_DEFAULT_CATEGORY,
-                    item.get("subcategory") or BANKING_DEFAULT_SUBCATEGORY,
-                    json.dumps(item.get("raw") or {}),
-                    now,
-                )
-                for item in items
-            ],
+def _save_banking_transactions(
+    portfolio_id: int,
+    import_id: int,
+    institution: str,
+    items: list[dict],
+) -> int:
+    """Insert the statement rows, skipping ones already stored; returns the insert count."""
+    now = datetime.utcnow().isoformat()
+    rows = [
+        (
+            import_id,
+            portfolio_id,
+            institution,
+            item["tx_date"],
+            item["description"],
+            float(item["amount"]),
+            float(item["balance"]) if item.get("balance") is not None else None,
+            item.get("currency") or "EUR",
+            item.get("category") or BANKING_DEFAULT_CATEGORY,
+            item.get("subcategory") or BANKING_DEFAULT_SUBCATEGORY,
+            _pack_banking_cells(item.get("cells")),
+            now,
+        )
+        for item in items
+    ]
+    fingerprints = _banking_fingerprints(
+        ((row[3], row[5], row[4], row[6]) for row in rows), institution
+    )
+    rows = [
+        (
+            *row,
+            _normalize_text(row[8]),
+            _normalize_text(row[9]),
+            _normalize_banking_description(row[4]),
+            fingerprint,
+        )
+        for row, fingerprint in zip(rows, fingerprints)
+    ]
+    with _db_connection() as conn:
+        cursor = conn.executemany(
+            """
+            INSERT INTO banking_transactions (
+                import_id,
+                portfolio_id,
+                institution,
+                tx_date,
+                description,
+                amount,
+                balance,
+                currency,
+                category,
+                subcategory,
+                raw_cells,
+                created_at,
+                category_key,
+                subcategory_key,
+                description_key,
+                fingerprint
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(portfolio_id, fingerprint) DO NOTHING
+            """,
+            rows,
+        )
+        inserted = cursor.rowcount
+        if inserted == len(rows):
+            added = ((row[1], row[3], row[8], row[5]) for row in rows)
+        else:
+            added = conn.execute(
+                """
+                SELECT portfolio_id, tx_date, category, amount
+                FROM banking_transactions
+                WHERE import_id = ?
+                """,
+                (import_id,),
+            )
+        _add_banking_monthly_spend(conn, added)
+    return inserted
+
+
+def _get_banking_transaction_raw(portfolio_id: int, tx_id: int) -> dict | None:
+    """Rebuild the statement row a transaction was imported from."""
+    with _db_connection() as conn:
+        row = conn.execute(
+            """
+            SELECT t.raw_cells, i.columns_json
+            FROM banking_transactions t
+            JOIN banking_imports i ON i.id = t.import_id
+            WHERE t.portfolio_id = ? AND t.id = ?
+            """,
+            (portfolio_id, tx_id),
+        ).fetchone()
+    if not row:
+        return None
+    columns = json.loads(row["columns_json"]) if row["columns_json"] else []
+    cells = _unpack_banking_cells(row["raw_cells"])
+    return {
+        "id": tx_id,
+        "columns": columns,
+        "cells": cells,
+        "raw": dict(zip(columns, cells)),
+    }
+
+
+def _count_known_banking_rows(
+    portfolio_id: int, institution: str, items: list[dict]
+) -> int:
+    """Count how many statement rows are already stored for the portfolio."""
+    fingerprints = _banking_fingerprints(
+        (
+            (item["tx_date"], item["amount"], item["description"], item.get("balance"))
+            for item in items
+        ),
+        institution,
+    )
+    known = 0
+    with _db_connection() as conn:
+        for start in range(0, len(fingerprints), 500):
+            chunk = fingerprints[start : start + 500]
+            known += conn.execute(
+                f"""
+                SELECT COUNT(*) FROM banking_transactions
+                WHERE portfolio_id = ? AND fingerprint IN ({", ".join("?" * len(chunk))})
+                """,
+                (portfolio_id, *chunk),
+            ).fetchone()[0]
+    return known
+
+
+def _parse_banking_cursor(value: str) -> tuple[str, int]:
+    tx_date, _, tx_id = value.rpartition(",")
+    try:
+        if not tx_date:
+            raise ValueError(value)
+        return tx_date, int(tx_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor.") from exc
+
+
+def _banking_cursor(item: dict) -> str:
+    return f"{item['tx_date']},{item['id']}"
+
+
+def _parse_banking_fields(value: str | None) -> tuple[str, ...]:
+    if not value:
+        return BANKING_TRANSACTION_FIELDS
+    requested = {field.strip() for field in value.split(",") if field.strip()}
+    unknown = requested.difference(BANKING_TRANSACTION_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}."
         )
+    # The cursor needs the date and id of every row.
+    requested.update(("id", "tx_date"))
+    return tuple(field for field in BANKING_TRANSACTION_FIELDS if field in requested)
+
+
+def _banking_search_expression(query: str | None) -> str | None:
+    """FTS5 prefix query over the same normalization as the stored descriptions."""
+    terms = re.findall(r"\w+", _normalize_banking_description(query) or "")
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
 
 
 def _list_banking_transactions(
@@ -6272,42 +8930,79 @@ def _list_banking_transactions(
     category: str | None = None,
     subcategory: str | None = None,
     institution: str | None = None,
+    q: str | None = None,
+    after: tuple[str, int] | None = None,
+    limit: int | None = None,
+    fields: tuple[str, ...] = BANKING_TRANSACTION_FIELDS,
 ) -> list[dict]:
+    """Newest-first transactions; `after` is the (tx_date, id) of the last row seen."""
     query = [
-        "SELECT id, tx_date, description, amount, balance, currency, category, subcategory, institution",
+        f"SELECT {', '.join(fields)}",
         "FROM banking_transactions",
         "WHERE portfolio_id = ?",
     ]
     params: list[object] = [portfolio_id]
     if month:
-        query.append("AND substr(tx_date, 1, 7) = ?")
+        query.append("AND month = ?")
         params.append(month)
     if category:
-        query.append("AND lower(category) = ?")
+        query.append("AND category_key = ?")
         params.append(_normalize_text(category))
     if subcategory:
-        query.append("AND lower(subcategory) = ?")
+        query.append("AND subcategory_key = ?")
         params.append(_normalize_text(subcategory))
     if institution:
         query.append("AND lower(institution) = ?")
         params.append(_normalize_text(institution))
-    query.append("ORDER BY tx_date DESC")
+    search = _banking_search_expression(q)
+    if search:
+        query.append(
+            "AND id IN (SELECT rowid FROM banking_transactions_fts "
+            "WHERE banking_transactions_fts MATCH ?)"
+        )
+        params.append(search)
+    if after:
+        # Written as a range on tx_date so the index still drives the scan.
+        query.append("AND tx_date <= ? AND (tx_date < ? OR id < ?)")
+        params.extend((after[0], after[0], after[1]))
+    query.append("ORDER BY tx_date DESC, id DESC")
+    if limit:
+        query.append("LIMIT ?")
+        params.append(limit)
     with _db_connection() as conn:
         rows = conn.execute("\n".join(query), params).fetchall()
-    return [
-        {
-            "id": row["id"],
-            "tx_date": row["tx_date"],
-            "description": row["description"],
-            "amount": float(row["amount"] or 0),
-            "balance": float(row["balance"]) if row["balance"] is not None else None,
-            "currency": row["currency"],
-            "category": row["category"],
-            "subcategory": row["subcategory"],
-            "institution": row["institution"],
-        }
-        for row in rows
-    ]
+    items = [dict(row) for row in rows]
+    if "amount" in fields:
+        for item in items:
+            item["amount"] = float(item["amount"] or 0)
+    if "balance" in fields:
+        for item in items:
+            if item["balance"] is not None:
+                item["balance"] = float(item["balance"])
+    return items
+
+
+def _stream_banking_transactions(
+    portfolio_id: int,
+    filters: dict,
+    after: tuple[str, int] | None,
+    limit: int | None,
+    fields: tuple[str, ...],
+) -> Iterator[bytes]:
+    """NDJSON lines fetched one keyset page at a time; no cursor outlives a page."""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        page_size = min(BANKING_STREAM_PAGE_ROWS, remaining or BANKING_STREAM_PAGE_ROWS)
+        page = _list_banking_transactions(
+            portfolio_id, **filters, after=after, limit=page_size, fields=fields
+        )
+        for item in page:
+            yield (json.dumps(item, separators=(",", ":")) + "\n").encode("utf-8")
+        if len(page) < page_size:
+            return
+        after = (page[-1]["tx_date"], page[-1]["id"])
+        if remaining is not None:
+            remaining -= len(page)
 
 
 def _update_banking_transaction_category(
@@ -6321,7 +9016,7 @@ def _update_banking_transaction_category(
     with _db_connection() as conn:
         row = conn.execute(
             """
-            SELECT institution, description
+            SELECT institution, description, tx_date, amount, category
             FROM banking_transactions
             WHERE id = ? AND portfolio_id = ?
             """,
@@ -6332,11 +9027,25 @@ def _update_banking_transaction_category(
         conn.execute(
             """
             UPDATE banking_transactions
-            SET category = ?, subcategory = ?
+            SET category = ?, subcategory = ?, category_key = ?, subcategory_key = ?
             WHERE id = ? AND portfolio_id = ?
             """,
-            (category_name, subcategory_name, tx_id, portfolio_id),
+            (
+                category_name,
+                subcategory_name,
+                _normalize_text(category_name),
+                _normalize_text(subcategory_name),
+                tx_id,
+                portfolio_id,
+            ),
         )
+        if row["category"] != category_name:
+            _add_banking_monthly_spend(
+                conn, [(portfolio_id, row["tx_date"], row["category"], row["amount"])], sign=-1
+            )
+            _add_banking_monthly_spend(
+                conn, [(portfolio_id, row["tx_date"], category_name, row["amount"])]
+            )
     _learn_banking_rule(
         portfolio_id,
         row["institution"],
@@ -6365,6 +9074,9 @@ def _clear_banking_transactions(portfolio_id: int) -> dict[str, int]:
             "DELETE FROM banking_institutions WHERE portfolio_id = ?",
             (portfolio_id,),
         ).rowcount
+        conn.execute(
+            "DELETE FROM banking_monthly_spend WHERE portfolio_id = ?", (portfolio_id,)
+        )
     return {
         "transactions": tx_deleted or 0,
         "imports": import_deleted or 0,
@@ -6382,18 +9094,19 @@ def _upsert_banking_budget(
             INSERT INTO banking_budgets (
                 portfolio_id,
                 category,
+                category_key,
                 month,
                 amount,
                 created_at,
                 updated_at
             )
-            VALUES (?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
             ON CONFLICT(portfolio_id, category, month)
             DO UPDATE SET
                 amount = excluded.amount,
                 updated_at = excluded.updated_at
             """,
-            (portfolio_id, category, month, amount, now, now),
+            (portfolio_id, category, _normalize_text(category), month, amount, now, now),
         )
         row = conn.execute(
             """
@@ -6422,48 +9135,91 @@ def _delete_banking_budget(portfolio_id: int, budget_id: int) -> bool:
     return True
 
 
-def _list_banking_budgets(portfolio_id: int, month: str) -> list[dict]:
+def _list_banking_budgets(
+    portfolio_id: int, month: str, until: str | None = None
+) -> list[dict]:
+    """Budget status for `month`, or every month up to `until`, from the rollup."""
     with _db_connection() as conn:
         rows = conn.execute(
             """
-            SELECT id, category, month, amount
-            FROM banking_budgets
-            WHERE portfolio_id = ? AND month = ?
-            ORDER BY category
+            SELECT b.id, b.category, b.month, b.amount, COALESCE(s.spent, 0) AS spent
+            FROM banking_budgets b
+            LEFT JOIN banking_monthly_spend s
+              ON s.portfolio_id = b.portfolio_id
+             AND s.month = b.month
+             AND s.category_key = b.category_key
+            WHERE b.portfolio_id = ? AND b.month BETWEEN ? AND ?
+            ORDER BY b.month, b.category
             """,
-            (portfolio_id, month),
+            (portfolio_id, month, until or month),
         ).fetchall()
-        results: list[dict] = []
-        for row in rows:
-            spent_row = conn.execute(
-                """
-                SELECT SUM(ABS(amount)) AS spent
-                FROM banking_transactions
-                WHERE portfolio_id = ?
-                  AND lower(category) = ?
-                  AND amount < 0
-                  AND substr(tx_date, 1, 7) = ?
-                """,
-                (portfolio_id, _normalize_text(row["category"]), month),
-            ).fetchone()
-            spent = float(spent_row["spent"] or 0)
-            amount = float(row["amount"] or 0)
-            remaining = amount - spent
-            percent = round(spent / amount * 100, 2) if amount else 0.0
-            results.append(
-                {
-                    "id": row["id"],
-                    "category": row["category"],
-                    "month": row["month"],
-                    "amount": amount,
-                    "spent": spent,
-                    "remaining": remaining,
-                    "percent": percent,
-                }
-            )
+    results: list[dict] = []
+    for row in rows:
+        spent = round(float(row["spent"] or 0), 2)
+        amount = float(row["amount"] or 0)
+        remaining = amount - spent
+        percent = round(spent / amount * 100, 2) if amount else 0.0
+        results.append(
+            {
+                "id": row["id"],
+                "category": row["category"],
+                "month": row["month"],
+                "amount": amount,
+                "spent": spent,
+                "remaining": remaining,
+                "percent": percent,
+            }
+        )
     return results
 
 
+def _banking_spend_summary(portfolio_id: int, month_from: str, month_to: str) -> dict:
+    """Category x month spend and income matrices read from the monthly rollup."""
+    months = _months_between(month_from, month_to)
+    position = {month: index for index, month in enumerate(months)}
+    with _db_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT month, category_key, category, spent, income, tx_count
+            FROM banking_monthly_spend
+            WHERE portfolio_id = ? AND month BETWEEN ? AND ?
+            ORDER BY category_key, month
+            """,
+            (portfolio_id, month_from, month_to),
+        ).fetchall()
+    categories: dict[str, dict] = {}
+    totals = {"spent": [0.0] * len(months), "income": [0.0] * len(months)}
+    for row in rows:
+        entry = categories.setdefault(
+            row["category_key"],
+            {
+                "category": row["category"],
+                "spent": [0.0] * len(months),
+                "income": [0.0] * len(months),
+                "count": [0] * len(months),
+            },
+        )
+        index = position[row["month"]]
+        entry["spent"][index] = round(float(row["spent"]), 2)
+        entry["income"][index] = round(float(row["income"]), 2)
+        entry["count"][index] = int(row["tx_count"])
+        totals["spent"][index] += float(row["spent"])
+        totals["income"][index] += float(row["income"])
+    items = sorted(
+        categories.values(), key=lambda item: (-sum(item["spent"]), item["category"])
+    )
+    for item in items:
+        item["total_spent"] = round(sum(item["spent"]), 2)
+        item["total_income"] = round(sum(item["income"]), 2)
+    return {
+        "from": month_from,
+        "to": month_to,
+        "months": months,
+        "categories": items,
+        "totals": {key: [round(value, 2) for value in values] for key, values in totals.items()},
+    }
+
+
 def _upsert_holdings_metadata(
     portfolio_id: int, payload: HoldingMetadataRequest
 ) -> dict:
@@ -6691,8 +9447,7 @@ def _fetch_metadata_finnhub(ticker: str) -> dict | None:
     if not PRICE_API_KEY:
         return None
     
-    import time
-    
+    limiter = _price_rate_limiter("finnhub")
     metadata = {
         "ticker": ticker.upper(),
         "name": None,
@@ -6711,6 +9466,7 @@ def _fetch_metadata_finnhub(ticker: str) -> dict | None:
     
     try:
         # 1. Get profile (name, country, exchange, industry)
+        limiter.acquire()
         profile = _fetch_profile_finnhub(ticker)
         if profile:
             metadata.update({
@@ -6722,17 +9478,14 @@ def _fetch_metadata_finnhub(ticker: str) -> dict | None:
                 "sector": profile.get("sector")
             })
         
-        # Small delay between API calls (rate limit: 59/min)
-        time.sleep(1.05)
-        
         # 2. Get metrics (dividend yield)
+        limiter.acquire()
         metrics = _fetch_metrics_finnhub(ticker)
         if metrics:
             metadata["dividend_yield"] = metrics.get("dividend_yield")
         
-        time.sleep(1.05)
-        
         # 3. Get dividends (next payment date)
+        limiter.acquire()
         dividends = _fetch_dividends_finnhub(ticker)
         if dividends:
             metadata["next_dividend_date"] = dividends.get("next_dividend_date")
@@ -6740,10 +9493,9 @@ def _fetch_metadata_finnhub(ticker: str) -> dict | None:
             if metadata["next_dividend_date"]:
                 metadata["dividend_frequency"] = "Quarterly"  # Assume quarterly if has dividends
         
-        time.sleep(1.05)
-        
         # 4. Get current price
         try:
+            limiter.acquire()
             price = _fetch_price_finnhub(ticker)
             if price:
                 metadata["price"] = price
@@ -6757,92 +9509,689 @@ def _fetch_metadata_finnhub(ticker: str) -> dict | None:
         return None
 
 
+def _fetch_prices_twelvedata(tickers: list[str]) -> dict[str, float]:
+    """Busca vários preços numa única chamada /price (símbolos separados por vírgula).
+
+    Símbolos sem preço ou com erro ficam fora do resultado.
+    """
+    if not PRICE_API_KEY:
+        raise HTTPException(status_code=400, detail="Price API not configured.")
+    if not tickers:
+        return {}
+    query = urllib.parse.urlencode({"symbol": ",".join(tickers), "apikey": PRICE_API_KEY})
+    url = f"https://api.twelvedata.com/price?{query}"
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            response_text = response.read().decode("utf-8")
+        data = json.loads(response_text) if response_text.strip() else {}
+    except (json.JSONDecodeError, urllib.error.URLError) as e:
+        logger.warning("Twelve Data batch error for %s: %s", ",".join(tickers), e)
+        return {}
+    if len(tickers) == 1:
+        data = {tickers[0]: data}
+    prices: dict[str, float] = {}
+    for symbol, entry in data.items():
+        if not isinstance(entry, dict) or entry.get("price") is None:
+            continue
+        try:
+            prices[symbol.upper()] = float(entry["price"])
+        except (TypeError, ValueError):
+            continue
+    return prices
+
+
+class _TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute: float, capacity: float) -> None:
+        self.rate = max(rate_per_minute, 0.001) / 60.0
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_price_rate_limiters: dict[str, _TokenBucket] = {}
+_price_rate_limiters_lock = threading.Lock()
+
+
+def _price_rate_limiter(provider: str) -> _TokenBucket:
+    """Limitador partilhado por todos os pedidos ao mesmo provider."""
+    provider = "finnhub" if provider == "finhub" else provider
+    with _price_rate_limiters_lock:
+        limiter = _price_rate_limiters.get(provider)
+        if limiter is None:
+            rate = PRICE_PROVIDER_CALLS_PER_MINUTE.get(provider, 30.0)
+            limiter = _TokenBucket(rate, max(1.0, min(rate, 8.0)))
+            _price_rate_limiters[provider] = limiter
+        return limiter
+
+
+def _fetch_price_yfinance_fallback(ticker: str) -> float:
+    # Fallback to yfinance (free, works for most tickers including European)
+    logger.info("Fetching %s price from yfinance", ticker)
+    try:
+        _price_rate_limiter("yfinance").acquire()
+        price_data = _fetch_ticker_price_yfinance(ticker)
+        if price_data and price_data.get("price"):
+            logger.info("yfinance price for %s: %s", ticker, price_data["price"])
+            return float(price_data["price"])
+    except Exception as e:
+        logger.warning("yfinance price fetch failed for %s: %s", ticker, e)
+    
+    raise HTTPException(status_code=400, detail=f"Price unavailable for {ticker}.")
+
+
 def _fetch_latest_price(ticker: str) -> float:
     """Fetch latest price with fallback to yfinance if configured provider fails."""
     
     # Try configured provider first (also check for typo "finhub")
     if PRICE_API_PROVIDER in ("twelvedata",):
         try:
+            _price_rate_limiter("twelvedata").acquire()
             return _fetch_price_twelvedata(ticker)
         except Exception as e:
             print(f"Twelve Data failed for {ticker}, falling back to yfinance: {str(e)[:100]}")
     
     if PRICE_API_PROVIDER in ("finnhub", "finhub"):
         try:
+            _price_rate_limiter("finnhub").acquire()
             return _fetch_price_finnhub(ticker)
         except Exception as e:
             print(f"Finnhub failed for {ticker}, falling back to yfinance: {str(e)[:100]}")
     
-    # Fallback to yfinance (free, works for most tickers including European)
-    print(f"Attempting yfinance for {ticker}...")
+    return _fetch_price_yfinance_fallback(ticker)
+
+
+# Price refresh jobs run on a small thread pool so the HTTP request returns at
+# once. A ticker already being fetched for any user is shared through
+# _price_refresh_inflight instead of being requested twice.
+_price_refresh_lock = threading.Lock()
+_price_refresh_jobs: dict[str, dict] = {}
+_price_refresh_inflight: dict[str, Future] = {}
+_price_refresh_executor: ThreadPoolExecutor | None = None
+
+
+def _price_refresh_pool() -> ThreadPoolExecutor:
+    global _price_refresh_executor
+    with _price_refresh_lock:
+        if _price_refresh_executor is None:
+            _price_refresh_executor = ThreadPoolExecutor(
+                max_workers=max(PRICE_REFRESH_MAX_WORKERS, 1),
+                thread_name_prefix="price-refresh",
+            )
+        return _price_refresh_executor
+
+
+def _shutdown_price_refresh_pool() -> None:
+    """Stop the refresh pool and fail the jobs it leaves unfinished.
+
+    Cancelled fetches never resolve their futures, so jobs still waiting on
+    them are marked failed instead of staying running forever.
+    """
+    global _price_refresh_executor
+    with _price_refresh_lock:
+        executor = _price_refresh_executor
+        _price_refresh_executor = None
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+    now = datetime.utcnow().isoformat()
+    with _price_refresh_lock:
+        _price_refresh_inflight.clear()
+        for job in _price_refresh_jobs.values():
+            if job["status"] != "running":
+                continue
+            for item in job["items"].values():
+                if item["status"] == "pending":
+                    item.update(status="error", error="Price refresh interrupted by shutdown.")
+            job["status"] = "failed"
+            job["finished_at"] = now
+
+
+def _refresh_price_task(ticker: str, future: Future) -> None:
     try:
-        price_data = _fetch_ticker_price_yfinance(ticker)
-        if price_data and price_data.get("price"):
-            print(f"✓ yfinance success for {ticker}: {price_data['price']}")
-            return float(price_data["price"])
-    except Exception as e:
-        print(f"✗ yfinance also failed for {ticker}: {e}")
-    
-    raise HTTPException(status_code=400, detail=f"Price unavailable for {ticker}.")
+        price_value = _fetch_latest_price(ticker)
+        _upsert_price(ticker, price_value)
+        future.set_result(price_value)
+    except Exception as exc:
+        future.set_exception(exc)
+
+
+def _refresh_price_batch_task(tickers: list[str], futures: dict[str, Future]) -> None:
+    try:
+        _price_rate_limiter("twelvedata").acquire(len(tickers))
+        prices = _fetch_prices_twelvedata(tickers)
+    except Exception as exc:
+        logger.warning("Twelve Data batch failed, falling back per ticker: %.100s", exc)
+        prices = {}
+    for ticker in tickers:
+        future = futures[ticker]
+        try:
+            price_value = prices.get(ticker)
+            if price_value is None:
+                price_value = _fetch_price_yfinance_fallback(ticker)
+            _upsert_price(ticker, price_value)
+            future.set_result(price_value)
+        except Exception as exc:
+            future.set_exception(exc)
+
+
+def _record_price_refresh_result(job_id: str, ticker: str, future: Future) -> None:
+    exc = future.exception()
+    if exc is None:
+        result = {"ticker": ticker, "status": "updated", "price": future.result()}
+    else:
+        detail = exc.detail if isinstance(exc, HTTPException) else str(exc)
+        result = {"ticker": ticker, "status": "error", "error": detail}
+    with _price_refresh_lock:
+        if _price_refresh_inflight.get(ticker) is future:
+            _price_refresh_inflight.pop(ticker, None)
+        job = _price_refresh_jobs.get(job_id)
+        if not job or job["status"] != "running":
+            return
+        job["items"][ticker] = result
+        job["completed"] += 1
+        if job["completed"] >= job["total"]:
+            job["status"] = "completed"
+            job["finished_at"] = datetime.utcnow().isoformat()
+
+
+def _prune_price_refresh_jobs() -> None:
+    cutoff = datetime.utcnow() - timedelta(minutes=PRICE_REFRESH_JOB_TTL_MINUTES)
+    for job_id, job in list(_price_refresh_jobs.items()):
+        if job["status"] != "running" and _to_datetime(job["finished_at"]) < cutoff:
+            _price_refresh_jobs.pop(job_id, None)
+
+
+def _start_price_refresh_job(owner_email: str, tickers: list[str], force: bool) -> dict:
+    unique_tickers = list(dict.fromkeys(ticker.strip().upper() for ticker in tickers if ticker.strip()))
+    cache = _get_cached_prices(unique_tickers)
+    job_id = secrets.token_hex(12)
+    job = {
+        "id": job_id,
+        "owner_email": owner_email,
+        "status": "running",
+        "created_at": datetime.utcnow().isoformat(),
+        "finished_at": None,
+        "tickers": unique_tickers,
+        "items": {},
+        "completed": 0,
+        "total": len(unique_tickers),
+    }
+    subscriptions: list[tuple[str, Future]] = []
+    to_fetch: dict[str, Future] = {}
+    with _price_refresh_lock:
+        _prune_price_refresh_jobs()
+        _price_refresh_jobs[job_id] = job
+        for ticker in unique_tickers:
+            cached = cache.get(ticker)
+            if cached and _price_is_fresh(cached["updated_at"]) and not force:
+                job["items"][ticker] = {
+                    "ticker": ticker,
+                    "status": "cached",
+                    "price": cached["price"],
+                }
+                job["completed"] += 1
+                continue
+            job["items"][ticker] = {"ticker": ticker, "status": "pending"}
+            future = _price_refresh_inflight.get(ticker)
+            if future is None:
+                future = Future()
+                _price_refresh_inflight[ticker] = future
+                to_fetch[ticker] = future
+            subscriptions.append((ticker, future))
+        if job["completed"] >= job["total"]:
+            job["status"] = "completed"
+            job["finished_at"] = datetime.utcnow().isoformat()
+
+    pool = _price_refresh_pool()
+    pending = list(to_fetch)
+    if PRICE_API_PROVIDER == "twelvedata" and PRICE_API_KEY and len(pending) > 1:
+        batch_size = max(1, min(TWELVEDATA_BATCH_SIZE, int(_price_rate_limiter("twelvedata").capacity)))
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            pool.submit(_refresh_price_batch_task, batch, {ticker: to_fetch[ticker] for ticker in batch})
+    else:
+        for ticker in pending:
+            pool.submit(_refresh_price_task, ticker, to_fetch[ticker])
+    for ticker, future in subscriptions:
+        future.add_done_callback(
+            lambda done, job_id=job_id, ticker=ticker: _record_price_refresh_result(job_id, ticker, done)
+        )
+    return _price_refresh_job_view(job_id)
+
+
+def _price_refresh_job_view(job_id: str) -> dict | None:
+    with _price_refresh_lock:
+        job = _price_refresh_jobs.get(job_id)
+        if not job:
+            return None
+        total = job["total"]
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "created_at": job["created_at"],
+            "finished_at": job["finished_at"],
+            "total": total,
+            "completed": job["completed"],
+            "progress": int(job["completed"] / total * 100) if total else 100,
+            "items": [dict(job["items"][ticker]) for ticker in job["tickers"]],
+        }
+
+
+def _get_price_refresh_job(job_id: str, owner_email: str) -> dict | None:
+    with _price_refresh_lock:
+        job = _price_refresh_jobs.get(job_id)
+        if not job or job["owner_email"] != owner_email:
+            return None
+    return _price_refresh_job_view(job_id)
+
+
+def _aggregate_transactions_by_ticker(
+    transactions: list[dict], snapshot_date: str | None
+) -> dict[tuple[str, str | None, str], dict]:
+    aggregated: dict[tuple[str, str | None, str], dict] = {}
+    for tx in sorted(transactions, key=lambda item: item["trade_date"]):
+        if snapshot_date and _date_key(tx["trade_date"]) > snapshot_date:
+            continue
+        key = (tx["ticker"], tx["institution"], tx["category"])
+        state = aggregated.setdefault(
+            key,
+            {
+                "ticker": tx["ticker"],
+                "institution": tx["institution"],
+                "category": tx["category"],
+                "name": tx["name"],
+                "shares": 0.0,
+                "cost_basis": 0.0,
+            },
+        )
+        shares = float(tx["shares"] or 0)
+        price = float(tx["price"] or 0)
+        fee = float(tx["fee"] or 0) if tx["fee"] is not None else 0.0
+        operation = tx["operation"].strip().lower()
+        if operation == "buy":
+            state["shares"] += shares
+            state["cost_basis"] += shares * price + fee
+        elif operation == "sell":
+            if state["shares"] > 0:
+                avg_cost = state["cost_basis"] / state["shares"]
+                state["shares"] -= shares
+                state["cost_basis"] = max(state["cost_basis"] - avg_cost * shares, 0.0)
+        if tx["name"] and not state.get("name"):
+            state["name"] = tx["name"]
+    return aggregated
+
+
+def _holding_transaction_flows(
+    transactions: list[dict], snapshot_date: str | None
+) -> dict[tuple[str, str | None, str], list[tuple[date, float]]]:
+    """Cash flows per holding: buys (with fees) out, sells (net of fees) in."""
+    flows: dict[tuple[str, str | None, str], list[tuple[date, float]]] = {}
+    for tx in transactions:
+        trade_date = _date_key(tx["trade_date"])
+        if not trade_date or (snapshot_date and trade_date > snapshot_date):
+            continue
+        amount = float(tx["shares"] or 0) * float(tx["price"] or 0)
+        fee = float(tx["fee"] or 0) if tx["fee"] is not None else 0.0
+        operation = tx["operation"].strip().lower()
+        if operation == "buy":
+            amount = -(amount + fee)
+        elif operation == "sell":
+            amount -= fee
+        else:
+            continue
+        key = (tx["ticker"], tx["institution"], tx["category"])
+        flows.setdefault(key, []).append((date.fromisoformat(trade_date), amount))
+    return flows
+
+
+def _iter_ecb_rates(source: bytes | BinaryIO, filename: str) -> Iterator[tuple[str, str, float]]:
+    """(date, currency, units per EUR) from an ECB reference-rate XML or CSV file."""
+    stream = _spreadsheet_stream(source)
+    if filename.lower().endswith(".xml"):
+        rate_date = None
+        for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+            if not element.tag.endswith("Cube"):
+                continue
+            if event == "end":
+                if "time" in element.attrib:
+                    element.clear()
+                continue
+            if "time" in element.attrib:
+                rate_date = element.attrib["time"]
+            elif "currency" in element.attrib and rate_date:
+                try:
+                    rate = float(element.attrib.get("rate", ""))
+                except ValueError:
+                    continue
+                yield rate_date, element.attrib["currency"].strip().upper(), rate
+        return
+    rows = csv.reader(_iter_upload_lines(stream))
+    header = next(rows, None) or []
+    currencies = [cell.strip().upper() for cell in header[1:]]
+    for row in rows:
+        if not row:
+            continue
+        try:
+            rate_date = date.fromisoformat(row[0].strip()).isoformat()
+        except ValueError:
+            continue
+        for currency, value in zip(currencies, row[1:]):
+            try:
+                rate = float(value)
+            except ValueError:
+                # The ECB marks days without a fixing as N/A.
+                continue
+            if currency and rate > 0:
+                yield rate_date, currency, rate
+
+
+def _save_fx_rates(
+    rows: Iterable[tuple[str, str, float]], source: str, base: str = FX_BASE_CURRENCY
+) -> int:
+    with _db_connection() as conn:
+        cursor = conn.executemany(
+            """
+            INSERT INTO fx_rates (base, quote, rate_date, rate, source)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(base, quote, rate_date) DO UPDATE SET
+                rate = excluded.rate,
+                source = excluded.source
+            """,
+            ((base, quote, rate_date, rate, source) for rate_date, quote, rate in rows),
+        )
+        saved = cursor.rowcount
+    _invalidate_fx_rates()
+    return saved
 
 
-def _aggregate_transactions_by_ticker(
-    transactions: list[dict], snapshot_date: str | None
-) -> dict[tuple[str, str | None, str], dict]:
-    aggregated: dict[tuple[str, str | None, str], dict] = {}
+def _fetch_fx_rates() -> int:
+    try:
+        with urllib.request.urlopen(FX_RATES_URL, timeout=10) as response:
+            payload = response.read()
+    except urllib.error.URLError as exc:
+        raise HTTPException(status_code=502, detail="FX rate provider unavailable.") from exc
+    try:
+        saved = _save_fx_rates(_iter_ecb_rates(payload, FX_RATES_URL), "ecb")
+    except ElementTree.ParseError as exc:
+        raise HTTPException(status_code=502, detail="Invalid FX rate provider response.") from exc
+    if not saved:
+        raise HTTPException(status_code=502, detail="FX rate provider returned no rates.")
+    return saved
+
+
+def _fill_forward(values: np.ndarray) -> np.ndarray:
+    """Replace NaNs with the last known value above them in the same column."""
+    positions = np.arange(len(values))[:, None]
+    last_known = np.maximum.accumulate(np.where(np.isnan(values), 0, positions), axis=0)
+    return values[last_known, np.arange(values.shape[1])]
+
+
+class _FxRateMatrix:
+    """Units of each currency per EUR on a dense daily grid.
+
+    Row i holds the rates of day first_day + i, carried forward over weekends
+    and holidays, so a lookup is plain indexing. Dates outside the loaded
+    range use the nearest loaded day; currencies never loaded fall back to
+    FALLBACK_FX_RATES.
+    """
+
+    def __init__(self, rows: list[tuple[str, str, float]]) -> None:
+        fallback = {
+            currency: rate / FALLBACK_FX_RATES[FX_BASE_CURRENCY]
+            for currency, rate in FALLBACK_FX_RATES.items()
+        }
+        currencies = sorted({quote for _, quote, _ in rows} | set(fallback))
+        self.index = {currency: column for column, currency in enumerate(currencies)}
+        days = np.array([date.fromisoformat(row[0]).toordinal() for row in rows], dtype=np.int64)
+        today = datetime.utcnow().date().toordinal()
+        self.first_day = int(days.min()) if rows else today
+        self.last_day = int(days.max()) if rows else today
+        rates = np.full((self.last_day - self.first_day + 1, len(currencies)), np.nan)
+        if rows:
+            columns = np.array([self.index[quote] for _, quote, _ in rows])
+            rates[days - self.first_day, columns] = [rate for _, _, rate in rows]
+        rates[:, self.index[FX_BASE_CURRENCY]] = 1.0
+        # Carry each rate forward, then back-fill days before a currency's first fixing.
+        self.rates = _fill_forward(_fill_forward(rates)[::-1])[::-1]
+        for currency, rate in fallback.items():
+            column = self.index[currency]
+            if np.isnan(self.rates[:, column]).all():
+                self.rates[:, column] = rate
+
+    def convert(
+        self,
+        amounts: Iterable[float],
+        from_currencies: Iterable[str | None],
+        to_currency: str,
+        on: date | Iterable[date] | None = None,
+    ) -> np.ndarray:
+        """Convert every amount in one pass; `on` is one date or one per amount."""
+        amounts = np.asarray(list(amounts), dtype=float)
+        if on is None:
+            days = np.full(len(amounts), self.last_day)
+        elif isinstance(on, date):
+            days = np.full(len(amounts), on.toordinal())
+        else:
+            days = np.array([value.toordinal() for value in on], dtype=np.int64)
+        rows = np.clip(days - self.first_day, 0, len(self.rates) - 1)
+        sources = np.array(
+            [self.index.get((currency or "").upper(), -1) for currency in from_currencies],
+            dtype=np.int64,
+        )
+        target = self.index.get((to_currency or "").upper(), -1)
+        if target < 0:
+            return amounts
+        known = sources >= 0
+        factors = np.ones(len(amounts))
+        factors[known] = self.rates[rows[known], target] / self.rates[rows[known], sources[known]]
+        return amounts * factors
+
+
+_fx_matrix: tuple[float, _FxRateMatrix] | None = None
+_fx_matrix_lock = threading.Lock()
+
+
+def _fx_rates() -> _FxRateMatrix:
+    """The rate matrix, rebuilt after loads and at most every FX_RATES_CACHE_SECONDS."""
+    global _fx_matrix
+    with _fx_matrix_lock:
+        if _fx_matrix and _fx_matrix[0] > time.monotonic():
+            return _fx_matrix[1]
+    with _db_connection() as conn:
+        rows = [
+            (row["rate_date"], row["quote"], row["rate"])
+            for row in conn.execute(
+                "SELECT rate_date, quote, rate FROM fx_rates WHERE base = ?",
+                (FX_BASE_CURRENCY,),
+            )
+        ]
+    matrix = _FxRateMatrix(rows)
+    with _fx_matrix_lock:
+        _fx_matrix = (time.monotonic() + FX_RATES_CACHE_SECONDS, matrix)
+    return matrix
+
+
+def _invalidate_fx_rates() -> None:
+    global _fx_matrix
+    with _fx_matrix_lock:
+        _fx_matrix = None
+
+
+def _holding_position_deltas(
+    transactions: list[dict],
+) -> list[tuple[str, str, float, float, float]]:
+    """(ticker, trade date, shares delta, cost basis delta, price) per trade.
+
+    Replays the trades the way _aggregate_transactions_by_ticker does, so the
+    cumulative sums match its shares and cost basis on every date.
+    """
+    state: dict[tuple[str, str | None, str], list[float]] = {}
+    deltas = []
     for tx in sorted(transactions, key=lambda item: item["trade_date"]):
-        if snapshot_date and _date_key(tx["trade_date"]) > snapshot_date:
+        trade_date = _date_key(tx["trade_date"])
+        if not trade_date:
             continue
-        key = (tx["ticker"], tx["institution"], tx["category"])
-        state = aggregated.setdefault(
-            key,
-            {
-                "ticker": tx["ticker"],
-                "institution": tx["institution"],
-                "category": tx["category"],
-                "name": tx["name"],
-                "shares": 0.0,
-                "cost_basis": 0.0,
-            },
-        )
+        position = state.setdefault((tx["ticker"], tx["institution"], tx["category"]), [0.0, 0.0])
         shares = float(tx["shares"] or 0)
         price = float(tx["price"] or 0)
         fee = float(tx["fee"] or 0) if tx["fee"] is not None else 0.0
         operation = tx["operation"].strip().lower()
         if operation == "buy":
-            state["shares"] += shares
-            state["cost_basis"] += shares * price + fee
-        elif operation == "sell":
-            if state["shares"] > 0:
-                avg_cost = state["cost_basis"] / state["shares"]
-                state["shares"] -= shares
-                state["cost_basis"] = max(state["cost_basis"] - avg_cost * shares, 0.0)
-        if tx["name"] and not state.get("name"):
-            state["name"] = tx["name"]
-    return aggregated
+            share_delta, cost_delta = shares, shares * price + fee
+        elif operation == "sell" and position[0] > 0:
+            avg_cost = position[1] / position[0]
+            share_delta = -shares
+            cost_delta = max(position[1] - avg_cost * shares, 0.0) - position[1]
+        else:
+            continue
+        position[0] += share_delta
+        position[1] += cost_delta
+        deltas.append((tx["ticker"].upper(), trade_date, share_delta, cost_delta, price))
+    return deltas
 
 
-def _convert_currency(amount: float, from_currency: str, to_currency: str) -> float:
-    """Convert currency amount using simple fixed rates.
-    In production, this should use a real exchange rate API."""
-    if not amount or from_currency == to_currency:
-        return amount
-    
-    # Fixed rates (USD as base)
-    rates = {
-        "USD": 1.0,
-        "EUR": 0.92,  # 1 USD = 0.92 EUR
-        "GBP": 0.79,
-        "CHF": 0.85,
-        "JPY": 149.0,
+def _period_ends(days: np.ndarray, freq: str) -> np.ndarray:
+    """Indexes of the last day of each day/week/month in days; the final day always counts."""
+    if freq == "daily":
+        return np.arange(len(days))
+    # datetime64 weeks start on Thursday (the epoch), so shift to Monday-based weeks.
+    keys = (days.astype("datetime64[M]") if freq == "monthly" else (days - 4).astype("datetime64[W]"))
+    return np.flatnonzero(np.append(keys[1:] != keys[:-1], True))
+
+
+def _compute_holdings_value_history(
+    portfolio_id: int, start: str | None, end: str, freq: str, currency: str
+) -> dict:
+    transactions = _list_holding_transactions(portfolio_id)
+    deltas = [delta for delta in _holding_position_deltas(transactions) if delta[1] <= end]
+    if not start:
+        start = min((delta[1] for delta in deltas), default=end)
+    empty = {"from": start, "to": end, "freq": freq, "currency": currency}
+    if not deltas or start > end:
+        return {**empty, "tickers": [], "items": [], "series": {}}
+
+    tickers = sorted({delta[0] for delta in deltas})
+    columns = {ticker: column for column, ticker in enumerate(tickers)}
+    days = np.arange(np.datetime64(start), np.datetime64(end) + 1)
+    first_day = date.fromisoformat(start).toordinal()
+
+    def rows_for(dates: list[str]) -> np.ndarray:
+        ordinals = np.array([date.fromisoformat(value).toordinal() for value in dates], dtype=np.int64)
+        # Anything before the window lands on its first row.
+        return np.clip(ordinals - first_day, 0, len(days) - 1)
+
+    # Positions: scatter the per-trade deltas onto (day, ticker), then accumulate.
+    trade_rows = rows_for([delta[1] for delta in deltas])
+    trade_columns = np.array([columns[delta[0]] for delta in deltas])
+    shares = np.zeros((len(days), len(tickers)))
+    cost_basis = np.zeros((len(days), len(tickers)))
+    np.add.at(shares, (trade_rows, trade_columns), [delta[2] for delta in deltas])
+    np.add.at(cost_basis, (trade_rows, trade_columns), [delta[3] for delta in deltas])
+    shares = np.cumsum(shares, axis=0)
+    cost_basis = np.cumsum(cost_basis, axis=0)
+
+    # Prices: trade prices are observations too, but a stored close on the same
+    # day wins. Observations are ordered so the one to keep comes last.
+    as_of = _prices_as_of(tickers, start)
+    history = _load_price_history(tickers, start, end)
+    observations = [(delta[1], 0, delta[0], delta[4]) for delta in deltas if delta[4] > 0]
+    observations += [(price["date"], 1, ticker, price["close"]) for ticker, price in as_of.items()]
+    observations += [(price_date, 1, ticker, close) for ticker, price_date, close, _ in history]
+    observations.sort()
+    flat = rows_for([item[0] for item in observations]) * len(tickers) + np.array(
+        [columns[item[2]] for item in observations]
+    )
+    _, last_from_end = np.unique(flat[::-1], return_index=True)
+    keep = len(flat) - 1 - last_from_end
+    prices = np.full(len(days) * len(tickers), np.nan)
+    prices[flat[keep]] = np.array([item[3] for item in observations])[keep]
+    prices = _fill_forward(prices.reshape(len(days), len(tickers)))
+
+    # Closes are in the ticker currency; convert each currency's columns at the daily rate.
+    metadata = _list_holdings_metadata(portfolio_id)
+    price_currency = {ticker: price["currency"] for ticker, price in as_of.items()}
+    price_currency.update({ticker: row_currency for ticker, _, _, row_currency in history if row_currency})
+    ticker_currency = [
+        (metadata.get(ticker, {}).get("currency") or price_currency.get(ticker) or "USD").upper()
+        for ticker in tickers
+    ]
+    fx = _fx_rates()
+    on = days.astype(object)
+    for source_currency in set(ticker_currency) - {currency}:
+        factors = fx.convert(np.ones(len(days)), [source_currency] * len(days), currency, on)
+        mask = np.array([value == source_currency for value in ticker_currency])
+        prices[:, mask] *= factors[:, None]
+
+    values = np.where(shares > 0, shares * np.nan_to_num(prices), 0.0)
+    sampled = _period_ends(days, freq)
+    totals = values[sampled].sum(axis=1).round(2).tolist()
+    invested = cost_basis[sampled].sum(axis=1).round(2).tolist()
+    return {
+        **empty,
+        "tickers": tickers,
+        "items": [
+            {"date": str(day), "value": value, "invested": spent}
+            for day, value, spent in zip(days[sampled], totals, invested)
+        ],
+        "series": {
+            ticker: values[sampled, column].round(2).tolist()
+            for ticker, column in columns.items()
+        },
     }
-    
-    from_rate = rates.get(from_currency, 1.0)
-    to_rate = rates.get(to_currency, 1.0)
-    
-    # Convert to USD first, then to target currency
-    amount_usd = amount / from_rate
-    return amount_usd * to_rate
+
+
+_holdings_history_cache: dict[int, tuple[tuple[int, int], OrderedDict]] = {}
+_holdings_history_lock = threading.Lock()
+
+
+def _holdings_value_history(
+    portfolio_id: int, start: str | None, end: str, freq: str, currency: str
+) -> dict:
+    """Market value of the portfolio's transactions over time, cached per portfolio.
+
+    Entries are dropped once the portfolio's data version (bumped by triggers on
+    holding_transactions) or the market data version (prices and FX rates) moves.
+    """
+    with _db_connection() as conn:
+        row = conn.execute("SELECT version FROM market_data_version WHERE id = 1").fetchone()
+        stamp = (_portfolio_data_version(conn, portfolio_id), int(row["version"]) if row else 0)
+    key = (start, end, freq, currency)
+    with _holdings_history_lock:
+        cached = _holdings_history_cache.get(portfolio_id)
+        if cached and cached[0] == stamp and key in cached[1]:
+            cached[1].move_to_end(key)
+            return cached[1][key]
+    result = _compute_holdings_value_history(portfolio_id, start, end, freq, currency)
+    with _holdings_history_lock:
+        cached = _holdings_history_cache.get(portfolio_id)
+        if not cached or cached[0] != stamp:
+            cached = _holdings_history_cache[portfolio_id] = (stamp, OrderedDict())
+        cached[1][key] = result
+        while len(cached[1]) > HOLDINGS_HISTORY_CACHE_ENTRIES:
+            cached[1].popitem(last=False)
+    return result
+
+
+def _clear_holdings_history_cache() -> None:
+    with _holdings_history_lock:
+        _holdings_history_cache.clear()
 
 
 def _list_holdings_for_portfolio(
@@ -6860,10 +10209,9 @@ def _list_holdings_for_portfolio(
         ).fetchone()
         portfolio_currency = portfolio_row["currency"] if portfolio_row else "USD"
     
-    history_items = _list_portfolio_history(portfolio_id, category_settings)
-    if not history_items:
+    latest_snapshot = _latest_history_date(portfolio_id)
+    if not latest_snapshot:
         return {"items": [], "total_value": 0.0}
-    latest_snapshot = history_items[-1]["date"]
     holdings: dict[tuple[str, str | None, str], dict] = {}
 
     with _db_connection() as conn:
@@ -6937,6 +10285,7 @@ def _list_holdings_for_portfolio(
             for row in tx_rows
         ]
         aggregated = _aggregate_transactions_by_ticker(transactions, latest_snapshot)
+        transaction_flows = _holding_transaction_flows(transactions, latest_snapshot)
         for key, state in aggregated.items():
             if state["shares"] <= 0:
                 continue
@@ -6959,6 +10308,7 @@ def _list_holdings_for_portfolio(
                     else 0.0,
                     "current_price": None,
                     "source": "manual",
+                    "flows": transaction_flows.get(key, []),
                 }
 
     metadata_map = _list_holdings_metadata(portfolio_id)
@@ -7007,22 +10357,34 @@ def _list_holdings_for_portfolio(
     # No auto-refresh - only use cached prices
     # User must click "Update All" button to refresh prices via /holdings/refresh-prices endpoint
 
-    items = []
-    total_value = 0.0
+    prices = []
+    # The XIRR terminal value is dated when its price was observed, as in _calculate_irr.
+    valued_on = []
+    today = datetime.utcnow().date()
     for entry in filtered_entries:
-        cache_key = entry["ticker"].upper()
-        price_info = price_cache.get(cache_key)
-        cached_price = (
-            price_info["price"] if price_info and _price_is_fresh(price_info["updated_at"]) else None
-        )
+        price_info = price_cache.get(entry["ticker"].upper())
+        cached_price = None
+        if price_info and _price_is_fresh(price_info["updated_at"]):
+            cached_price = price_info["price"]
+            valued_on.append(_to_datetime(price_info["updated_at"]).date())
+        else:
+            valued_on.append(today)
         if cached_price is None:
             cached_price = entry["current_price"] or entry["avg_price"]
-        
-        # Convert price to portfolio currency if needed
-        ticker_currency = entry.get("ticker_currency") or "USD"
-        if cached_price and ticker_currency != portfolio_currency:
-            cached_price = _convert_currency(cached_price, ticker_currency, portfolio_currency)
-        
+        prices.append(float(cached_price or 0))
+    # Prices are in the ticker currency; convert them all in one pass.
+    fx = _fx_rates()
+    prices = fx.convert(
+        prices,
+        [entry.get("ticker_currency") or "USD" for entry in filtered_entries],
+        portfolio_currency,
+    )
+
+    items = []
+    total_value = 0.0
+    flow_series: list[list[tuple[date, float]]] = []
+    flow_items: list[dict] = []
+    for entry, cached_price, valuation_date in zip(filtered_entries, prices.tolist(), valued_on):
         current_value = float(entry["shares"] or 0) * float(cached_price or 0)
         avg_price = (
             float(entry["cost_basis"] or 0) / float(entry["shares"] or 1)
@@ -7056,9 +10418,28 @@ def _list_holdings_for_portfolio(
             "asset_type": entry.get("asset_type"),
             "tags": sorted(entry.get("tags", []), key=str.lower),
             "source": entry.get("source"),
+            "money_weighted_return": None,
         }
         items.append(item)
         total_value += current_value
+        # Imported positions carry no trade dates, so only fully manual holdings get an XIRR.
+        if entry.get("flows") and current_value > 0:
+            # Trade amounts are in the ticker currency; convert each at its trade date.
+            flow_dates = [flow_date for flow_date, _ in entry["flows"]]
+            amounts = fx.convert(
+                [amount for _, amount in entry["flows"]],
+                [entry.get("ticker_currency") or "USD"] * len(flow_dates),
+                portfolio_currency,
+                flow_dates,
+            )
+            flow_series.append(
+                [*zip(flow_dates, amounts.tolist()), (valuation_date, current_value)]
+            )
+            flow_items.append(item)
+
+    for item, rate in zip(flow_items, _xirr_batch(flow_series)):
+        if rate is not None:
+            item["money_weighted_return"] = round(rate * 100, 2)
 
     items.sort(key=lambda value: value["current_value"], reverse=True)
     for item in items:
@@ -7457,173 +10838,98 @@ def _list_institutions(
 
 
 def _list_portfolio_monthly_history(portfolio_id: int) -> list[dict]:
-    latest_santander: dict[str, tuple[datetime, float]] = {}
-    latest_trade: dict[str, tuple[datetime, float]] = {}
-    latest_save: dict[str, tuple[datetime, float]] = {}
-    latest_aforronet: dict[str, tuple[datetime, float]] = {}
-    latest_bancoinvest: dict[str, tuple[datetime, float]] = {}
-    latest_xtb: dict[str, dict[str, tuple[datetime, float]]] = {}
-
+    """Month-end totals: latest snapshot per month per source (per XTB account), summed."""
     with _db_connection() as conn:
         rows = conn.execute(
             """
-            SELECT imp.imported_at AS imported_at,
-                   SUM(items.balance) AS total
-            FROM santander_imports AS imp
-            JOIN santander_items AS items ON items.import_id = imp.id
-            WHERE imp.portfolio_id = ?
-            GROUP BY imp.id
+            WITH snapshots AS (
+                SELECT 'santander' AS source, '' AS account, imp.id AS id,
+                       imp.snapshot_at AS snapshot_at, SUM(items.balance) AS total
+                FROM santander_imports AS imp
+                JOIN santander_items AS items ON items.import_id = imp.id
+                WHERE imp.portfolio_id = :portfolio_id AND imp.snapshot_at IS NOT NULL
+                GROUP BY imp.id
+                UNION ALL
+                SELECT 'trade_republic', '', id, snapshot_at, value
+                FROM trade_republic_entries
+                WHERE portfolio_id = :portfolio_id AND snapshot_at IS NOT NULL
+                UNION ALL
+                SELECT 'save_ngrow', '', id, snapshot_at, current_value_total
+                FROM save_ngrow_imports
+                WHERE portfolio_id = :portfolio_id AND snapshot_at IS NOT NULL
+                UNION ALL
+                SELECT 'save_ngrow', '', id, snapshot_at, current_value
+                FROM save_ngrow_entries
+                WHERE portfolio_id = :portfolio_id AND snapshot_at IS NOT NULL
+                  AND NOT EXISTS (
+                      SELECT 1 FROM save_ngrow_imports WHERE portfolio_id = :portfolio_id
+                  )
+                UNION ALL
+                SELECT 'aforronet', '', id, snapshot_at, current_value_total
+                FROM aforronet_imports
+                WHERE portfolio_id = :portfolio_id AND snapshot_at IS NOT NULL
+                UNION ALL
+                SELECT 'bancoinvest', '', imp.id, imp.snapshot_at, SUM(items.current_value)
+                FROM bancoinvest_imports AS imp
+                JOIN bancoinvest_items AS items ON items.import_id = imp.id
+                WHERE imp.portfolio_id = :portfolio_id AND imp.snapshot_at IS NOT NULL
+                GROUP BY imp.id
+                UNION ALL
+                SELECT 'xtb', COALESCE(account_type, ''), id, snapshot_at, current_value
+                FROM xtb_imports
+                WHERE portfolio_id = :portfolio_id AND snapshot_at IS NOT NULL
+            ),
+            ranked AS (
+                SELECT substr(snapshot_at, 1, 7) AS month,
+                       total,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY source, account, substr(snapshot_at, 1, 7)
+                           ORDER BY snapshot_at DESC, id
+                       ) AS position
+                FROM snapshots
+            )
+            SELECT month, SUM(COALESCE(total, 0)) AS total
+            FROM ranked
+            WHERE position = 1
+            GROUP BY month
+            ORDER BY month
             """,
-            (portfolio_id,),
+            {"portfolio_id": portfolio_id},
         ).fetchall()
-        for row in rows:
-            month = _month_key(row["imported_at"])
-            if not month:
-                continue
-            timestamp = _to_datetime(row["imported_at"])
-            total = float(row["total"] or 0)
-            current = latest_santander.get(month)
-            if not current or timestamp > current[0]:
-                latest_santander[month] = (timestamp, total)
+    return [{"month": row["month"], "total": round(float(row["total"]), 2)} for row in rows]
 
-        rows = conn.execute(
-            """
-            SELECT COALESCE(snapshot_date, created_at) AS date_value, value
-            FROM trade_republic_entries
-            WHERE portfolio_id = ?
-            """,
-            (portfolio_id,),
-        ).fetchall()
-        for row in rows:
-            month = _month_key(row["date_value"])
-            if not month:
-                continue
-            timestamp = _to_datetime(row["date_value"])
-            total = float(row["value"] or 0)
-            current = latest_trade.get(month)
-            if not current or timestamp > current[0]:
-                latest_trade[month] = (timestamp, total)
 
-        save_imports = conn.execute(
-            """
-            SELECT COALESCE(snapshot_date, created_at) AS date_value,
-                   current_value_total AS total
-            FROM save_ngrow_imports
-            WHERE portfolio_id = ?
-            """,
-            (portfolio_id,),
-        ).fetchall()
-        save_entries = []
-        if not save_imports:
-            save_entries = conn.execute(
-                """
-                SELECT COALESCE(snapshot_date, created_at) AS date_value,
-                       current_value AS total
-                FROM save_ngrow_entries
-                WHERE portfolio_id = ?
-                """,
-                (portfolio_id,),
-            ).fetchall()
-        for row in save_imports or save_entries:
-            month = _month_key(row["date_value"])
-            if not month:
-                continue
-            timestamp = _to_datetime(row["date_value"])
-            total = float(row["total"] or 0)
-            current = latest_save.get(month)
-            if not current or timestamp > current[0]:
-                latest_save[month] = (timestamp, total)
+# Save'n'Grow per-item imports supersede the older single-entry rows.
+_HISTORY_ENTRIES_FILTER = """
+    portfolio_id = ?
+    AND (
+        source != 'save_ngrow_entries'
+        OR NOT EXISTS (SELECT 1 FROM save_ngrow_imports WHERE portfolio_id = ?)
+    )
+"""
 
-        rows = conn.execute(
-            """
-            SELECT COALESCE(snapshot_date, created_at) AS date_value,
-                   current_value_total AS total
-            FROM aforronet_imports
-            WHERE portfolio_id = ?
-            """,
-            (portfolio_id,),
-        ).fetchall()
-        for row in rows:
-            month = _month_key(row["date_value"])
-            if not month:
-                continue
-            timestamp = _to_datetime(row["date_value"])
-            total = float(row["total"] or 0)
-            current = latest_aforronet.get(month)
-            if not current or timestamp > current[0]:
-                latest_aforronet[month] = (timestamp, total)
 
-        rows = conn.execute(
-            """
-            SELECT COALESCE(imp.snapshot_date, imp.imported_at) AS date_value,
-                   SUM(items.current_value) AS total
-            FROM bancoinvest_imports AS imp
-            JOIN bancoinvest_items AS items ON items.import_id = imp.id
-            WHERE imp.portfolio_id = ?
-            GROUP BY imp.id
-            """,
-            (portfolio_id,),
-        ).fetchall()
-        for row in rows:
-            month = _month_key(row["date_value"])
-            if not month:
-                continue
-            timestamp = _to_datetime(row["date_value"])
-            total = float(row["total"] or 0)
-            current = latest_bancoinvest.get(month)
-            if not current or timestamp > current[0]:
-                latest_bancoinvest[month] = (timestamp, total)
+def _max_history_date(conn: sqlite3.Connection, portfolio_id: int) -> str | None:
+    row = conn.execute(
+        f"""
+        SELECT MAX(date_key) AS date_key
+        FROM portfolio_history_entries
+        WHERE {_HISTORY_ENTRIES_FILTER}
+        """,
+        (portfolio_id, portfolio_id),
+    ).fetchone()
+    return row["date_key"] if row else None
 
-        rows = conn.execute(
-            """
-            SELECT account_type, imported_at, current_value
-            FROM xtb_imports
-            WHERE portfolio_id = ?
-            """,
-            (portfolio_id,),
-        ).fetchall()
-        for row in rows:
-            month = _month_key(row["imported_at"])
-            if not month:
-                continue
-            timestamp = _to_datetime(row["imported_at"])
-            total = float(row["current_value"] or 0)
-            month_accounts = latest_xtb.setdefault(month, {})
-            current = month_accounts.get(row["account_type"])
-            if not current or timestamp > current[0]:
-                month_accounts[row["account_type"]] = (timestamp, total)
-
-    months = set()
-    months.update(latest_santander.keys())
-    months.update(latest_trade.keys())
-    months.update(latest_save.keys())
-    months.update(latest_aforronet.keys())
-    months.update(latest_bancoinvest.keys())
-    months.update(latest_xtb.keys())
 
-    items: list[dict] = []
-    for month in months:
-        total = 0.0
-        if month in latest_santander:
-            total += latest_santander[month][1]
-        if month in latest_trade:
-            total += latest_trade[month][1]
-        if month in latest_save:
-            total += latest_save[month][1]
-        if month in latest_aforronet:
-            total += latest_aforronet[month][1]
-        if month in latest_bancoinvest:
-            total += latest_bancoinvest[month][1]
-        if month in latest_xtb:
-            total += sum(value for _, value in latest_xtb[month].values())
-        items.append({"month": month, "total": round(total, 2)})
-    items.sort(key=lambda item: item["month"])
-    return items
+def _latest_history_date(portfolio_id: int) -> str | None:
+    with _db_connection() as conn:
+        return _max_history_date(conn, portfolio_id)
 
 
 def _list_portfolio_history(
     portfolio_id: int,
     category_settings: dict[str, bool],
+    since: str | None = None,
 ) -> list[dict]:
     history: dict[str, dict[str, float | str]] = {}
 
@@ -7668,172 +10974,27 @@ def _list_portfolio_history(
 
     with _db_connection() as conn:
         rows = conn.execute(
-            """
-            SELECT imp.imported_at AS imported_at,
-                   items.category AS category,
-                   SUM(items.balance) AS total,
-                   SUM(COALESCE(items.invested, 0)) AS invested
-            FROM santander_imports AS imp
-            JOIN santander_items AS items ON items.import_id = imp.id
-            WHERE imp.portfolio_id = ?
-            GROUP BY imp.id, items.category
-            """,
-            (portfolio_id,),
-        ).fetchall()
-        for row in rows:
-            date_key = _date_key(row["imported_at"])
-            if not date_key:
-                continue
-            entry = ensure_row(date_key)
-            amount = float(row["total"] or 0)
-            entry["total"] = float(entry["total"]) + amount
-            bucket = category_bucket(row["category"])
-            if bucket:
-                entry[bucket] = float(entry[bucket]) + amount
-            if is_investment(row["category"]):
-                entry["invested"] = float(entry["invested"]) + float(row["invested"] or 0)
-
-        rows = conn.execute(
-            """
-            SELECT COALESCE(snapshot_date, created_at) AS date_value,
-                   category,
-                   value,
-                   invested
-            FROM trade_republic_entries
-            WHERE portfolio_id = ?
-            """,
-            (portfolio_id,),
-        ).fetchall()
-        for row in rows:
-            date_key = _date_key(row["date_value"])
-            if not date_key:
-                continue
-            category = row["category"] or "Cash"
-            entry = ensure_row(date_key)
-            amount = float(row["value"] or 0)
-            entry["total"] = float(entry["total"]) + amount
-            bucket = category_bucket(category)
-            if bucket:
-                entry[bucket] = float(entry[bucket]) + amount
-            if is_investment(category):
-                entry["invested"] = float(entry["invested"]) + float(row["invested"] or 0)
-
-        save_import_exists = conn.execute(
-            "SELECT 1 FROM save_ngrow_imports WHERE portfolio_id = ? LIMIT 1",
-            (portfolio_id,),
-        ).fetchone()
-        if save_import_exists:
-            rows = conn.execute(
-                """
-                SELECT COALESCE(imp.snapshot_date, imp.created_at) AS date_value,
-                       items.category AS category,
-                       SUM(items.current_value) AS total,
-                       SUM(COALESCE(items.invested, 0)) AS invested
-                FROM save_ngrow_imports AS imp
-                JOIN save_ngrow_items AS items ON items.import_id = imp.id
-                WHERE imp.portfolio_id = ?
-                GROUP BY imp.id, items.category
-                """,
-                (portfolio_id,),
-            ).fetchall()
-        else:
-            rows = conn.execute(
-                """
-                SELECT COALESCE(snapshot_date, created_at) AS date_value,
-                       current_value AS total,
-                       invested AS invested
-                FROM save_ngrow_entries
-                WHERE portfolio_id = ?
-                """,
-                (portfolio_id,),
-            ).fetchall()
-        for row in rows:
-            date_key = _date_key(row["date_value"])
-            if not date_key:
-                continue
-            category = row["category"] if "category" in row.keys() else "Retirement Plans"
-            entry = ensure_row(date_key)
-            amount = float(row["total"] or 0)
-            entry["total"] = float(entry["total"]) + amount
-            bucket = category_bucket(category)
-            if bucket:
-                entry[bucket] = float(entry[bucket]) + amount
-            if is_investment(category):
-                entry["invested"] = float(entry["invested"]) + float(row["invested"] or 0)
-
-        rows = conn.execute(
-            """
-            SELECT COALESCE(snapshot_date, created_at) AS date_value,
-                   current_value_total AS total,
-                   invested_total AS invested,
-                   category
-            FROM aforronet_imports
-            WHERE portfolio_id = ?
-            """,
-            (portfolio_id,),
-        ).fetchall()
-        for row in rows:
-            date_key = _date_key(row["date_value"])
-            if not date_key:
-                continue
-            category = row["category"] or "Emergency Funds"
-            entry = ensure_row(date_key)
-            amount = float(row["total"] or 0)
-            entry["total"] = float(entry["total"]) + amount
-            bucket = category_bucket(category)
-            if bucket:
-                entry[bucket] = float(entry[bucket]) + amount
-            if is_investment(category):
-                entry["invested"] = float(entry["invested"]) + float(row["invested"] or 0)
-
-        rows = conn.execute(
-            """
-            SELECT COALESCE(imp.snapshot_date, imp.imported_at) AS date_value,
-                   items.category AS category,
-                   SUM(items.current_value) AS total,
-                   SUM(COALESCE(items.invested, 0)) AS invested
-            FROM bancoinvest_imports AS imp
-            JOIN bancoinvest_items AS items ON items.import_id = imp.id
-            WHERE imp.portfolio_id = ?
-            GROUP BY imp.id, items.category
-            """,
-            (portfolio_id,),
-        ).fetchall()
-        for row in rows:
-            date_key = _date_key(row["date_value"])
-            if not date_key:
-                continue
-            category = row["category"] or "Retirement Plans"
-            entry = ensure_row(date_key)
-            amount = float(row["total"] or 0)
-            entry["total"] = float(entry["total"]) + amount
-            bucket = category_bucket(category)
-            if bucket:
-                entry[bucket] = float(entry[bucket]) + amount
-            if is_investment(category):
-                entry["invested"] = float(entry["invested"]) + float(row["invested"] or 0)
-
-        rows = conn.execute(
-            """
-            SELECT imported_at, category, current_value, invested
-            FROM xtb_imports
-            WHERE portfolio_id = ?
+            f"""
+            SELECT date_key,
+                   category,
+                   SUM(total) AS total,
+                   SUM(invested) AS invested
+            FROM portfolio_history_entries
+            WHERE {_HISTORY_ENTRIES_FILTER}
+              AND date_key >= ?
+            GROUP BY date_key, category
             """,
-            (portfolio_id,),
+            (portfolio_id, portfolio_id, since or ""),
         ).fetchall()
-        for row in rows:
-            date_key = _date_key(row["imported_at"])
-            if not date_key:
-                continue
-            category = row["category"] or "Stocks"
-            entry = ensure_row(date_key)
-            amount = float(row["current_value"] or 0)
-            entry["total"] = float(entry["total"]) + amount
-            bucket = category_bucket(category)
-            if bucket:
-                entry[bucket] = float(entry[bucket]) + amount
-            if is_investment(category):
-                entry["invested"] = float(entry["invested"]) + float(row["invested"] or 0)
+    for row in rows:
+        entry = ensure_row(row["date_key"])
+        amount = float(row["total"] or 0)
+        entry["total"] = float(entry["total"]) + amount
+        bucket = category_bucket(row["category"])
+        if bucket:
+            entry[bucket] = float(entry[bucket]) + amount
+        if is_investment(row["category"]):
+            entry["invested"] = float(entry["invested"]) + float(row["invested"] or 0)
 
     items = []
     for date_key, row in history.items():
@@ -8031,9 +11192,100 @@ def _aggregate_snapshot_totals(
     return totals, total_invested, total_profit
 
 
+def _portfolio_data_version(conn: sqlite3.Connection, portfolio_id: int) -> int:
+    row = conn.execute(
+        "SELECT version FROM portfolio_data_versions WHERE portfolio_id = ?",
+        (portfolio_id,),
+    ).fetchone()
+    return int(row["version"]) if row else 0
+
+
+def _portfolio_history_revision(conn: sqlite3.Connection, portfolio_id: int) -> int:
+    row = conn.execute(
+        "SELECT revision FROM portfolio_history_revisions WHERE portfolio_id = ?",
+        (portfolio_id,),
+    ).fetchone()
+    return int(row["revision"]) if row else 0
+
+
+def _category_settings_hash(category_settings: dict[str, bool]) -> str:
+    payload = json.dumps(sorted(category_settings.items()))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
 def _aggregate_latest_totals(
     portfolio_id: int,
     category_settings: dict[str, bool],
+) -> tuple[dict[str, float], float, float, float, bool]:
+    """Latest totals served from portfolio_latest_totals.
+
+    The row is rebuilt by _sync_latest_totals when the writing transaction
+    commits. A missing or stale row (settings other than the stored ones) is
+    computed in memory; reads never write.
+    """
+    settings_hash = _category_settings_hash(category_settings)
+    with _db_connection() as conn:
+        row = conn.execute(
+            """
+            SELECT totals.totals_json,
+                   totals.total_invested,
+                   totals.total_profit,
+                   totals.investment_current_total,
+                   totals.cash_investment
+            FROM portfolio_latest_totals AS totals
+            LEFT JOIN portfolio_data_versions AS versions
+              ON versions.portfolio_id = totals.portfolio_id
+            WHERE totals.portfolio_id = ?
+              AND totals.settings_hash = ?
+              AND totals.data_version = COALESCE(versions.version, 0)
+            """,
+            (portfolio_id, settings_hash),
+        ).fetchone()
+    if row:
+        return (
+            json.loads(row["totals_json"]),
+            float(row["total_invested"]),
+            float(row["total_profit"]),
+            float(row["investment_current_total"]),
+            bool(row["cash_investment"]),
+        )
+    return _compute_latest_totals(portfolio_id, category_settings)
+
+
+def _sync_latest_totals(conn: sqlite3.Connection, portfolio_id: int) -> None:
+    """Rebuild the portfolio's latest-totals row for its current category settings."""
+    conn.execute("DELETE FROM portfolio_latest_totals WHERE portfolio_id = ?", (portfolio_id,))
+    if not conn.execute("SELECT 1 FROM portfolios WHERE id = ?", (portfolio_id,)).fetchone():
+        return
+    settings = _get_category_settings(portfolio_id)
+    category_settings = {_normalize_text(key): value for key, value in settings.items()}
+    totals, total_invested, total_profit, investment_current_total, cash_investment = (
+        _compute_latest_totals(portfolio_id, category_settings)
+    )
+    conn.execute(
+        """
+        INSERT INTO portfolio_latest_totals (
+            portfolio_id, settings_hash, data_version, totals_json, total_invested,
+            total_profit, investment_current_total, cash_investment, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            portfolio_id,
+            _category_settings_hash(category_settings),
+            _portfolio_data_version(conn, portfolio_id),
+            json.dumps(totals),
+            total_invested,
+            total_profit,
+            investment_current_total,
+            int(cash_investment),
+            datetime.utcnow().isoformat(),
+        ),
+    )
+
+
+def _compute_latest_totals(
+    portfolio_id: int,
+    category_settings: dict[str, bool],
 ) -> tuple[dict[str, float], float, float, float, bool]:
     totals: dict[str, float] = {}
     total_invested = 0.0
@@ -8264,129 +11516,123 @@ def _aggregate_latest_totals(
     return totals, total_invested, total_profit, investment_current_total, cash_investment
 
 
-def _first_investment_date(
+def _portfolio_cash_flows(
     portfolio_id: int, investment_categories: set[str]
-) -> datetime | None:
+) -> list[tuple[date, float]]:
+    """Net external flows per day into the portfolio's investment categories."""
     if not investment_categories:
-        return None
-    categories = [item.lower() for item in investment_categories]
-    placeholders = ",".join(["?"] * len(categories))
-    earliest = datetime.min
-
-    def update(candidate: str | None) -> None:
-        nonlocal earliest
-        timestamp = _to_datetime(candidate)
-        if timestamp == datetime.min:
-            return
-        if earliest == datetime.min or timestamp < earliest:
-            earliest = timestamp
-
+        return []
+    categories = {
+        f"category_{index}": _normalize_text(category)
+        for index, category in enumerate(sorted(investment_categories))
+    }
+    placeholders = ",".join(f":{name}" for name in categories)
     with _db_connection() as conn:
-        row = conn.execute(
+        # Save'n'Grow imports supersede legacy entries; XTB deposits/withdrawals,
+        # when imported, supersede the invested deltas of the XTB snapshots.
+        rows = conn.execute(
             f"""
-            SELECT MIN(imp.imported_at) AS date_value
-            FROM santander_imports AS imp
-            JOIN santander_items AS items ON items.import_id = imp.id
-            WHERE imp.portfolio_id = ?
-              AND lower(items.category) IN ({placeholders})
+            SELECT flow_date, SUM(amount) AS amount
+            FROM portfolio_cash_flows
+            WHERE portfolio_id = :portfolio_id
+              AND category_key IN ({placeholders})
+              AND (
+                  source != 'save_ngrow_entries'
+                  OR NOT EXISTS (
+                      SELECT 1 FROM save_ngrow_imports WHERE portfolio_id = :portfolio_id
+                  )
+              )
+              AND (
+                  source != 'xtb_imports'
+                  OR NOT EXISTS (
+                      SELECT 1 FROM portfolio_cash_flows
+                      WHERE portfolio_id = :portfolio_id AND source = 'holdings_operations'
+                  )
+              )
+            GROUP BY flow_date
+            ORDER BY flow_date
             """,
-            (portfolio_id, *categories),
-        ).fetchone()
-        update(row["date_value"] if row else None)
+            {"portfolio_id": portfolio_id, **categories},
+        ).fetchall()
+    return [
+        (date.fromisoformat(row["flow_date"]), float(row["amount"]))
+        for row in rows
+        if row["amount"]
+    ]
 
-        row = conn.execute(
-            f"""
-            SELECT MIN(COALESCE(snapshot_date, created_at)) AS date_value
-            FROM trade_republic_entries
-            WHERE portfolio_id = ?
-              AND lower(COALESCE(category, 'Cash')) IN ({placeholders})
-            """,
-            (portfolio_id, *categories),
-        ).fetchone()
-        update(row["date_value"] if row else None)
 
-        row = conn.execute(
-            f"""
-            SELECT MIN(COALESCE(imp.snapshot_date, imp.created_at)) AS date_value
-            FROM save_ngrow_imports AS imp
-            JOIN save_ngrow_items AS items ON items.import_id = imp.id
-            WHERE imp.portfolio_id = ?
-              AND lower(items.category) IN ({placeholders})
-            """,
-            (portfolio_id, *categories),
-        ).fetchone()
-        update(row["date_value"] if row else None)
+def _calculate_irr(flows: list[tuple[date, float]], current_value: float) -> float | None:
+    """Annualized money-weighted return (%) of flows valued at current_value today."""
+    if not flows or current_value <= 0:
+        return None
+    rate = _xirr([*flows, (datetime.utcnow().date(), current_value)])
+    return rate * 100 if rate is not None else None
 
-        if "retirement plans" in categories:
-            row = conn.execute(
-                """
-                SELECT MIN(COALESCE(snapshot_date, created_at)) AS date_value
-                FROM save_ngrow_entries
-                WHERE portfolio_id = ?
-                """,
-                (portfolio_id,),
-            ).fetchone()
-            update(row["date_value"] if row else None)
 
-        row = conn.execute(
-            f"""
-            SELECT MIN(COALESCE(snapshot_date, created_at)) AS date_value
-            FROM aforronet_imports
-            WHERE portfolio_id = ?
-              AND lower(COALESCE(category, 'Emergency Funds')) IN ({placeholders})
-            """,
-            (portfolio_id, *categories),
-        ).fetchone()
-        update(row["date_value"] if row else None)
+def _manual_holdings_value(portfolio_id: int, investment_categories: set[str]) -> float:
+    """Current value, in the portfolio currency, of positions built from manual trades.
 
-        row = conn.execute(
-            f"""
-            SELECT MIN(COALESCE(imp.snapshot_date, imp.imported_at)) AS date_value
-            FROM bancoinvest_imports AS imp
-            JOIN bancoinvest_items AS items ON items.import_id = imp.id
-            WHERE imp.portfolio_id = ?
-              AND lower(items.category) IN ({placeholders})
-            """,
-            (portfolio_id, *categories),
+    The trades are flows in the cash-flow ledger, so their positions must be
+    part of the terminal value the IRR is solved against.
+    """
+    positions = [
+        state
+        for state in _aggregate_transactions_by_ticker(
+            _list_holding_transactions(portfolio_id), None
+        ).values()
+        if state["shares"] > 0 and _normalize_text(state["category"]) in investment_categories
+    ]
+    if not positions:
+        return 0.0
+    with _db_connection() as conn:
+        portfolio_row = conn.execute(
+            "SELECT currency FROM portfolios WHERE id = ?", (portfolio_id,)
         ).fetchone()
-        update(row["date_value"] if row else None)
+    price_cache = _get_cached_prices([state["ticker"] for state in positions])
+    metadata_map = _list_holdings_metadata(portfolio_id)
+    prices = []
+    for state in positions:
+        price_info = price_cache.get(state["ticker"].upper())
+        if price_info and _price_is_fresh(price_info["updated_at"]):
+            prices.append(price_info["price"])
+        else:
+            prices.append(state["cost_basis"] / state["shares"])
+    prices = _fx_rates().convert(
+        prices,
+        [
+            metadata_map.get(state["ticker"].upper(), {}).get("currency") or "USD"
+            for state in positions
+        ],
+        portfolio_row["currency"] if portfolio_row else "USD",
+    )
+    return float(sum(state["shares"] * price for state, price in zip(positions, prices)))
 
-        row = conn.execute(
-            f"""
-            SELECT MIN(imported_at) AS date_value
-            FROM xtb_imports
-            WHERE portfolio_id = ?
-              AND lower(COALESCE(category, 'Stocks')) IN ({placeholders})
-            """,
-            (portfolio_id, *categories),
-        ).fetchone()
-        update(row["date_value"] if row else None)
 
-    return None if earliest == datetime.min else earliest
+def _portfolio_investment_scope(
+    portfolio_id: int, categories: list[str], settings_lookup: dict[str, bool]
+) -> tuple[set[str], float]:
+    """Investment category keys (normalized) and their current value for a portfolio."""
 
+    def is_investment_category(category: str) -> bool:
+        return settings_lookup.get(_normalize_text(category), _default_is_investment(category))
 
-def _calculate_irr(
-    portfolio_id: int,
-    investment_categories: set[str],
-    total_invested: float,
-    current_value: float,
-) -> float | None:
-    if total_invested <= 0 or current_value <= 0:
-        return None
-    start_date = _first_investment_date(portfolio_id, investment_categories)
-    if not start_date:
-        return None
-    days = (datetime.utcnow() - start_date).days
-    if days <= 0:
-        return None
-    years = days / 365.25
-    if years <= 0:
-        return None
-    try:
-        irr = (current_value / total_invested) ** (1 / years) - 1
-    except (ZeroDivisionError, ValueError):
-        return None
-    return irr * 100
+    investment_categories = {
+        _normalize_text(category) for category in categories if is_investment_category(category)
+    }
+    totals, _, _, investment_current_total, cash_investment = _aggregate_latest_totals(
+        portfolio_id, settings_lookup
+    )
+    if cash_investment:
+        investment_categories.add("cash")
+    investment_total = (
+        investment_current_total
+        if investment_current_total
+        else sum(
+            value for category, value in (totals or {}).items() if is_investment_category(category)
+        )
+    )
+    investment_total += _manual_holdings_value(portfolio_id, investment_categories)
+    return investment_categories, investment_total
 
 
 def _list_institution_detail(portfolio_id: int, institution: str) -> dict:
@@ -8697,6 +11943,234 @@ def _list_institution_detail(portfolio_id: int, institution: str) -> dict:
     raise HTTPException(status_code=404, detail="Institution not found.")
 
 
+def _load_ticker_metadata(ticker: str) -> dict:
+    """Busca e guarda metadados e preço de um ticker (usado pelos jobs de admin)."""
+    if PRICE_API_PROVIDER in ("finnhub", "finhub"):
+        metadata = _fetch_metadata_finnhub(ticker)
+        if not metadata:
+            raise HTTPException(status_code=404, detail=f"Could not fetch metadata for {ticker}")
+        _save_ticker_metadata(metadata)
+        if metadata.get("price"):
+            _upsert_price(ticker, metadata["price"])
+        return {"ticker": ticker, "price": metadata.get("price")}
+    price_value = _fetch_latest_price(ticker)
+    _save_ticker_metadata(
+        {
+            "ticker": ticker,
+            "name": ticker,
+            "asset_class": "Stock",
+            "sector": None,
+            "industry": None,
+            "country": None,
+            "region": None,
+            "currency": "USD",
+            "exchange": None,
+            "dividend_yield": None,
+            "dividend_frequency": None,
+            "next_dividend_date": None,
+            "next_dividend_amount": None,
+        }
+    )
+    _upsert_price(ticker, price_value)
+    return {"ticker": ticker, "price": price_value}
+
+
+def _load_ticker_price(ticker: str) -> dict:
+    price_value = _fetch_latest_price(ticker)
+    _upsert_price(ticker, price_value)
+    return {"ticker": ticker, "price": price_value}
+
+
+# Persistent background jobs. A job is a list of items processed one at a time
+# by the handler registered for its kind; the checkpoint (index of the next
+# item) is stored after every item, so a restart resumes where it stopped.
+BACKGROUND_JOB_HANDLERS = {
+    "ticker_metadata": _load_ticker_metadata,
+    "ticker_prices": _load_ticker_price,
+}
+_background_job_lock = threading.Lock()
+_background_job_executor: ThreadPoolExecutor | None = None
+
+
+def _background_job_pool() -> ThreadPoolExecutor:
+    global _background_job_executor
+    with _background_job_lock:
+        if _background_job_executor is None:
+            _background_job_executor = ThreadPoolExecutor(
+                max_workers=max(BACKGROUND_JOB_WORKERS, 1),
+                thread_name_prefix="background-job",
+            )
+        return _background_job_executor
+
+
+def _shutdown_background_jobs() -> None:
+    global _background_job_executor
+    with _background_job_lock:
+        executor = _background_job_executor
+        _background_job_executor = None
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _background_job_view(row: sqlite3.Row) -> dict:
+    total = int(row["total"] or 0)
+    completed = int(row["checkpoint"] or 0)
+    errors = json.loads(row["errors_json"] or "[]")
+    return {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "total": total,
+        "completed": completed,
+        "progress": int(completed / total * 100) if total else 100,
+        "success": int(row["success_count"] or 0),
+        "errors": len(errors),
+        "error_details": errors,
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+    }
+
+
+def _get_background_job(job_id: str) -> dict | None:
+    with _db_connection() as conn:
+        row = conn.execute("SELECT * FROM background_jobs WHERE id = ?", (job_id,)).fetchone()
+    return _background_job_view(row) if row else None
+
+
+def _list_background_jobs(limit: int = 50) -> list[dict]:
+    with _db_connection() as conn:
+        rows = conn.execute(
+            "SELECT * FROM background_jobs ORDER BY created_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+    return [_background_job_view(row) for row in rows]
+
+
+def _enqueue_background_job(kind: str, owner_email: str, items: list[str]) -> dict:
+    if kind not in BACKGROUND_JOB_HANDLERS:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind: {kind}")
+    job_id = secrets.token_hex(12)
+    now = datetime.utcnow().isoformat()
+    with _db_connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO background_jobs (
+                id, kind, owner_email, status, payload_json, total, created_at, updated_at
+            ) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)
+            """,
+            (job_id, kind, owner_email, json.dumps({"items": items}), len(items), now, now),
+        )
+    _background_job_pool().submit(_run_background_job, job_id)
+    return _get_background_job(job_id)
+
+
+def _cancel_background_job(job_id: str) -> dict | None:
+    now = datetime.utcnow().isoformat()
+    with _db_connection() as conn:
+        conn.execute(
+            """
+            UPDATE background_jobs
+            SET cancel_requested = 1,
+                status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                finished_at = CASE WHEN status = 'queued' THEN ? ELSE finished_at END,
+                updated_at = ?
+            WHERE id = ?
+            """,
+            (now, now, job_id),
+        )
+    return _get_background_job(job_id)
+
+
+def _run_background_job(job_id: str) -> None:
+    try:
+        with _db_connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM background_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if not row or row["status"] not in ("queued", "running"):
+                return
+            now = datetime.utcnow().isoformat()
+            conn.execute(
+                """
+                UPDATE background_jobs
+                SET status = 'running', started_at = COALESCE(started_at, ?), updated_at = ?
+                WHERE id = ?
+                """,
+                (now, now, job_id),
+            )
+        handler = BACKGROUND_JOB_HANDLERS.get(row["kind"])
+        items = json.loads(row["payload_json"]).get("items", [])
+        checkpoint = int(row["checkpoint"] or 0)
+        success_count = int(row["success_count"] or 0)
+        errors = json.loads(row["errors_json"] or "[]")
+        if handler is None:
+            raise RuntimeError(f"No handler for job kind {row['kind']}")
+        for index in range(checkpoint, len(items)):
+            with _db_connection() as conn:
+                cancelled = conn.execute(
+                    "SELECT cancel_requested FROM background_jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+            if cancelled and cancelled["cancel_requested"]:
+                _finish_background_job(job_id, "cancelled")
+                return
+            item = str(items[index]).strip().upper()
+            try:
+                handler(item)
+                success_count += 1
+            except Exception as exc:
+                detail = exc.detail if isinstance(exc, HTTPException) else str(exc)
+                errors.append({"ticker": item, "error": str(detail)[:150]})
+            with _db_connection() as conn:
+                conn.execute(
+                    """
+                    UPDATE background_jobs
+                    SET checkpoint = ?, success_count = ?, errors_json = ?, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (
+                        index + 1,
+                        success_count,
+                        json.dumps(errors),
+                        datetime.utcnow().isoformat(),
+                        job_id,
+                    ),
+                )
+        _finish_background_job(job_id, "completed")
+    except Exception as exc:
+        logger.exception("Background job %s failed.", job_id)
+        _finish_background_job(job_id, "failed", str(exc)[:500])
+    finally:
+        _release_thread_db_connection()
+
+
+def _finish_background_job(job_id: str, status: str, error: str | None = None) -> None:
+    now = datetime.utcnow().isoformat()
+    with _db_connection() as conn:
+        conn.execute(
+            """
+            UPDATE background_jobs
+            SET status = ?, error = ?, finished_at = ?, updated_at = ?
+            WHERE id = ?
+            """,
+            (status, error, now, now, job_id),
+        )
+
+
+def _resume_background_jobs() -> None:
+    with _db_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT id FROM background_jobs
+            WHERE status IN ('queued', 'running')
+            ORDER BY created_at
+            """
+        ).fetchall()
+    for row in rows:
+        _background_job_pool().submit(_run_background_job, row["id"])
+
+
 @app.get("/health")
 def health() -> dict:
     return {"status": "ok"}
@@ -9019,7 +12493,7 @@ def aggregated_portfolio_summary(authorization: str | None = Header(default=None
             "total_invested": 12000.0,     # Total amount invested
             "total_profit": 3000.0,        # Total profit/loss
             "profit_percent": 25.0,        # Percentage profit
-            "irr": None                    # IRR calculation placeholder
+            "irr": 8.5                     # Money-weighted return (XIRR, %)
         }
     
     Notes:
@@ -9049,6 +12523,8 @@ def aggregated_portfolio_summary(authorization: str | None = Header(default=None
     all_totals = {}
     total_invested_all = 0.0
     total_profit_all = 0.0
+    investment_total_all = 0.0
+    flows_all: list[tuple[date, float]] = []
     
     for portfolio in portfolios:
         portfolio_id = portfolio["id"]
@@ -9070,6 +12546,11 @@ def aggregated_portfolio_summary(authorization: str | None = Header(default=None
                 all_totals[category] = all_totals.get(category, 0.0) + value
             total_invested_all += total_invested or 0.0
             total_profit_all += total_profit or 0.0
+        investment_categories, investment_total = _portfolio_investment_scope(
+            portfolio_id, categories, settings_lookup
+        )
+        investment_total_all += investment_total or 0.0
+        flows_all.extend(_portfolio_cash_flows(portfolio_id, investment_categories))
     
     total_value = sum(all_totals.values())
     profit_percent = (
@@ -9084,7 +12565,7 @@ def aggregated_portfolio_summary(authorization: str | None = Header(default=None
         "total_invested": round(total_invested_all, 2),
         "total_profit": round(total_profit_all, 2),
         "profit_percent": profit_percent,
-        "irr": None,  # IRR calculation would need all portfolio transactions
+        "irr": _calculate_irr(flows_all, investment_total_all),
     }
 
 
@@ -9269,22 +12750,15 @@ def portfolio_summary(
     _ensure_category_settings(portfolio_id, categories)
     settings = _get_category_settings(portfolio_id)
     settings_lookup = {_normalize_text(key): value for key, value in settings.items()}
-    investment_categories = {
-        category.lower()
-        for category in categories
-        if settings_lookup.get(_normalize_text(category), _default_is_investment(category))
-    }
-
-    def is_investment_category(category: str) -> bool:
-        return settings_lookup.get(_normalize_text(category), _default_is_investment(category))
-
-    (
-        totals,
-        total_invested,
-        total_profit,
-        investment_current_total,
-        cash_investment,
-    ) = _aggregate_latest_totals(portfolio_id, settings_lookup)
+    totals, total_invested, total_profit, _, _ = _aggregate_latest_totals(
+        portfolio_id, settings_lookup
+    )
+    investment_categories, investment_total = _portfolio_investment_scope(
+        portfolio_id, categories, settings_lookup
+    )
+    irr = _calculate_irr(
+        _portfolio_cash_flows(portfolio_id, investment_categories), investment_total
+    )
     if not totals:
         return {
             "totals_by_category": {},
@@ -9292,23 +12766,9 @@ def portfolio_summary(
             "total_invested": 0.0,
             "total_profit": 0.0,
             "profit_percent": 0.0,
-            "irr": None,
+            "irr": irr,
         }
     total_value = sum(totals.values())
-    if cash_investment:
-        investment_categories.add("cash")
-    investment_total = (
-        investment_current_total
-        if investment_current_total
-        else sum(
-            value
-            for category, value in totals.items()
-            if is_investment_category(category)
-        )
-    )
-    irr = _calculate_irr(
-        portfolio_id, investment_categories, total_invested, investment_total
-    )
     profit_percent = (total_profit / total_value * 100) if total_value else 0.0
     return {
         "totals_by_category": totals,
@@ -9322,17 +12782,41 @@ def portfolio_summary(
 
 @app.get("/portfolios/{portfolio_id}/history")
 def portfolio_history(
-    portfolio_id: int, authorization: str | None = Header(default=None)
+    portfolio_id: int,
+    since: str | None = None,
+    revision: int | None = None,
+    authorization: str | None = Header(default=None),
 ) -> dict:
+    """Return the portfolio history, or only the dates from since= onwards.
+
+    A delta is only served when revision= matches the current history
+    revision; after an older snapshot is edited, deleted or re-imported the
+    full series is returned with since set to null, and the client should
+    replace what it holds.
+    """
     session = _require_session(authorization)
     portfolio = _get_portfolio(portfolio_id, session["email"])
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found.")
+    if since:
+        since = _parse_iso_date(since).isoformat()
     categories = _filter_categories(json.loads(portfolio["categories_json"]))
     _ensure_category_settings(portfolio_id, categories)
     settings = _get_category_settings(portfolio_id)
     settings_lookup = {_normalize_text(key): value for key, value in settings.items()}
-    return {"items": _list_portfolio_history(portfolio_id, settings_lookup)}
+    with _db_connection() as conn:
+        current_revision = _portfolio_history_revision(conn, portfolio_id)
+    if revision != current_revision:
+        since = None
+    items = _list_portfolio_history(portfolio_id, settings_lookup, since)
+    with _db_connection() as conn:
+        version = _portfolio_data_version(conn, portfolio_id)
+    return {
+        "items": items,
+        "since": since,
+        "revision": current_revision,
+        "version": version,
+    }
 
 
 @app.get("/portfolios/{portfolio_id}/history/monthly")
@@ -9425,6 +12909,32 @@ def holdings_overall(
     return {"items": all_items, "total_value": round(total_value, 2)}
 
 
+@app.get("/portfolios/{portfolio_id}/holdings/history")
+def portfolio_holdings_history(
+    portfolio_id: int,
+    date_from: str | None = Query(default=None, alias="from"),
+    date_to: str | None = Query(default=None, alias="to"),
+    freq: str = "daily",
+    authorization: str | None = Header(default=None),
+) -> dict:
+    session = _require_session(authorization)
+    portfolio = _get_portfolio(portfolio_id, session["email"])
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found.")
+    if freq not in HOLDINGS_HISTORY_FREQUENCIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"freq must be one of: {', '.join(HOLDINGS_HISTORY_FREQUENCIES)}",
+        )
+    end = _parse_iso_date(date_to).isoformat() if date_to else datetime.utcnow().date().isoformat()
+    start = _parse_iso_date(date_from).isoformat() if date_from else None
+    if start and start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'.")
+    return _holdings_value_history(
+        portfolio_id, start, end, freq, portfolio["currency"] or "USD"
+    )
+
+
 @app.get("/portfolios/{portfolio_id}/holdings/transactions")
 def holdings_transactions(
     portfolio_id: int, authorization: str | None = Header(default=None)
@@ -9520,47 +13030,15 @@ def refresh_holding_prices(
     portfolio = _get_portfolio(portfolio_id, session["email"])
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found.")
-    categories = _filter_categories(json.loads(portfolio["categories_json"]))
-    _ensure_category_settings(portfolio_id, categories)
-    settings = _get_category_settings(portfolio_id)
-    settings_lookup = {_normalize_text(key): value for key, value in settings.items()}
-    holdings = _list_holdings_for_portfolio(portfolio_id, settings_lookup)
-    tickers = payload.tickers or [item["ticker"] for item in holdings["items"]]
-    results: list[dict] = []
-    cache = _get_cached_prices(tickers)
-    
-    import time
-    
-    # Rate limiting: max 59 calls/min = 1 call per 1.02 seconds
-    rate_limit_delay = 1.05  # slightly over 1 second to be safe
-    
-    for idx, ticker in enumerate(tickers):
-        cached = cache.get(ticker.upper())
-        if cached and _price_is_fresh(cached["updated_at"]) and not payload.force:
-            results.append(
-                {
-                    "ticker": ticker,
-                    "status": "cached",
-                    "price": cached["price"],
-                    "progress": int((idx + 1) / len(tickers) * 100)
-                }
-            )
-            continue
-        
-        try:
-            price_value = _fetch_latest_price(ticker)
-            _upsert_price(ticker, price_value)
-            results.append(
-                {"ticker": ticker, "status": "updated", "price": price_value, "progress": int((idx + 1) / len(tickers) * 100)}
-            )
-        except HTTPException as exc:
-            results.append({"ticker": ticker, "status": "error", "error": exc.detail, "progress": int((idx + 1) / len(tickers) * 100)})
-        
-        # Rate limiting: wait between API calls (not for cached)
-        if idx < len(tickers) - 1 and not cached:
-            time.sleep(rate_limit_delay)
-    
-    return {"items": results}
+    tickers = payload.tickers
+    if not tickers:
+        categories = _filter_categories(json.loads(portfolio["categories_json"]))
+        _ensure_category_settings(portfolio_id, categories)
+        settings = _get_category_settings(portfolio_id)
+        settings_lookup = {_normalize_text(key): value for key, value in settings.items()}
+        holdings = _list_holdings_for_portfolio(portfolio_id, settings_lookup)
+        tickers = [item["ticker"] for item in holdings["items"]]
+    return _start_price_refresh_job(session["email"], tickers, payload.force)
 
 
 @app.post("/holdings/refresh-prices")
@@ -9569,53 +13047,31 @@ def refresh_holding_prices_overall(
     authorization: str | None = Header(default=None),
 ) -> dict:
     session = _require_session(authorization)
-    portfolios = _list_portfolios(session["email"])
-    tickers: list[str] = []
-    for portfolio in portfolios:
-        categories = portfolio.get("categories") or list(DEFAULT_CATEGORIES)
-        categories = _filter_categories(categories)
-        _ensure_category_settings(portfolio["id"], categories)
-        settings = _get_category_settings(portfolio["id"])
-        settings_lookup = {_normalize_text(key): value for key, value in settings.items()}
-        data = _list_holdings_for_portfolio(portfolio["id"], settings_lookup)
-        tickers.extend([item["ticker"] for item in data["items"]])
-    unique_tickers = sorted({ticker.upper() for ticker in tickers})
-    if payload.tickers:
-        unique_tickers = [ticker.upper() for ticker in payload.tickers]
-    results: list[dict] = []
-    cache = _get_cached_prices(unique_tickers)
-    
-    import time
-    
-    # Rate limiting: max 59 calls/min = 1 call per 1.02 seconds
-    rate_limit_delay = 1.05
-    
-    for idx, ticker in enumerate(unique_tickers):
-        cached = cache.get(ticker.upper())
-        if cached and _price_is_fresh(cached["updated_at"]) and not payload.force:
-            results.append(
-                {
-                    "ticker": ticker,
-                    "status": "cached",
-                    "price": cached["price"],
-                    "progress": int((idx + 1) / len(unique_tickers) * 100)
-                }
-            )
-            continue
-        try:
-            price_value = _fetch_latest_price(ticker)
-            _upsert_price(ticker, price_value)
-            results.append(
-                {"ticker": ticker, "status": "updated", "price": price_value, "progress": int((idx + 1) / len(unique_tickers) * 100)}
-            )
-        except HTTPException as exc:
-            results.append({"ticker": ticker, "status": "error", "error": exc.detail, "progress": int((idx + 1) / len(unique_tickers) * 100)})
-        
-        # Rate limiting: wait between API calls (not for cached)
-        if idx < len(unique_tickers) - 1 and not cached:
-            time.sleep(rate_limit_delay)
-    
-    return {"items": results}
+    tickers = payload.tickers
+    if not tickers:
+        tickers = []
+        for portfolio in _list_portfolios(session["email"]):
+            categories = portfolio.get("categories") or list(DEFAULT_CATEGORIES)
+            categories = _filter_categories(categories)
+            _ensure_category_settings(portfolio["id"], categories)
+            settings = _get_category_settings(portfolio["id"])
+            settings_lookup = {_normalize_text(key): value for key, value in settings.items()}
+            data = _list_holdings_for_portfolio(portfolio["id"], settings_lookup)
+            tickers.extend([item["ticker"] for item in data["items"]])
+        tickers = sorted({ticker.upper() for ticker in tickers})
+    return _start_price_refresh_job(session["email"], tickers, payload.force)
+
+
+@app.get("/holdings/refresh-prices/{job_id}")
+def get_price_refresh_job(
+    job_id: str,
+    authorization: str | None = Header(default=None),
+) -> dict:
+    session = _require_session(authorization)
+    job = _get_price_refresh_job(job_id, session["email"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Refresh job not found.")
+    return job
 
 
 @app.get("/portfolios/{portfolio_id}/banking/categories")
@@ -9654,21 +13110,30 @@ def banking_preview(
     if not file and not text:
         raise HTTPException(status_code=400, detail="Provide a file or pasted data.")
     _ensure_banking_categories(portfolio_id)
-    file_bytes = file.file.read() if file else None
-    filename = file.filename if file else "pasted.csv"
-    content_hash = hashlib.sha256(file_bytes or text.encode("utf-8")).hexdigest()
-    rows = _load_banking_rows(file_bytes, filename, text)
-    if not rows:
+    if file:
+        filename = file.filename
+        content_hash = _hash_upload(file.file)
+    else:
+        filename = "pasted.csv"
+        content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    rows = _iter_banking_rows(file.file if file else None, filename, text)
+    first_row = next(rows, None)
+    if first_row is None:
         raise HTTPException(status_code=400, detail="No rows found in the file.")
     columns, preview_rows, mapping, warnings = _build_banking_preview(
-        rows, portfolio["currency"]
+        chain([first_row], rows), portfolio["currency"]
+    )
+    staged = _stage_banking_rows(
+        portfolio_id, content_hash, filename, columns, preview_rows
     )
     return {
         "source_file": filename,
         "file_hash": content_hash,
         "institution": institution,
         "columns": columns,
-        "rows": preview_rows,
+        "rows": [{"cells": cells, "include": True} for cells in staged["sample"]],
+        "total_rows": staged["total_rows"],
+        "staged_until": staged["expires_at"].isoformat(),
         "mapping": mapping,
         "warnings": warnings,
     }
@@ -9687,26 +13152,62 @@ def banking_commit(
     institution = payload.institution.strip() if payload.institution else ""
     if not institution:
         raise HTTPException(status_code=400, detail="Institution is required.")
+    if payload.duplicates not in {"skip", "reject"}:
+        raise HTTPException(status_code=400, detail="duplicates must be skip or reject.")
+    if not BANKING_FILE_HASH_PATTERN.match(payload.file_hash):
+        raise HTTPException(status_code=400, detail="Invalid file hash.")
     _ensure_banking_categories(portfolio_id)
-    rows = [row.cells for row in payload.rows if row.include]
-    items, warnings = _build_banking_items(
-        rows, payload.columns, payload.mapping, portfolio["currency"]
-    )
+    if payload.rows is not None:
+        columns = payload.columns or []
+        rows = [row.cells for row in payload.rows if row.include]
+    else:
+        staged = _get_staged_banking_rows(portfolio_id, payload.file_hash)
+        if not staged:
+            raise HTTPException(
+                status_code=410, detail="Preview expired. Upload the file again."
+            )
+        columns = payload.columns or staged["columns"]
+        excluded = set(payload.excluded_rows)
+        rows = (cells for index, cells in enumerate(staged["rows"]) if index not in excluded)
+    items, warnings = _build_banking_items(rows, payload.mapping, portfolio["currency"])
     if not items:
         raise HTTPException(status_code=400, detail="No valid rows to import.")
-    _apply_banking_category_rules(portfolio_id, institution, items)
-    try:
-        import_id = _save_banking_import(
-            portfolio_id, institution, payload.source_file, payload.file_hash, len(items)
-        )
-    except sqlite3.IntegrityError as exc:
-        raise HTTPException(status_code=409, detail="File already imported.") from exc
-    _save_banking_transactions(portfolio_id, import_id, institution, items)
-    _upsert_banking_institution(portfolio_id, institution)
-    return {"status": "imported", "import_id": import_id, "warnings": warnings}
+    if payload.duplicates == "reject":
+        known = _count_known_banking_rows(portfolio_id, institution, items)
+        if known:
+            raise HTTPException(
+                status_code=409, detail=f"{known} transactions were already imported."
+            )
+    with _db_connection() as conn:
+        _apply_banking_category_rules(portfolio_id, institution, items, conn)
+        try:
+            import_id = _save_banking_import(
+                portfolio_id,
+                institution,
+                payload.source_file,
+                payload.file_hash,
+                len(items),
+                columns,
+            )
+        except sqlite3.IntegrityError as exc:
+            raise HTTPException(status_code=409, detail="File already imported.") from exc
+        inserted = _save_banking_transactions(portfolio_id, import_id, institution, items)
+        if inserted != len(items):
+            conn.execute(
+                "UPDATE banking_imports SET row_count = ? WHERE id = ?", (inserted, import_id)
+            )
+        _upsert_banking_institution(portfolio_id, institution)
+    _drop_staged_banking_rows(portfolio_id, payload.file_hash)
+    return {
+        "status": "imported",
+        "import_id": import_id,
+        "inserted": inserted,
+        "skipped": len(items) - inserted,
+        "warnings": warnings,
+    }
 
 
-@app.get("/portfolios/{portfolio_id}/banking/transactions")
+@app.get("/portfolios/{portfolio_id}/banking/transactions", response_model=None)
 def list_banking_transactions(
     portfolio_id: int,
     authorization: str | None = Header(default=None),
@@ -9714,14 +13215,55 @@ def list_banking_transactions(
     category: str | None = None,
     subcategory: str | None = None,
     institution: str | None = None,
-) -> dict:
+    q: str | None = None,
+    after: str | None = None,
+    limit: int | None = None,
+    fields: str | None = None,
+    format: str | None = None,
+    accept: str | None = Header(default=None),
+) -> dict | StreamingResponse:
     session = _require_session(authorization)
     if not _get_portfolio(portfolio_id, session["email"]):
         raise HTTPException(status_code=404, detail="Portfolio not found.")
+    if limit is not None and not 1 <= limit <= BANKING_TRANSACTIONS_MAX_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"limit must be between 1 and {BANKING_TRANSACTIONS_MAX_LIMIT}.",
+        )
+    filters = {
+        "month": month,
+        "category": category,
+        "subcategory": subcategory,
+        "institution": institution,
+        "q": q,
+    }
+    cursor = _parse_banking_cursor(after) if after else None
+    columns = _parse_banking_fields(fields)
+    if format == "ndjson" or "application/x-ndjson" in (accept or ""):
+        return StreamingResponse(
+            _stream_banking_transactions(portfolio_id, filters, cursor, limit, columns),
+            media_type="application/x-ndjson",
+        )
     items = _list_banking_transactions(
-        portfolio_id, month=month, category=category, subcategory=subcategory, institution=institution
+        portfolio_id, **filters, after=cursor, limit=limit, fields=columns
     )
-    return {"items": items}
+    next_cursor = _banking_cursor(items[-1]) if limit and len(items) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get("/portfolios/{portfolio_id}/banking/transactions/{tx_id}/raw")
+def get_banking_transaction_raw(
+    portfolio_id: int,
+    tx_id: int,
+    authorization: str | None = Header(default=None),
+) -> dict:
+    session = _require_session(authorization)
+    if not _get_portfolio(portfolio_id, session["email"]):
+        raise HTTPException(status_code=404, detail="Portfolio not found.")
+    raw = _get_banking_transaction_raw(portfolio_id, tx_id)
+    if raw is None:
+        raise HTTPException(status_code=404, detail="Transaction not found.")
+    return raw
 
 
 @app.post("/portfolios/{portfolio_id}/banking/transactions/{tx_id}/category")
@@ -9756,15 +13298,41 @@ def clear_banking_transactions(
 def list_banking_budgets(
     portfolio_id: int,
     month: str | None = None,
+    year: str | None = None,
     authorization: str | None = Header(default=None),
 ) -> dict:
     session = _require_session(authorization)
     if not _get_portfolio(portfolio_id, session["email"]):
         raise HTTPException(status_code=404, detail="Portfolio not found.")
+    if year:
+        _parse_month(f"{year}-01")
+        return {"items": _list_banking_budgets(portfolio_id, f"{year}-01", f"{year}-12")}
     month_value = month or datetime.utcnow().strftime("%Y-%m")
     return {"items": _list_banking_budgets(portfolio_id, month_value)}
 
 
+@app.get("/portfolios/{portfolio_id}/banking/summary")
+def banking_spend_summary(
+    portfolio_id: int,
+    month_from: str | None = Query(default=None, alias="from"),
+    month_to: str | None = Query(default=None, alias="to"),
+    authorization: str | None = Header(default=None),
+) -> dict:
+    session = _require_session(authorization)
+    if not _get_portfolio(portfolio_id, session["email"]):
+        raise HTTPException(status_code=404, detail="Portfolio not found.")
+    end = _parse_month(month_to) if month_to else datetime.utcnow().strftime("%Y-%m")
+    if month_from:
+        start = _parse_month(month_from)
+    else:
+        # Default to the twelve months ending at `to`.
+        index = int(end[:4]) * 12 + int(end[5:7]) - 12
+        start = f"{index // 12:04d}-{index % 12 + 1:02d}"
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'.")
+    return _banking_spend_summary(portfolio_id, start, end)
+
+
 @app.post("/portfolios/{portfolio_id}/banking/budgets")
 def upsert_banking_budget(
     portfolio_id: int,
@@ -9799,6 +13367,44 @@ def delete_banking_budget(
     return {"status": "deleted"}
 
 
+@app.get("/portfolios/{portfolio_id}/banking/rules")
+def list_banking_rules(
+    portfolio_id: int,
+    authorization: str | None = Header(default=None),
+) -> dict:
+    session = _require_session(authorization)
+    if not _get_portfolio(portfolio_id, session["email"]):
+        raise HTTPException(status_code=404, detail="Portfolio not found.")
+    return {"items": _list_banking_keyword_rules(portfolio_id)}
+
+
+@app.post("/portfolios/{portfolio_id}/banking/rules")
+def save_banking_rule(
+    portfolio_id: int,
+    payload: BankingRuleRequest,
+    authorization: str | None = Header(default=None),
+) -> dict:
+    session = _require_session(authorization)
+    if not _get_portfolio(portfolio_id, session["email"]):
+        raise HTTPException(status_code=404, detail="Portfolio not found.")
+    rule = _save_banking_keyword_rule(portfolio_id, payload)
+    return {"status": "saved", "rule": rule}
+
+
+@app.delete("/portfolios/{portfolio_id}/banking/rules/{rule_id}")
+def delete_banking_rule(
+    portfolio_id: int,
+    rule_id: int,
+    authorization: str | None = Header(default=None),
+) -> dict:
+    session = _require_session(authorization)
+    if not _get_portfolio(portfolio_id, session["email"]):
+        raise HTTPException(status_code=404, detail="Portfolio not found.")
+    if not _delete_banking_keyword_rule(portfolio_id, rule_id):
+        raise HTTPException(status_code=404, detail="Rule not found.")
+    return {"status": "deleted"}
+
+
 @app.get("/portfolios/{portfolio_id}/institutions/{institution}/detail")
 def portfolio_institution_detail(
     portfolio_id: int,
@@ -9918,28 +13524,35 @@ def trade_republic_preview(
     if not files:
         raise HTTPException(status_code=400, detail="Files required.")
     default_category = _latest_trade_republic_category(portfolio_id) or "Cash"
-    items: list[dict] = []
+    uploads: list[tuple[str, str, bytes]] = []
     for file in files:
         if not file.filename:
             continue
         if not file.filename.lower().endswith(".pdf"):
             raise HTTPException(status_code=400, detail="Invalid file type.")
         file_bytes = file.file.read()
-        parsed = _parse_trade_republic_pdf(file_bytes, file.filename)
-        file_hash = hashlib.sha256(file_bytes).hexdigest()
+        uploads.append((file.filename, hashlib.sha256(file_bytes).hexdigest(), file_bytes))
+    _reject_committed_uploads(
+        "trade_republic",
+        portfolio_id,
+        [(filename, file_hash) for filename, file_hash, _ in uploads],
+    )
+    items: list[dict] = []
+    for (filename, file_hash, _), pages in zip(uploads, _extract_pdf_batch(uploads)):
+        parsed = _parse_trade_republic_pages(pages, filename)
         entry = _build_trade_republic_entry(
             parsed["available_cash"],
             parsed["interests_received"],
             portfolio["currency"],
             category=default_category,
             source="file",
-            source_file=file.filename,
+            source_file=filename,
             file_hash=file_hash,
             snapshot_date=parsed["snapshot_date"],
         )
         items.append(
             {
-                "filename": file.filename,
+                "filename": filename,
                 "file_hash": file_hash,
                 "snapshot_date": parsed["snapshot_date"],
                 "available_cash": entry["available_cash"],
@@ -10042,80 +13655,58 @@ def delete_trade_republic_import(
     return {"status": "deleted"}
 
 
-@app.post("/portfolios/{portfolio_id}/imports/xtb/preview")
+@app.post("/portfolios/{portfolio_id}/imports/xtb/preview", response_model=None)
 def xtb_preview(
     portfolio_id: int,
     files: list[UploadFile] = File(...),
     authorization: str | None = Header(default=None),
-) -> dict:
+    format: str | None = None,
+    accept: str | None = Header(default=None),
+) -> dict | StreamingResponse:
     session = _require_session(authorization)
     if not _get_portfolio(portfolio_id, session["email"]):
         raise HTTPException(status_code=404, detail="Portfolio not found.")
     if not files:
         raise HTTPException(status_code=400, detail="Files required.")
-    items: list[dict] = []
-    warnings: list[dict] = []
-    holdings: list[dict] = []
-    operations: list[dict] = []
+    uploads: list[tuple[str, str, bytes]] = []
     for file in files:
         if not file.filename:
             continue
         if not file.filename.lower().endswith((".xlsx", ".xls")):
             raise HTTPException(status_code=400, detail="Invalid file type.")
-        account_type = _xtb_account_type(file.filename)
+        _xtb_account_type(file.filename)
         file_bytes = file.file.read()
-        parsed = _parse_xtb_file(file_bytes, file.filename)
-        file_hash = hashlib.sha256(file_bytes).hexdigest()
-        if parsed["warnings"]:
-            warnings.append({"filename": file.filename, "warnings": parsed["warnings"]})
-        aggregated_positions = _aggregate_xtb_positions(parsed.get("positions", []))
-        for position in aggregated_positions:
-            holdings.append(
-                {
-                    "source_file": file.filename,
-                    "ticker": position["ticker"],
-                    "name": position.get("name"),
-                    "shares": position["shares"],
-                    "open_price": position["open_price"],
-                    "purchase_value": position.get("purchase_value"),
-                    "current_price": position.get("current_price"),
-                    "category": "Stocks",
-                }
-            )
-        items.append(
-            {
-                "filename": file.filename,
-                "file_hash": file_hash,
-                "account_type": account_type,
-                "category": "Stocks",
-                "current_value": parsed["current_value"],
-                "cash_value": parsed["cash_value"],
-                "invested": parsed["invested"],
-                "profit_value": parsed["profit_value"],
-                "profit_percent": parsed["profit_percent"],
-            }
-        )
-        for operation in parsed.get("operations", []):
-            operations.append(
-                {
-                    "source_file": file.filename,
-                    "ticker": operation.get("ticker"),
-                    "operation_type": operation.get("operation_type"),
-                    "operation_kind": operation.get("operation_kind"),
-                    "description": operation.get("description"),
-                    "amount": operation.get("amount"),
-                    "trade_date": operation.get("trade_date"),
-                    "currency": "EUR",
-                }
-            )
-    if not items:
+        uploads.append((file.filename, hashlib.sha256(file_bytes).hexdigest(), file_bytes))
+    if not uploads:
         raise HTTPException(status_code=400, detail="Files required.")
+    _reject_committed_uploads(
+        "xtb", portfolio_id, [(filename, file_hash) for filename, file_hash, _ in uploads]
+    )
+    results = _parse_uploads("xtb", _parse_xtb_file, uploads)
+    if format == "ndjson" or "application/x-ndjson" in (accept or ""):
+        return StreamingResponse(
+            _stream_xtb_preview(uploads, results), media_type="application/x-ndjson"
+        )
+    entries: list = [None] * len(uploads)
+    for index, result in results:
+        entries[index] = result
+    for result in entries:
+        if isinstance(result, Exception):
+            raise result
+    entries = [
+        _xtb_preview_entry(filename, file_hash, parsed)
+        for (filename, file_hash, _), parsed in zip(uploads, entries)
+    ]
     return {
         "status": "ok",
-        "items": items,
-        "warnings": warnings,
-        "holdings": holdings,
-        "operations": operations,
+        "items": [entry["item"] for entry in entries],
+        "warnings": [
+            {"filename": entry["item"]["filename"], "warnings": entry["warnings"]}
+            for entry in entries
+            if entry["warnings"]
+        ],
+        "holdings": [holding for entry in entries for holding in entry["holdings"]],
+        "operations": [operation for entry in entries for operation in entry["operations"]],
     }
 
 
@@ -10260,9 +13851,11 @@ def savengrow_preview(
         raise HTTPException(status_code=400, detail="File required.")
     if not file.filename.lower().endswith((".xlsx", ".xls")):
         raise HTTPException(status_code=400, detail="Invalid file type.")
-    file_bytes = file.file.read()
-    parsed = _read_savengrow_cells(file_bytes, file.filename)
-    file_hash = hashlib.sha256(file_bytes).hexdigest()
+    file_hash = _hash_upload(file.file)
+    _reject_committed_uploads("savengrow", portfolio_id, [(file.filename, file_hash)])
+    parsed = _cached_parse(
+        "savengrow", file_hash, lambda: _read_savengrow_cells(file.file, file.filename)
+    )
     return {
         "status": "ok",
         "filename": file.filename,
@@ -10284,9 +13877,11 @@ def bancoinvest_preview(
         raise HTTPException(status_code=400, detail="File required.")
     if not file.filename.lower().endswith((".xlsx", ".xls")):
         raise HTTPException(status_code=400, detail="Invalid file type.")
-    file_bytes = file.file.read()
-    parsed = _read_bancoinvest_cells(file_bytes, file.filename)
-    file_hash = hashlib.sha256(file_bytes).hexdigest()
+    file_hash = _hash_upload(file.file)
+    _reject_committed_uploads("bancoinvest", portfolio_id, [(file.filename, file_hash)])
+    parsed = _cached_parse(
+        "bancoinvest", file_hash, lambda: _read_bancoinvest_cells(file.file, file.filename)
+    )
     category_map = _load_bancoinvest_category_map(portfolio_id)
     for item in parsed["items"]:
         key = _normalize_text(item["holder"]).replace(" ", "")
@@ -10485,18 +14080,25 @@ def aforronet_preview(
         selected_files = [file]
     if not selected_files:
         raise HTTPException(status_code=400, detail="File required.")
-    items: list[dict] = []
+    uploads: list[tuple[str, str, bytes]] = []
     for entry in selected_files:
         if not entry.filename:
             continue
         if not entry.filename.lower().endswith(".pdf"):
             raise HTTPException(status_code=400, detail="Invalid file type.")
         file_bytes = entry.file.read()
-        parsed = _parse_aforronet_pdf(file_bytes, entry.filename)
-        file_hash = hashlib.sha256(file_bytes).hexdigest()
+        uploads.append((entry.filename, hashlib.sha256(file_bytes).hexdigest(), file_bytes))
+    _reject_committed_uploads(
+        "aforronet",
+        portfolio_id,
+        [(filename, file_hash) for filename, file_hash, _ in uploads],
+    )
+    items: list[dict] = []
+    for (filename, file_hash, _), pages in zip(uploads, _extract_pdf_batch(uploads)):
+        parsed = _parse_aforronet_pages(pages, filename)
         items.append(
             {
-                "filename": entry.filename,
+                "filename": filename,
                 "file_hash": file_hash,
                 "snapshot_date": parsed["snapshot_date"],
                 "items": [
@@ -10789,8 +14391,14 @@ def santander_preview(
         raise HTTPException(status_code=400, detail="File required.")
     if not file.filename.lower().endswith((".xlsx", ".xls")):
         raise HTTPException(status_code=400, detail="Invalid file type.")
-    file_bytes = file.file.read()
-    items, warnings = _parse_santander_sheet(file_bytes, file.filename)
+    file_hash = _hash_upload(file.file)
+    def parse_sheet() -> dict:
+        items, warnings = _parse_santander_sheet(file.file, file.filename)
+        return {"items": [item.model_dump() for item in items], "warnings": warnings}
+
+    parsed = _cached_parse("santander", file_hash, parse_sheet)
+    items = [SantanderItem(**item) for item in parsed["items"]]
+    warnings = parsed["warnings"]
     if not items:
         raise HTTPException(
             status_code=400,
@@ -11016,6 +14624,75 @@ def admin_delete_price(
     return {"status": "deleted", "ticker": ticker}
 
 
+@app.post("/admin/prices/history/upload")
+def admin_upload_price_history(
+    file: UploadFile,
+    authorization: str | None = Header(default=None)
+) -> dict:
+    """Carrega histórico de preços de fecho via Excel ou CSV (apenas admin)."""
+    _require_admin(authorization)
+    if not file.filename or not file.filename.lower().endswith((".xlsx", ".xls", ".csv")):
+        raise HTTPException(status_code=400, detail="File must be Excel or CSV format")
+    saved = _save_price_history(_iter_price_history_rows(file.file, file.filename), "upload")
+    if not saved:
+        raise HTTPException(status_code=400, detail="No prices found in file.")
+    return {"status": "uploaded", "count": saved}
+
+
+@app.get("/prices/history")
+def get_price_history(
+    tickers: str,
+    date_from: str | None = Query(default=None, alias="from"),
+    date_to: str | None = Query(default=None, alias="to"),
+    authorization: str | None = Header(default=None),
+) -> dict:
+    """Closes per ticker in [from, to], starting with the last close before `from`."""
+    _require_session(authorization)
+    symbols = [ticker.strip().upper() for ticker in tickers.split(",") if ticker.strip()]
+    if not symbols:
+        raise HTTPException(status_code=400, detail="At least one ticker is required.")
+    end = _parse_iso_date(date_to).isoformat() if date_to else datetime.utcnow().date().isoformat()
+    start = _parse_iso_date(date_from).isoformat() if date_from else end
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'.")
+    series = {symbol: {"dates": [], "closes": [], "currency": None} for symbol in symbols}
+    for symbol, price in _prices_as_of(symbols, start).items():
+        if price["date"] < start:
+            series[symbol].update(
+                dates=[price["date"]], closes=[price["close"]], currency=price["currency"]
+            )
+    for symbol, price_date, close, currency in _load_price_history(symbols, start, end):
+        series[symbol]["dates"].append(price_date)
+        series[symbol]["closes"].append(close)
+        series[symbol]["currency"] = currency or series[symbol]["currency"]
+    return {"from": start, "to": end, "series": series}
+
+
+@app.post("/admin/fx-rates/upload")
+def admin_upload_fx_rates(
+    file: UploadFile,
+    authorization: str | None = Header(default=None)
+) -> dict:
+    """Carrega taxas de câmbio de referência do BCE (CSV ou XML, apenas admin)."""
+    _require_admin(authorization)
+    if not file.filename or not file.filename.lower().endswith((".csv", ".xml")):
+        raise HTTPException(status_code=400, detail="File must be an ECB .csv or .xml export")
+    try:
+        saved = _save_fx_rates(_iter_ecb_rates(file.file, file.filename), "upload")
+    except ElementTree.ParseError as exc:
+        raise HTTPException(status_code=400, detail="Invalid FX rate file.") from exc
+    if not saved:
+        raise HTTPException(status_code=400, detail="No FX rates found in file.")
+    return {"status": "uploaded", "count": saved}
+
+
+@app.post("/admin/fx-rates/refresh")
+def admin_refresh_fx_rates(authorization: str | None = Header(default=None)) -> dict:
+    """Atualiza as taxas de câmbio a partir do BCE (apenas admin)."""
+    _require_admin(authorization)
+    return {"status": "completed", "count": _fetch_fx_rates()}
+
+
 @app.post("/admin/tickers/upload")
 async def admin_upload_tickers_excel(
     file: UploadFile,
@@ -11028,23 +14705,11 @@ async def admin_upload_tickers_excel(
         raise HTTPException(status_code=400, detail="File must be Excel format (.xlsx or .xls)")
     
     try:
-        import openpyxl
-        content = await file.read()
-        
-        # Criar ficheiro temporário
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
-        
-        # Ler Excel
-        wb = openpyxl.load_workbook(tmp_path)
-        ws = wb.active
-        
+        # Ler Excel linha a linha, só a primeira coluna interessa
         tickers = []
         seen_header = False
         
-        for row in ws.iter_rows(values_only=True):
+        for row in _iter_sheet_rows(file.file, file.filename, max_col=1):
             if not row or not row[0]:  # Skip empty rows
                 continue
             
@@ -11064,10 +14729,6 @@ async def admin_upload_tickers_excel(
             if cell_value and len(cell_value) <= 20:  # Reasonable ticker length
                 tickers.append(cell_value)
         
-        # Limpar ficheiro temporário
-        import os
-        os.unlink(tmp_path)
-        
         if not tickers:
             raise HTTPException(status_code=400, detail="No tickers found in file. Make sure tickers are in the first column.")
         
@@ -11093,34 +14754,12 @@ async def admin_update_fixed_ticker_data(
         raise HTTPException(status_code=400, detail="File must be Excel format (.xlsx or .xls)")
     
     try:
-        import openpyxl
-        import tempfile
-        import os
-        
-        content = await file.read()
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
-        
-        wb = openpyxl.load_workbook(tmp_path)
-        ws = wb.active
-        
         # Expected columns: Ticker, Name, Class, Sector, Country, Currency
-        headers = []
-        data_rows = []
-        
-        for idx, row in enumerate(ws.iter_rows(values_only=True), 1):
-            if idx == 1:  # Header row
-                headers = [str(cell).strip().lower() if cell else "" for cell in row]
-                continue
-            
-            if not row or not row[0]:  # Skip empty rows
-                continue
-            
-            data_rows.append(row)
-        
-        os.unlink(tmp_path)
+        rows = _iter_sheet_rows(file.file, file.filename)
+        header = next(rows, None) or []
+        headers = [str(cell).strip().lower() if cell else "" for cell in header]
+        # Data rows are streamed straight into the upsert below
+        data_rows = (row for row in rows if row and row[0])
         
         # Validate headers
         required = ['ticker', 'name', 'class', 'sector', 'country', 'currency']
@@ -11203,33 +14842,11 @@ async def admin_update_all_from_excel(
         raise HTTPException(status_code=400, detail="File must be Excel format (.xlsx or .xls)")
     
     try:
-        import openpyxl
-        import tempfile
-        import os
-        
-        content = await file.read()
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
-        
-        wb = openpyxl.load_workbook(tmp_path)
-        ws = wb.active
-        
-        headers = []
-        data_rows = []
-        
-        for idx, row in enumerate(ws.iter_rows(values_only=True), 1):
-            if idx == 1:  # Header row
-                headers = [str(cell).strip().lower() if cell else "" for cell in row]
-                continue
-            
-            if not row or not row[0]:  # Skip empty rows
-                continue
-            
-            data_rows.append(row)
-        
-        os.unlink(tmp_path)
+        rows = _iter_sheet_rows(file.file, file.filename)
+        header = next(rows, None) or []
+        headers = [str(cell).strip().lower() if cell else "" for cell in header]
+        # Data rows are streamed straight into the upsert below
+        data_rows = (row for row in rows if row and row[0])
         
         # Expected columns (all fields)
         required = ['ticker']
@@ -11403,105 +15020,69 @@ def admin_fetch_ticker_metadata(
 
 
 @app.post("/admin/tickers/fetch-bulk")
-async def admin_fetch_bulk_metadata(
+def admin_fetch_bulk_metadata(
     tickers: list[str],
     authorization: str | None = Header(default=None)
 ) -> dict:
-    """Busca metadados completos e preços para múltiplos tickers (apenas admin).
+    """Agenda a busca de metadados e preços para múltiplos tickers (apenas admin).
     
-    Usa Finnhub API se configurado, com rate limit de 59 calls/min.
-    Cada ticker requer 4 chamadas: profile2, quote, metric, dividend (total ~4.2s por ticker).
+    Corre num job em background; o progresso é consultado em GET /admin/jobs/{job_id}.
+    Com Finnhub cada ticker requer 4 chamadas (profile2, quote, metric, dividend).
     """
+    session = _require_admin(authorization)
+    items = [ticker.strip().upper() for ticker in tickers if ticker.strip()]
+    if not items:
+        raise HTTPException(status_code=400, detail="No tickers provided.")
+    return _enqueue_background_job("ticker_metadata", session["email"], items)
+
+
+@app.post("/admin/prices/fetch-bulk")
+def admin_fetch_bulk_prices(
+    tickers: list[str],
+    authorization: str | None = Header(default=None)
+) -> dict:
+    """Agenda a atualização de preços para múltiplos tickers (apenas admin)."""
+    session = _require_admin(authorization)
+    items = [ticker.strip().upper() for ticker in tickers if ticker.strip()]
+    if not items:
+        raise HTTPException(status_code=400, detail="No tickers provided.")
+    return _enqueue_background_job("ticker_prices", session["email"], items)
+
+
+@app.get("/admin/jobs")
+def admin_list_jobs(
+    authorization: str | None = Header(default=None),
+    limit: int = 50
+) -> dict:
+    """Lista os jobs em background mais recentes (apenas admin)."""
     _require_admin(authorization)
-    
-    import time
-    
-    success = []
-    errors = []
-    total = len(tickers)
-    
-    # Estimate time: 4 API calls per ticker with 1.05s between = ~4.2s per ticker
-    estimated_time = total * 4.2 if PRICE_API_PROVIDER in ("finnhub", "finhub") else total * 3.0
-    
-    print(f"\n{'='*60}")
-    print(f"Starting comprehensive metadata fetch for {total} tickers...")
-    print(f"Provider: {PRICE_API_PROVIDER}")
-    print(f"Estimated time: {estimated_time:.0f} seconds (~{estimated_time / 60:.1f} minutes)")
-    print(f"{'='*60}\n")
-    
-    for idx, ticker_raw in enumerate(tickers, 1):
-        ticker = ticker_raw.strip().upper()
-        print(f"\n[{idx}/{total}] Processing: {ticker}")
-        
-        try:
-            # Fetch comprehensive metadata using Finnhub (includes rate limiting)
-            if PRICE_API_PROVIDER in ("finnhub", "finhub"):
-                metadata = _fetch_metadata_finnhub(ticker)
-                
-                # Save metadata to database
-                _save_ticker_metadata(metadata)
-                
-                # Save price if available
-                if metadata.get("price"):
-                    _upsert_price(ticker, metadata["price"])
-                    print(f"✓ {ticker}: ${metadata['price']:.2f} | {metadata.get('name', 'N/A')} | {metadata.get('country', 'N/A')} | Div: {metadata.get('dividend_yield', 0):.2%}")
-                else:
-                    print(f"⚠ {ticker}: Metadata saved but no price available")
-                
-                success.append(ticker)
-                
-            else:
-                # Fallback to basic price fetch for other providers
-                price_value = _fetch_latest_price(ticker)
-                
-                # Save basic metadata
-                metadata = {
-                    "ticker": ticker,
-                    "name": ticker,
-                    "asset_class": "Stock",
-                    "sector": None,
-                    "industry": None,
-                    "country": None,
-                    "region": None,
-                    "currency": "USD",
-                    "exchange": None,
-                    "dividend_yield": None,
-                    "dividend_frequency": None,
-                    "next_dividend_date": None,
-                    "next_dividend_amount": None
-                }
-                _save_ticker_metadata(metadata)
-                _upsert_price(ticker, price_value)
-                
-                print(f"✓ {ticker}: Price ${price_value:.2f}")
-                success.append(ticker)
-                
-                # Rate limiting for non-Finnhub providers
-                if idx < total:
-                    time.sleep(3.0)
-                
-        except Exception as e:
-            error_msg = str(e)[:150]
-            errors.append({"ticker": ticker, "error": error_msg})
-            print(f"✗ {ticker}: {error_msg}")
-    
-    print(f"\n{'='*60}")
-    print(f"Bulk fetch completed!")
-    print(f"✓ Success: {len(success)}/{total} ({len(success)/total*100:.1f}%)" if total else "No tickers")
-    print(f"✗ Errors: {len(errors)}/{total}")
-    if errors:
-        print(f"Failed tickers: {', '.join([e['ticker'] for e in errors[:10]])}")
-        if len(errors) > 10:
-            print(f"... and {len(errors) - 10} more")
-    print(f"{'='*60}\n")
-    
-    return {
-        "status": "completed",
-        "success": len(success),
-        "errors": len(errors),
-        "success_tickers": success,
-        "error_details": errors
-    }
+    return {"items": _list_background_jobs(limit)}
+
+
+@app.get("/admin/jobs/{job_id}")
+def admin_get_job(
+    job_id: str,
+    authorization: str | None = Header(default=None)
+) -> dict:
+    """Progresso de um job em background (apenas admin)."""
+    _require_admin(authorization)
+    job = _get_background_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
+@app.post("/admin/jobs/{job_id}/cancel")
+def admin_cancel_job(
+    job_id: str,
+    authorization: str | None = Header(default=None)
+) -> dict:
+    """Pede o cancelamento de um job em background (apenas admin)."""
+    _require_admin(authorization)
+    job = _cancel_background_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
 
 
 @app.get("/admin/tickers/metadata")
@@ -11671,3 +15252,7 @@ def admin_test_api_provider(
 @app.post("/auth/google")
 def google_oauth() -> dict:
     raise HTTPException(status_code=501, detail="Google OAuth not implemented.")
+
+
+# Last, so migrations and the write-time sync can call helpers defined anywhere above.
+_init_db()
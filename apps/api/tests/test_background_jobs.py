@@ -0,0 +1,111 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+
+
+class _DeferredPool:
+    def __init__(self) -> None:
+        self.submitted: list[tuple] = []
+
+    def submit(self, func, *args):
+        self.submitted.append((func, args))
+
+
+class BackgroundJobsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.pool = _DeferredPool()
+        self.main._background_job_pool = lambda: self.pool
+        self.processed: list[str] = []
+
+        def fake_prices(ticker: str) -> dict:
+            self.processed.append(ticker)
+            if ticker == "BAD":
+                raise self.main.HTTPException(status_code=400, detail="Price unavailable for BAD.")
+            return {"ticker": ticker, "price": 1.0}
+
+        self.main.BACKGROUND_JOB_HANDLERS["ticker_prices"] = fake_prices
+
+    def tearDown(self) -> None:
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def test_job_runs_items_and_records_errors(self) -> None:
+        job = self.main._enqueue_background_job(
+            "ticker_prices", "admin@example.com", ["aapl", "BAD", "MSFT"]
+        )
+        self.assertEqual(job["status"], "queued")
+        self.assertEqual(len(self.pool.submitted), 1)
+
+        self.main._run_background_job(job["job_id"])
+        job = self.main._get_background_job(job["job_id"])
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(job["progress"], 100)
+        self.assertEqual(job["success"], 2)
+        self.assertEqual(job["error_details"][0]["ticker"], "BAD")
+        self.assertEqual(self.processed, ["AAPL", "BAD", "MSFT"])
+
+    def test_interrupted_job_resumes_from_checkpoint(self) -> None:
+        job = self.main._enqueue_background_job(
+            "ticker_prices", "admin@example.com", ["AAA", "BBB", "CCC"]
+        )
+        with self.main._db_connection() as conn:
+            conn.execute(
+                """
+                UPDATE background_jobs
+                SET status = 'running', checkpoint = 2, success_count = 2
+                WHERE id = ?
+                """,
+                (job["job_id"],),
+            )
+        self.pool.submitted.clear()
+        self.main._resume_background_jobs()
+        self.assertEqual(len(self.pool.submitted), 1)
+        func, args = self.pool.submitted[0]
+        func(*args)
+
+        job = self.main._get_background_job(job["job_id"])
+        self.assertEqual(self.processed, ["CCC"])
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(job["success"], 3)
+
+    def test_cancel_stops_queued_job(self) -> None:
+        job = self.main._enqueue_background_job(
+            "ticker_prices", "admin@example.com", ["AAA", "BBB"]
+        )
+        cancelled = self.main._cancel_background_job(job["job_id"])
+        self.assertEqual(cancelled["status"], "cancelled")
+        self.main._run_background_job(job["job_id"])
+        self.assertEqual(self.processed, [])
+
+    def test_cancel_stops_running_job_between_items(self) -> None:
+        job = self.main._enqueue_background_job(
+            "ticker_prices", "admin@example.com", ["AAA", "BBB", "CCC"]
+        )
+        job_id = job["job_id"]
+
+        def cancelling_handler(ticker: str) -> dict:
+            self.processed.append(ticker)
+            self.main._cancel_background_job(job_id)
+            return {"ticker": ticker}
+
+        self.main.BACKGROUND_JOB_HANDLERS["ticker_prices"] = cancelling_handler
+        self.main._run_background_job(job_id)
+        job = self.main._get_background_job(job_id)
+        self.assertEqual(self.processed, ["AAA"])
+        self.assertEqual(job["status"], "cancelled")
+        self.assertEqual(job["completed"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import importlib
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+from fastapi import HTTPException
+
+
+def _statement(days: range, extra: list[str] | None = None) -> str:
+    lines = ["Data;Descricao;Montante;Saldo"]
+    lines += [f"2025-01-{day:02d};Pingo Doce {day};-{day}.50;{1000 - day}.00" for day in days]
+    return "\n".join(lines + (extra or []))
+
+
+class BankingDedupTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.email = "user@example.com"
+        self.authorization = f"Bearer {self.main._issue_session(self.email)}"
+        portfolio = self.main._create_portfolio(self.email, "Test Portfolio", "EUR", ["Cash"])
+        self.portfolio_id = portfolio["id"]
+
+    def tearDown(self) -> None:
+        self.main._clear_banking_staging()
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _import(self, text: str, duplicates: str = "skip") -> dict:
+        preview = self.main.banking_preview(
+            self.portfolio_id,
+            authorization=self.authorization,
+            institution="Santander",
+            text=text,
+            file=None,
+        )
+        payload = self.main.BankingCommitRequest(
+            source_file=preview["source_file"],
+            file_hash=preview["file_hash"],
+            institution="Santander",
+            mapping=preview["mapping"],
+            duplicates=duplicates,
+        )
+        return self.main.banking_commit(
+            self.portfolio_id, payload, authorization=self.authorization
+        )
+
+    def _spent(self) -> float:
+        with self.main._db_connection() as conn:
+            return conn.execute(
+                "SELECT SUM(spent) FROM banking_monthly_spend WHERE portfolio_id = ?",
+                (self.portfolio_id,),
+            ).fetchone()[0]
+
+    def test_overlapping_statements_only_insert_new_rows(self) -> None:
+        first = self._import(_statement(range(1, 21)))
+        second = self._import(_statement(range(10, 29)))
+
+        self.assertEqual((first["inserted"], first["skipped"]), (20, 0))
+        self.assertEqual((second["inserted"], second["skipped"]), (8, 11))
+        items = self.main._list_banking_transactions(self.portfolio_id)
+        self.assertEqual(len(items), 28)
+        self.assertAlmostEqual(self._spent(), sum(day + 0.5 for day in range(1, 29)))
+        with self.main._db_connection() as conn:
+            row_count = conn.execute(
+                "SELECT row_count FROM banking_imports WHERE id = ?", (second["import_id"],)
+            ).fetchone()[0]
+        self.assertEqual(row_count, 8)
+
+    def test_repeated_rows_within_a_statement_are_kept(self) -> None:
+        coffee = ["2025-01-02;Cafe;-1.00;", "2025-01-02;Cafe;-1.00;"]
+        result = self._import(_statement(range(1, 3), coffee))
+        self.assertEqual(result["inserted"], 4)
+
+        # A later export repeating the day with a third coffee adds just that one.
+        again = _statement(range(2, 4), coffee + ["2025-01-02;Cafe;-1.00;"])
+        result = self._import(again)
+        self.assertEqual((result["inserted"], result["skipped"]), (2, 3))
+
+    def test_reject_mode_refuses_overlapping_statements(self) -> None:
+        self._import(_statement(range(1, 11)))
+
+        with self.assertRaises(HTTPException) as ctx:
+            self._import(_statement(range(5, 15)), duplicates="reject")
+
+        self.assertEqual(ctx.exception.status_code, 409)
+        self.assertEqual(len(self.main._list_banking_transactions(self.portfolio_id)), 10)
+
+    def test_upgrade_fingerprints_existing_duplicates(self) -> None:
+        self.main._close_db_connections()
+        path = os.environ["DB_PATH"]
+        conn = sqlite3.connect(path)
+        conn.execute("DROP INDEX idx_banking_transactions_fingerprint")
+        conn.execute("ALTER TABLE banking_transactions DROP COLUMN fingerprint")
+        conn.execute("DELETE FROM schema_migrations WHERE version = 10")
+        for import_id in (1, 2):
+            conn.execute(
+                """
+                INSERT INTO banking_imports (
+                    id, portfolio_id, institution, source_file, file_hash, imported_at, row_count
+                ) VALUES (?, ?, 'Santander', 'a.csv', ?, '2025-01-31', 1)
+                """,
+                (import_id, self.portfolio_id, f"hash-{import_id}"),
+            )
+            conn.execute(
+                """
+                INSERT INTO banking_transactions (
+                    import_id, portfolio_id, institution, tx_date, description, amount,
+                    currency, category, subcategory, raw_json, created_at
+                ) VALUES (?, ?, 'Santander', '2025-01-05', 'Renda', -500, 'EUR', 'Casa',
+                          'Renda', '{}', '2025-01-31')
+                """,
+                (import_id, self.portfolio_id),
+            )
+        conn.commit()
+        conn.close()
+
+        self.main._init_db()
+
+        with self.main._db_connection() as conn:
+            fingerprints = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT fingerprint FROM banking_transactions ORDER BY id"
+                )
+            ]
+        self.assertIsNotNone(fingerprints[0])
+        self.assertIsNone(fingerprints[1])
+        result = self._import(
+            "Data;Descricao;Montante\n2025-01-05;Renda;-500\n2025-01-06;Luz;-40"
+        )
+        self.assertEqual((result["inserted"], result["skipped"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
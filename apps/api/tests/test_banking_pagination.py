@@ -0,0 +1,119 @@
+import importlib
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+
+class BankingPaginationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.email = "user@example.com"
+        self.authorization = f"Bearer {self.main._issue_session(self.email)}"
+        portfolio = self.main._create_portfolio(self.email, "Test Portfolio", "EUR", ["Cash"])
+        self.portfolio_id = portfolio["id"]
+        import_id = self.main._save_banking_import(
+            self.portfolio_id, "Santander", "extrato.csv", "hash", 0
+        )
+        items = []
+        for index in range(90):
+            # Three transactions per day so pages split inside a date.
+            items.append(
+                {
+                    "tx_date": f"2025-{index // 30 + 1:02d}-{index // 3 % 10 + 1:02d}",
+                    "description": f"Compra {index}",
+                    "amount": -float(index + 1),
+                    "category": "Habitação" if index % 2 else "Lazer",
+                    "subcategory": "Renda" if index % 2 else "Sem subcategoria",
+                }
+            )
+        self.main._save_banking_transactions(self.portfolio_id, import_id, "Santander", items)
+
+    def tearDown(self) -> None:
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _get(self, **params) -> dict:
+        values = {
+            "month": None,
+            "category": None,
+            "subcategory": None,
+            "institution": None,
+            "after": None,
+            "limit": None,
+            "fields": None,
+            "format": None,
+            "accept": None,
+        }
+        values.update(params)
+        return self.main.list_banking_transactions(
+            self.portfolio_id, authorization=self.authorization, **values
+        )
+
+    def test_pages_cover_the_full_list_in_order(self) -> None:
+        full = self._get()
+        self.assertIsNone(full["next_cursor"])
+        self.assertEqual(len(full["items"]), 90)
+
+        paged: list[dict] = []
+        cursor = None
+        while True:
+            page = self._get(after=cursor, limit=7)
+            paged.extend(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(paged, full["items"])
+        keys = [(item["tx_date"], item["id"]) for item in paged]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+
+    def test_filters_use_normalized_keys_and_projection(self) -> None:
+        page = self._get(
+            month="2025-02", category="HABITACAO", subcategory="renda", fields="amount"
+        )
+        self.assertEqual(len(page["items"]), 15)
+        self.assertEqual(set(page["items"][0]), {"id", "tx_date", "amount"})
+        self.assertTrue(all(item["tx_date"].startswith("2025-02") for item in page["items"]))
+
+        tx_id = page["items"][0]["id"]
+        self.main._update_banking_transaction_category(self.portfolio_id, tx_id, "Lazer", None)
+        page = self._get(month="2025-02", category="habitação")
+        self.assertNotIn(tx_id, [item["id"] for item in page["items"]])
+
+    def test_ndjson_stream_matches_json_pages(self) -> None:
+        self.main.BANKING_STREAM_PAGE_ROWS = 8
+        lines = list(
+            self.main._stream_banking_transactions(
+                self.portfolio_id,
+                {"month": None, "category": "lazer", "subcategory": None, "institution": None},
+                None,
+                None,
+                self.main.BANKING_TRANSACTION_FIELDS,
+            )
+        )
+        streamed = [json.loads(line) for line in lines]
+        self.assertEqual(streamed, self._get(category="lazer")["items"])
+
+        response = self._get(accept="application/x-ndjson", limit=5)
+        self.assertIsInstance(response, self.main.StreamingResponse)
+        self.assertEqual(response.media_type, "application/x-ndjson")
+
+    def test_invalid_parameters_are_rejected(self) -> None:
+        for params in ({"after": "bogus"}, {"limit": 0}, {"fields": "raw_json"}):
+            with self.assertRaises(self.main.HTTPException) as ctx:
+                self._get(**params)
+            self.assertEqual(ctx.exception.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import importlib
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from fastapi import HTTPException
+
+
+class BankingRawStorageTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.email = "user@example.com"
+        self.authorization = f"Bearer {self.main._issue_session(self.email)}"
+        portfolio = self.main._create_portfolio(self.email, "Test Portfolio", "EUR", ["Cash"])
+        self.portfolio_id = portfolio["id"]
+
+    def tearDown(self) -> None:
+        self.main._clear_banking_staging()
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _import(self, text: str) -> dict:
+        preview = self.main.banking_preview(
+            self.portfolio_id,
+            authorization=self.authorization,
+            institution="Santander",
+            text=text,
+            file=None,
+        )
+        payload = self.main.BankingCommitRequest(
+            source_file=preview["source_file"],
+            file_hash=preview["file_hash"],
+            institution="Santander",
+            mapping=preview["mapping"],
+        )
+        return self.main.banking_commit(
+            self.portfolio_id, payload, authorization=self.authorization
+        )
+
+    def _raw(self, tx_id: int) -> dict:
+        return self.main.get_banking_transaction_raw(
+            self.portfolio_id, tx_id, authorization=self.authorization
+        )
+
+    def test_raw_row_is_rebuilt_from_the_import_header(self) -> None:
+        self._import(
+            "Data;Descricao;Montante;Referencia\n"
+            "2025-02-01;Pingo Doce;-12,30;ABC 1\n"
+            "2025-02-02;Renda;-500;\n"
+        )
+        items = self.main._list_banking_transactions(self.portfolio_id)
+
+        raw = self._raw(items[-1]["id"])
+
+        self.assertEqual(raw["columns"], ["Data", "Descricao", "Montante", "Referencia"])
+        self.assertEqual(raw["cells"], ["2025-02-01", "Pingo Doce", "-12,30", "ABC 1"])
+        self.assertEqual(raw["raw"]["Referencia"], "ABC 1")
+        with self.main._db_connection() as conn:
+            stored = conn.execute(
+                "SELECT raw_json, raw_cells FROM banking_transactions WHERE id = ?",
+                (items[-1]["id"],),
+            ).fetchone()
+        self.assertIsNone(stored["raw_json"])
+        self.assertNotIn(b"Descricao", stored["raw_cells"])
+
+        with self.assertRaises(HTTPException) as ctx:
+            self._raw(items[0]["id"] + 100)
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    def test_long_rows_are_compressed(self) -> None:
+        cells = ["2025-02-01", "Pingo Doce " * 20, "-1.00"] + [""] * 40
+        packed = self.main._pack_banking_cells(cells)
+        self.assertLess(len(packed), len(json.dumps(cells)) // 2)
+        self.assertEqual(self.main._unpack_banking_cells(packed), cells)
+        short = self.main._pack_banking_cells(["a", 1])
+        self.assertEqual(short, b'["a",1]')
+        self.assertEqual(self.main._unpack_banking_cells(short), ["a", 1])
+        self.assertIsNone(self.main._pack_banking_cells([]))
+
+    def test_upgrade_moves_raw_json_into_cells(self) -> None:
+        import_id = self.main._save_banking_import(
+            self.portfolio_id, "Santander", "extrato.csv", "hash", 1
+        )
+        with self.main._db_connection() as conn:
+            conn.execute(
+                """
+                INSERT INTO banking_transactions (
+                    import_id, portfolio_id, institution, tx_date, description, amount,
+                    currency, category, subcategory, raw_json, created_at
+                ) VALUES (?, ?, 'Santander', '2025-01-05', 'Renda', -500, 'EUR', 'Casa',
+                          'Renda', ?, '2025-01-31')
+                """,
+                (
+                    import_id,
+                    self.portfolio_id,
+                    json.dumps({"Data": "05-01-2025", "Descricao": "Renda", "Montante": "-500"}),
+                ),
+            )
+            tx_id = conn.execute("SELECT MAX(id) FROM banking_transactions").fetchone()[0]
+
+            self.main._compact_banking_raw_json(conn)
+
+        raw = self._raw(tx_id)
+        self.assertEqual(raw["columns"], ["Data", "Descricao", "Montante"])
+        self.assertEqual(raw["cells"], ["05-01-2025", "Renda", "-500"])
+
+
+if __name__ == "__main__":
+    unittest.main()
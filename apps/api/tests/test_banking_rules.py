@@ -0,0 +1,193 @@
+import importlib
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+
+class BankingRulesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        portfolio = self.main._create_portfolio(
+            "user@example.com", "Test Portfolio", "EUR", ["Cash"]
+        )
+        self.portfolio_id = portfolio["id"]
+        self.main._ensure_banking_categories(self.portfolio_id)
+        self.main._learn_banking_rule(
+            self.portfolio_id, "Santander", "Renda Casa", "Habitação", "Renda"
+        )
+
+    def tearDown(self) -> None:
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _categories(self) -> list[tuple]:
+        with self.main._db_connection() as conn:
+            return [
+                tuple(row)
+                for row in conn.execute(
+                    "SELECT parent_id, name FROM banking_categories WHERE portfolio_id = ?",
+                    (self.portfolio_id,),
+                )
+            ]
+
+    def test_batch_is_classified_with_constant_queries(self) -> None:
+        items = []
+        for index in range(5000):
+            items.append({"description": "RENDA CASA", "category": None})
+            items.append({"description": f"Pingo Doce loja {index}", "category": None})
+            items.append({"description": "Quota", "category": "Clube", "subcategory": "Quotas"})
+            items.append({"description": f"desconhecido {index}", "category": None})
+
+        statements: list[str] = []
+        with self.main._db_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                self.main._apply_banking_category_rules(
+                    self.portfolio_id, "Santander", items, conn
+                )
+            finally:
+                conn.set_trace_callback(None)
+
+        self.assertLess(len(statements), 15)
+        self.assertEqual((items[0]["category"], items[0]["subcategory"]), ("Habitação", "Renda"))
+        self.assertEqual(
+            (items[1]["category"], items[1]["subcategory"]), ("Alimentacao", "Mantimentos")
+        )
+        self.assertEqual(
+            (items[3]["category"], items[3]["subcategory"]),
+            (self.main.BANKING_DEFAULT_CATEGORY, self.main.BANKING_DEFAULT_SUBCATEGORY),
+        )
+        names = [name for _, name in self._categories()]
+        self.assertEqual(names.count("Clube"), 1)
+        self.assertIn("Quotas", names)
+
+    def test_existing_categories_are_not_duplicated(self) -> None:
+        before = self._categories()
+        items = [{"description": "renda casa", "category": None} for _ in range(3)]
+        self.main._apply_banking_category_rules(self.portfolio_id, "Santander", items)
+        self.main._upsert_banking_category(self.portfolio_id, "HABITAÇÃO", "Renda")
+        self.assertEqual(len(before), len(self._categories()))
+
+    def test_matcher_keeps_builtin_keyword_priority(self) -> None:
+        def reference(description: str) -> tuple[str, str] | None:
+            normalized = self.main._normalize_banking_description(description)
+            if not normalized:
+                return None
+            for category, subcategory, keywords in self.main.BANKING_CATEGORY_KEYWORDS:
+                if any(keyword in normalized for keyword in keywords):
+                    return category, subcategory
+            return None
+
+        samples = [
+            "Compra Pingo Doce Lisboa",
+            "GALP cafe da esquina",
+            "Uber Eats pizza",
+            "Transferencia SEPA",
+            "Cafetaria Metro",
+            "",
+        ]
+        matcher = self.main._banking_matcher(None, None)
+        for description in samples:
+            normalized = self.main._normalize_banking_description(description)
+            self.assertEqual(
+                matcher.match(normalized) if normalized else None, reference(description)
+            )
+
+    def test_custom_rules_take_priority_and_respect_word_boundaries(self) -> None:
+        self.main._save_banking_keyword_rule(
+            self.portfolio_id,
+            self.main.BankingRuleRequest(pattern="Pingo", category="Mercearia", subcategory="Bairro"),
+        )
+        self.main._save_banking_keyword_rule(
+            self.portfolio_id,
+            self.main.BankingRuleRequest(
+                match_type="regex", pattern=r"^ref \d{6}$", category="Servicos"
+            ),
+        )
+        matcher = self.main._banking_matcher(None, self.portfolio_id)
+        self.assertEqual(matcher.match("compra pingo doce"), ("Mercearia", "Bairro"))
+        # "pingos" is not the whole word "pingo", so the built-in keyword applies.
+        self.assertEqual(matcher.match("pingos continente"), ("Alimentacao", "Mantimentos"))
+        self.assertEqual(
+            matcher.match("ref 123456"), ("Servicos", self.main.BANKING_DEFAULT_SUBCATEGORY)
+        )
+        self.assertIs(self.main._banking_matcher(None, self.portfolio_id), matcher)
+
+        rule_id = self.main._list_banking_keyword_rules(self.portfolio_id)[0]["id"]
+        self.assertTrue(self.main._delete_banking_keyword_rule(self.portfolio_id, rule_id))
+        rebuilt = self.main._banking_matcher(None, self.portfolio_id)
+        self.assertIsNot(rebuilt, matcher)
+        self.assertEqual(rebuilt.match("compra pingo doce"), ("Alimentacao", "Mantimentos"))
+
+    def test_regex_rules_ignore_case_and_accents(self) -> None:
+        self.main._save_banking_keyword_rule(
+            self.portfolio_id,
+            self.main.BankingRuleRequest(
+                match_type="regex", pattern="UBER|Continente", category="Mercearia"
+            ),
+        )
+        self.main._save_banking_keyword_rule(
+            self.portfolio_id,
+            self.main.BankingRuleRequest(
+                match_type="regex", pattern=r"Condomínio \d+", category="Habitação"
+            ),
+        )
+        matcher = self.main._banking_matcher(None, self.portfolio_id)
+        for description, category in (
+            ("Compra UBER trip", "Mercearia"),
+            ("CONTINENTE Lisboa", "Mercearia"),
+            ("Condomínio 2025", "Habitação"),
+        ):
+            normalized = self.main._normalize_banking_description(description)
+            self.assertEqual(matcher.match(normalized)[0], category)
+
+    def test_unsafe_regex_rules_are_rejected(self) -> None:
+        for pattern in (r"(a+)+$", r"(?:\w*\s)*x", r"((ab)*c)+", r"(x{2,})*", "a" * 201):
+            with self.assertRaises(self.main.HTTPException) as ctx:
+                self.main._save_banking_keyword_rule(
+                    self.portfolio_id,
+                    self.main.BankingRuleRequest(
+                        match_type="regex", pattern=pattern, category="Outros"
+                    ),
+                )
+            self.assertEqual(ctx.exception.status_code, 400, pattern)
+        for pattern in (r"^ref \d{6}$", r"(mb way|mbway) \d+", r"[(+*]+ x", r"(ab)?c+"):
+            self.main._save_banking_keyword_rule(
+                self.portfolio_id,
+                self.main.BankingRuleRequest(match_type="regex", pattern=pattern, category="Outros"),
+            )
+
+    @unittest.skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run")
+    def test_benchmark_100k_descriptions(self) -> None:
+        for index in range(500):
+            self.main._save_banking_keyword_rule(
+                self.portfolio_id,
+                self.main.BankingRuleRequest(pattern=f"merchant{index}", category=f"Custom {index}"),
+            )
+        words = ["compra", "pagamento", "sepa", "lisboa", "continente", "galp", "cafe", "ref"]
+        descriptions = [
+            f"{words[index % len(words)]} {words[(index * 7) % len(words)]} merchant{index % 900}"
+            for index in range(100_000)
+        ]
+        started = time.perf_counter()
+        matcher = self.main._banking_matcher(None, self.portfolio_id)
+        compiled = time.perf_counter() - started
+        started = time.perf_counter()
+        for description in descriptions:
+            matcher.match(self.main._normalize_banking_description(description))
+        elapsed = time.perf_counter() - started
+        print(f"\nmatcher compile: {compiled * 1000:.1f} ms, 100k descriptions: {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    unittest.main()
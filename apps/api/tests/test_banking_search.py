@@ -0,0 +1,127 @@
+import importlib
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+
+class BankingSearchTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        portfolio = self.main._create_portfolio(
+            "user@example.com", "Test Portfolio", "EUR", ["Cash"]
+        )
+        self.portfolio_id = portfolio["id"]
+        self.import_id = self.main._save_banking_import(
+            self.portfolio_id, "Santander", "extrato.csv", "hash", 0
+        )
+        self._save(
+            [
+                ("2025-01-02", "Compra Pingo Doce Lisboa"),
+                ("2025-01-03", "Café Central"),
+                ("2025-01-04", "Padaria São João"),
+                ("2025-01-05", "Transferencia SEPA Renda"),
+            ]
+        )
+
+    def tearDown(self) -> None:
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _save(self, rows: list[tuple[str, str]]) -> None:
+        self.main._save_banking_transactions(
+            self.portfolio_id,
+            self.import_id,
+            "Santander",
+            [
+                {"tx_date": tx_date, "description": description, "amount": -1.0}
+                for tx_date, description in rows
+            ],
+        )
+
+    def _search(self, q: str, **kwargs) -> list[str]:
+        items = self.main._list_banking_transactions(self.portfolio_id, q=q, **kwargs)
+        return [item["description"] for item in items]
+
+    def test_prefix_and_diacritic_insensitive_matching(self) -> None:
+        self.assertEqual(self._search("cafe"), ["Café Central"])
+        self.assertEqual(self._search("PIN do"), ["Compra Pingo Doce Lisboa"])
+        self.assertEqual(self._search("sao joã"), ["Padaria São João"])
+        self.assertEqual(self._search("renda sepa"), ["Transferencia SEPA Renda"])
+        self.assertEqual(self._search("lisboa central"), [])
+        # Quotes and operators in user input are treated as plain words.
+        self.assertEqual(self._search('"pingo" OR'), [])
+        self.assertEqual(len(self._search("!!")), 4)
+
+    def test_triggers_follow_updates_and_deletes(self) -> None:
+        with self.main._db_connection() as conn:
+            conn.execute(
+                "UPDATE banking_transactions SET description = 'Mercado Bom Sucesso', "
+                "description_key = 'mercado bom sucesso' WHERE description = 'Café Central'"
+            )
+        self.assertEqual(self._search("cafe"), [])
+        self.assertEqual(self._search("sucesso"), ["Mercado Bom Sucesso"])
+
+        self.main._clear_banking_transactions(self.portfolio_id)
+        self.assertEqual(self._search("sucesso"), [])
+        with self.main._db_connection() as conn:
+            conn.execute(
+                "INSERT INTO banking_transactions_fts (banking_transactions_fts) "
+                "VALUES ('integrity-check')"
+            )
+
+    def test_upgrade_backfills_existing_transactions(self) -> None:
+        with self.main._db_connection() as conn:
+            for name in ("insert", "delete", "update"):
+                conn.execute(f"DROP TRIGGER banking_transactions_fts_{name}")
+            conn.execute("DROP TABLE banking_transactions_fts")
+            conn.execute("DROP INDEX idx_banking_transactions_month")
+            conn.execute("DROP INDEX idx_banking_transactions_category")
+            conn.execute("DROP INDEX idx_banking_transactions_fingerprint")
+            for column in ("raw_cells", "fingerprint", "description_key", "month", "category_key", "subcategory_key"):
+                conn.execute(f"ALTER TABLE banking_transactions DROP COLUMN {column}")
+            conn.execute("ALTER TABLE banking_budgets DROP COLUMN category_key")
+            conn.execute("ALTER TABLE banking_imports DROP COLUMN columns_json")
+            conn.execute("DROP TABLE banking_monthly_spend")
+            conn.execute("DELETE FROM schema_migrations WHERE version BETWEEN 7 AND 9")
+        self.main._close_db_connections()
+
+        # Pending migrations run from the import-time _init_db().
+        self.main = importlib.reload(self.main)
+
+        self.assertEqual(self._search("padaria"), ["Padaria São João"])
+        summary = self.main._banking_spend_summary(self.portfolio_id, "2025-01", "2025-01")
+        self.assertEqual(summary["totals"]["spent"], [4.0])
+
+    @unittest.skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run")
+    def test_benchmark_search_over_a_million_rows(self) -> None:
+        words = ["compra", "pagamento", "sepa", "lisboa", "porto", "continente", "galp"]
+        batch = []
+        for index in range(1_000_000):
+            description = (
+                f"{words[index % 7]} {words[index * 3 % 7]} loja{index % 5000} ref{index}"
+            )
+            batch.append((f"{2015 + index % 10}-{index % 12 + 1:02d}-01", description))
+            if len(batch) == 50_000:
+                self._save(batch)
+                batch = []
+        runs = 20
+        started = time.perf_counter()
+        for _ in range(runs):
+            items = self._search("loja123", limit=50)
+        elapsed = (time.perf_counter() - started) / runs
+        self.assertTrue(items)
+        print(f"\nFTS search over 1M rows: {elapsed * 1000:.1f} ms/query")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+
+
+class BankingStagingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.email = "user@example.com"
+        self.authorization = f"Bearer {self.main._issue_session(self.email)}"
+        portfolio = self.main._create_portfolio(self.email, "Test Portfolio", "EUR", ["Cash"])
+        self.portfolio_id = portfolio["id"]
+        self.text = "Data;Descricao;Montante\n" + "\n".join(
+            f"2025-01-{index % 28 + 1:02d};Pingo Doce {index};-{index}.50" for index in range(120)
+        )
+
+    def tearDown(self) -> None:
+        self.main._clear_banking_staging()
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _preview(self) -> dict:
+        return self.main.banking_preview(
+            self.portfolio_id,
+            authorization=self.authorization,
+            institution="Santander",
+            text=self.text,
+            file=None,
+        )
+
+    def _commit(
+        self, preview: dict, excluded_rows: list[int], file_hash: str | None = None
+    ) -> dict:
+        payload = self.main.BankingCommitRequest(
+            source_file=preview["source_file"],
+            file_hash=file_hash or preview["file_hash"],
+            institution="Santander",
+            mapping=preview["mapping"],
+            excluded_rows=excluded_rows,
+        )
+        return self.main.banking_commit(
+            self.portfolio_id, payload, authorization=self.authorization
+        )
+
+    def _transaction_count(self) -> int:
+        with self.main._db_connection() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM banking_transactions WHERE portfolio_id = ?",
+                (self.portfolio_id,),
+            ).fetchone()[0]
+
+    def test_preview_returns_sample_and_commit_uses_staged_rows(self) -> None:
+        preview = self._preview()
+        self.assertEqual(preview["total_rows"], 120)
+        self.assertEqual(len(preview["rows"]), self.main.BANKING_PREVIEW_SAMPLE_ROWS)
+
+        result = self._commit(preview, excluded_rows=[0, 1])
+
+        self.assertEqual(result["status"], "imported")
+        self.assertEqual(self._transaction_count(), 118)
+        self.assertIsNone(
+            self.main._get_staged_banking_rows(self.portfolio_id, preview["file_hash"])
+        )
+
+    def test_commit_rejects_a_file_hash_that_is_not_a_digest(self) -> None:
+        preview = self._preview()
+        for file_hash in ("../../etc/passwd", preview["file_hash"].upper(), "abc"):
+            with self.assertRaises(HTTPException) as ctx:
+                self._commit(preview, excluded_rows=[], file_hash=file_hash)
+            self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(self._transaction_count(), 0)
+        # The staged preview is untouched and still commits.
+        self.assertEqual(self._commit(preview, excluded_rows=[])["status"], "imported")
+
+    def test_large_previews_spill_to_disk(self) -> None:
+        self.main.BANKING_STAGING_MEMORY_ROWS = 10
+        preview = self._preview()
+        path = self.main._banking_staging_path(self.portfolio_id, preview["file_hash"])
+        self.assertTrue(os.path.exists(path))
+        self.assertIsNone(
+            self.main._banking_staging[(self.portfolio_id, preview["file_hash"])]["rows"]
+        )
+
+        self._commit(preview, excluded_rows=[])
+
+        self.assertEqual(self._transaction_count(), 120)
+        self.assertFalse(os.path.exists(path))
+
+    def test_expired_preview_is_evicted(self) -> None:
+        self.main.BANKING_STAGING_MEMORY_ROWS = 10
+        preview = self._preview()
+        key = (self.portfolio_id, preview["file_hash"])
+        self.main._banking_staging[key]["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+
+        with self.assertRaises(HTTPException) as ctx:
+            self._commit(preview, excluded_rows=[])
+
+        self.assertEqual(ctx.exception.status_code, 410)
+        self.assertNotIn(key, self.main._banking_staging)
+        self.assertFalse(os.path.exists(self.main._banking_staging_path(*key)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+
+
+class BankingSummaryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.email = "user@example.com"
+        self.authorization = f"Bearer {self.main._issue_session(self.email)}"
+        portfolio = self.main._create_portfolio(self.email, "Test Portfolio", "EUR", ["Cash"])
+        self.portfolio_id = portfolio["id"]
+        import_id = self.main._save_banking_import(
+            self.portfolio_id, "Santander", "extrato.csv", "hash", 5
+        )
+        self.main._save_banking_transactions(
+            self.portfolio_id,
+            import_id,
+            "Santander",
+            [
+                self._item("2025-01-05", -40.0, "Habitação"),
+                self._item("2025-01-20", -10.0, "habitacao"),
+                self._item("2025-01-25", 1500.0, "Salario"),
+                self._item("2025-02-03", -25.5, "Alimentacao"),
+                self._item("2025-03-09", -60.0, "Habitação"),
+            ],
+        )
+
+    def tearDown(self) -> None:
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _item(self, tx_date: str, amount: float, category: str) -> dict:
+        return {
+            "tx_date": tx_date,
+            "description": f"{category} {tx_date}",
+            "amount": amount,
+            "category": category,
+            "subcategory": "Sem subcategoria",
+        }
+
+    def _rollup(self) -> list[tuple]:
+        with self.main._db_connection() as conn:
+            return [
+                tuple(row)
+                for row in conn.execute(
+                    "SELECT month, category_key, round(spent, 2), round(income, 2), tx_count "
+                    "FROM banking_monthly_spend WHERE portfolio_id = ? "
+                    "ORDER BY month, category_key",
+                    (self.portfolio_id,),
+                )
+            ]
+
+    def test_rollup_tracks_commit_update_and_clear(self) -> None:
+        self.assertEqual(
+            self._rollup(),
+            [
+                ("2025-01", "habitacao", 50.0, 0.0, 2),
+                ("2025-01", "salario", 0.0, 1500.0, 1),
+                ("2025-02", "alimentacao", 25.5, 0.0, 1),
+                ("2025-03", "habitacao", 60.0, 0.0, 1),
+            ],
+        )
+        with self.main._db_connection() as conn:
+            tx_id = conn.execute(
+                "SELECT id FROM banking_transactions WHERE tx_date = '2025-02-03'"
+            ).fetchone()[0]
+        self.main._update_banking_transaction_category(
+            self.portfolio_id, tx_id, "Habitação", "Renda"
+        )
+        self.assertIn(("2025-02", "habitacao", 25.5, 0.0, 1), self._rollup())
+        self.assertNotIn("alimentacao", [row[1] for row in self._rollup()])
+
+        self.main._clear_banking_transactions(self.portfolio_id)
+        self.assertEqual(self._rollup(), [])
+
+    def test_backfill_matches_incremental_rollup(self) -> None:
+        expected = self._rollup()
+        with self.main._db_connection() as conn:
+            conn.execute("DELETE FROM banking_monthly_spend")
+            self.main._backfill_banking_monthly_spend(conn)
+        self.assertEqual(self._rollup(), expected)
+
+    def test_upgrade_backfills_existing_transactions(self) -> None:
+        expected = self._rollup()
+        with self.main._db_connection() as conn:
+            conn.execute("DROP TABLE banking_monthly_spend")
+            conn.execute("ALTER TABLE banking_budgets DROP COLUMN category_key")
+            conn.execute("DELETE FROM schema_migrations WHERE version = 7")
+        self.main._close_db_connections()
+
+        # The pending migration runs from the import-time _init_db(); a fresh
+        # import (not a reload) so later definitions are not already bound.
+        sys.modules.pop("app.main")
+        self.main = importlib.import_module("app.main")
+
+        self.assertEqual(self._rollup(), expected)
+
+    def test_budgets_for_a_year_come_from_one_query(self) -> None:
+        for month in ("2025-01", "2025-03"):
+            self.main._upsert_banking_budget(self.portfolio_id, "Habitação", month, 100.0)
+        statements: list[str] = []
+        with self.main._db_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                budgets = self.main._list_banking_budgets(self.portfolio_id, "2025-01", "2025-12")
+            finally:
+                conn.set_trace_callback(None)
+        selects = [statement for statement in statements if "SELECT" in statement.upper()]
+        self.assertEqual(len(selects), 1)
+        self.assertEqual([item["spent"] for item in budgets], [50.0, 60.0])
+        self.assertEqual(budgets[1]["remaining"], 40.0)
+
+        response = self.main.list_banking_budgets(
+            self.portfolio_id, month="2025-03", authorization=self.authorization
+        )
+        self.assertEqual([item["month"] for item in response["items"]], ["2025-03"])
+
+    def test_summary_returns_category_month_matrix(self) -> None:
+        summary = self.main.banking_spend_summary(
+            self.portfolio_id,
+            month_from="2025-01",
+            month_to="2025-03",
+            authorization=self.authorization,
+        )
+        self.assertEqual(summary["months"], ["2025-01", "2025-02", "2025-03"])
+        habitacao = summary["categories"][0]
+        self.assertEqual(habitacao["category"], "Habitação")
+        self.assertEqual(habitacao["spent"], [50.0, 0.0, 60.0])
+        self.assertEqual(habitacao["total_spent"], 110.0)
+        self.assertEqual(summary["totals"]["spent"], [50.0, 25.5, 60.0])
+        self.assertEqual(summary["totals"]["income"], [1500.0, 0.0, 0.0])
+
+        default = self.main.banking_spend_summary(
+            self.portfolio_id, month_from=None, month_to="2025-03", authorization=self.authorization
+        )
+        self.assertEqual(default["from"], "2024-04")
+        self.assertEqual(len(default["months"]), 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
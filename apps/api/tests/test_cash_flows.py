@@ -0,0 +1,213 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+
+
+class CashFlowLedgerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.email = "user@example.com"
+        self.authorization = f"Bearer {self.main._issue_session(self.email)}"
+        portfolio = self.main._create_portfolio(
+            self.email,
+            "Test Portfolio",
+            "EUR",
+            ["Cash", "Emergency Funds", "Retirement Plans", "Stocks"],
+        )
+        self.portfolio_id = portfolio["id"]
+
+    def tearDown(self) -> None:
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _add_xtb_snapshot(
+        self, portfolio_id: int, snapshot_date: str, invested: float, current_value: float
+    ) -> int:
+        saved = self.main._save_xtb_imports(
+            portfolio_id,
+            [
+                self.main.XtbImportItem(
+                    filename=f"xtb-{snapshot_date}.xlsx",
+                    file_hash=f"xtb-{snapshot_date}",
+                    account_type="Broker",
+                    category="Stocks",
+                    current_value=current_value,
+                    cash_value=0.0,
+                    invested=invested,
+                    profit_value=current_value - invested,
+                    profit_percent=None,
+                )
+            ],
+        )
+        with self.main._db_connection() as conn:
+            conn.execute(
+                "UPDATE xtb_imports SET imported_at = ? WHERE id = ?",
+                (snapshot_date, saved[0]["id"]),
+            )
+        return saved[0]["id"]
+
+    def test_invested_deltas_become_flows_and_are_patched(self) -> None:
+        self._add_xtb_snapshot(self.portfolio_id, "2023-01-10", 1000.0, 1000.0)
+        middle_id = self._add_xtb_snapshot(self.portfolio_id, "2023-06-10", 1500.0, 1600.0)
+        self._add_xtb_snapshot(self.portfolio_id, "2024-01-10", 1200.0, 1400.0)
+
+        flows = self.main._portfolio_cash_flows(self.portfolio_id, {"stocks"})
+        self.assertEqual(
+            flows,
+            [
+                (date(2023, 1, 10), -1000.0),
+                (date(2023, 6, 10), -500.0),
+                (date(2024, 1, 10), 300.0),
+            ],
+        )
+
+        with self.main._db_connection() as conn:
+            conn.execute("DELETE FROM xtb_imports WHERE id = ?", (middle_id,))
+        flows = self.main._portfolio_cash_flows(self.portfolio_id, {"stocks"})
+        self.assertEqual(flows, [(date(2023, 1, 10), -1000.0), (date(2024, 1, 10), -200.0)])
+        self.assertEqual(self.main._portfolio_cash_flows(self.portfolio_id, {"cash"}), [])
+
+    def test_ledger_reads_do_not_write(self) -> None:
+        self._add_xtb_snapshot(self.portfolio_id, "2025-01-10T10:00:00", 1000.0, 1000.0)
+        statements: list[str] = []
+        conn = self.main._thread_db_connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            flows = self.main._portfolio_cash_flows(self.portfolio_id, {"stocks"})
+        finally:
+            conn.set_trace_callback(None)
+        self.assertEqual(flows, [(date(2025, 1, 10), -1000.0)])
+        writes = [
+            statement
+            for statement in statements
+            if statement.lstrip().split(None, 1)[0].upper() in ("INSERT", "UPDATE", "DELETE")
+        ]
+        self.assertEqual(writes, [])
+
+    def test_accented_upper_case_categories_match(self) -> None:
+        portfolio = self.main._create_portfolio(self.email, "Ações", "EUR", ["AÇÕES"])
+        saved = self.main._save_xtb_imports(
+            portfolio["id"],
+            [
+                self.main.XtbImportItem(
+                    filename="xtb.xlsx",
+                    file_hash="xtb-hash",
+                    account_type="Broker",
+                    category="AÇÕES",
+                    current_value=1000.0,
+                    cash_value=0.0,
+                    invested=1000.0,
+                    profit_value=0.0,
+                    profit_percent=None,
+                )
+            ],
+        )
+        with self.main._db_connection() as conn:
+            conn.execute(
+                "UPDATE xtb_imports SET imported_at = ? WHERE id = ?",
+                ("2025-01-10T10:00:00", saved[0]["id"]),
+            )
+        settings = self.main._get_category_settings(portfolio["id"])
+        settings_lookup = {
+            self.main._normalize_text(key): value for key, value in settings.items()
+        }
+        categories, _ = self.main._portfolio_investment_scope(
+            portfolio["id"], ["AÇÕES"], settings_lookup
+        )
+        self.assertEqual(
+            self.main._portfolio_cash_flows(portfolio["id"], categories),
+            [(date(2025, 1, 10), -1000.0)],
+        )
+
+    def test_trades_and_deposits_feed_the_ledger(self) -> None:
+        self._add_xtb_snapshot(self.portfolio_id, "2023-01-10", 1000.0, 1000.0)
+        self.main._save_holding_transaction(
+            self.portfolio_id,
+            self.main.HoldingTransactionRequest(
+                ticker="AAPL",
+                operation="buy",
+                trade_date="2023-03-01",
+                shares=2,
+                price=50.0,
+                fee=1.0,
+                category="Stocks",
+            ),
+        )
+        self.main._save_holdings_operations(
+            None,
+            self.portfolio_id,
+            "xtb.xlsx",
+            [
+                self.main.HoldingOperationItem(
+                    source_file="xtb.xlsx",
+                    operation_type="Deposit",
+                    operation_kind="other",
+                    amount=900.0,
+                    trade_date="2023-01-05",
+                ),
+                self.main.HoldingOperationItem(
+                    source_file="xtb.xlsx",
+                    operation_type="Dividend",
+                    operation_kind="dividend",
+                    amount=12.0,
+                    trade_date="2023-02-05",
+                ),
+            ],
+        )
+
+        flows = self.main._portfolio_cash_flows(self.portfolio_id, {"stocks"})
+        # XTB deposits replace the XTB invested deltas; dividends stay inside.
+        self.assertEqual(flows, [(date(2023, 1, 5), -900.0), (date(2023, 3, 1), -101.0)])
+
+    def test_summaries_report_xirr(self) -> None:
+        other = self.main._create_portfolio(self.email, "Other", "EUR", ["Stocks"])
+        self._add_xtb_snapshot(self.portfolio_id, "2023-01-10", 1000.0, 1100.0)
+        self._add_xtb_snapshot(other["id"], "2024-01-10", 500.0, 450.0)
+        today = datetime.utcnow().date()
+
+        summary = self.main.portfolio_summary(self.portfolio_id, authorization=self.authorization)
+        expected = self.main._xirr([(date(2023, 1, 10), -1000.0), (today, 1100.0)])
+        self.assertAlmostEqual(summary["irr"], expected * 100, places=6)
+
+        aggregated = self.main.aggregated_portfolio_summary(authorization=self.authorization)
+        expected = self.main._xirr(
+            [(date(2023, 1, 10), -1000.0), (date(2024, 1, 10), -500.0), (today, 1550.0)]
+        )
+        self.assertAlmostEqual(aggregated["irr"], expected * 100, places=6)
+
+    def test_manual_trades_are_valued_in_the_irr(self) -> None:
+        portfolio = self.main._create_portfolio(self.email, "Manual", "USD", ["Stocks"])
+        buy_date = datetime.utcnow().date() - timedelta(days=365)
+        self.main._save_holding_transaction(
+            portfolio["id"],
+            self.main.HoldingTransactionRequest(
+                ticker="AAPL",
+                operation="buy",
+                trade_date=buy_date.isoformat(),
+                shares=10,
+                price=100.0,
+                category="Stocks",
+            ),
+        )
+        self.main._upsert_price("AAPL", 110.0, "USD")
+
+        summary = self.main.portfolio_summary(portfolio["id"], authorization=self.authorization)
+
+        self.assertEqual(summary["total"], 0.0)
+        self.assertAlmostEqual(summary["irr"], 10.0, delta=0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
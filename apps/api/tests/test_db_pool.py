@@ -0,0 +1,88 @@
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+
+class DbConnectionPoolTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+
+    def tearDown(self) -> None:
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def test_connection_is_reused_and_uses_wal(self) -> None:
+        with self.main._db_connection() as first:
+            journal_mode = first.execute("PRAGMA journal_mode").fetchone()[0]
+            with self.main._db_connection() as nested:
+                self.assertIs(nested, first)
+        with self.main._db_connection() as second:
+            self.assertIs(second, first)
+        self.assertEqual(journal_mode.lower(), "wal")
+
+    def test_threads_get_their_own_connection(self) -> None:
+        with self.main._db_connection() as conn:
+            main_conn = conn
+        seen = []
+
+        def worker() -> None:
+            with self.main._db_connection() as conn:
+                seen.append(conn)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(seen), 1)
+        self.assertIsNot(seen[0], main_conn)
+
+    def test_nested_failure_only_rolls_back_inner_block(self) -> None:
+        with self.main._db_connection() as conn:
+            conn.execute(
+                "INSERT INTO user_profiles (email, age, updated_at) VALUES (?, ?, ?)",
+                ("outer@example.com", 30, "2025-01-01"),
+            )
+            with self.assertRaises(RuntimeError):
+                with self.main._db_connection(conn) as inner:
+                    inner.execute(
+                        "INSERT INTO user_profiles (email, age, updated_at) VALUES (?, ?, ?)",
+                        ("inner@example.com", 40, "2025-01-01"),
+                    )
+                    raise RuntimeError("boom")
+        with self.main._db_connection() as conn:
+            emails = [
+                row["email"]
+                for row in conn.execute("SELECT email FROM user_profiles ORDER BY email")
+            ]
+        self.assertEqual(emails, ["outer@example.com"])
+
+    def test_outer_failure_rolls_back_everything(self) -> None:
+        with self.assertRaises(RuntimeError):
+            with self.main._db_connection() as conn:
+                conn.execute(
+                    "INSERT INTO user_profiles (email, age, updated_at) VALUES (?, ?, ?)",
+                    ("outer@example.com", 30, "2025-01-01"),
+                )
+                with self.main._db_connection() as inner:
+                    inner.execute(
+                        "INSERT INTO user_profiles (email, age, updated_at) VALUES (?, ?, ?)",
+                        ("inner@example.com", 40, "2025-01-01"),
+                    )
+                raise RuntimeError("boom")
+        with self.main._db_connection() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM user_profiles").fetchone()[0]
+        self.assertEqual(count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
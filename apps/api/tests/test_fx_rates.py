@@ -0,0 +1,128 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+from io import BytesIO
+
+from fastapi import HTTPException
+from starlette.datastructures import UploadFile
+
+ECB_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gesmes:Envelope xmlns:gesmes="http://www.gesmes.org/xml/2002-08-01"
+    xmlns="http://www.ecb.int/vocabulary/2002-08-01/eurofxref">
+  <Cube>
+    <Cube time="2025-01-06">
+      <Cube currency="USD" rate="1.04"/>
+      <Cube currency="GBP" rate="0.83"/>
+    </Cube>
+    <Cube time="2025-01-03">
+      <Cube currency="USD" rate="1.03"/>
+      <Cube currency="GBP" rate="0.83"/>
+    </Cube>
+  </Cube>
+</gesmes:Envelope>
+"""
+
+ECB_CSV = b"Date,USD,JPY,CYP,\n2025-01-07,1.05,163.5,N/A,\n2025-01-06,1.04,162.0,N/A,\n"
+
+
+class FxRatesTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        os.environ["ADMIN_USERNAME"] = "admin@example.com"
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.authorization = f"Bearer {self.main._issue_session('admin@example.com')}"
+
+    def tearDown(self) -> None:
+        os.environ.pop("ADMIN_USERNAME", None)
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _upload(self, content: bytes, filename: str) -> dict:
+        return self.main.admin_upload_fx_rates(
+            file=UploadFile(file=BytesIO(content), filename=filename),
+            authorization=self.authorization,
+        )
+
+    def _convert(self, amount: float, source: str, target: str, on: date | None = None) -> float:
+        return float(self.main._fx_rates().convert([amount], [source], target, on)[0])
+
+    def test_empty_table_keeps_the_fixed_rates(self) -> None:
+        self.assertAlmostEqual(self._convert(100.0, "USD", "EUR"), 92.0)
+        self.assertAlmostEqual(self._convert(92.0, "EUR", "GBP"), 79.0)
+        self.assertEqual(self._convert(5.0, "XYZ", "EUR"), 5.0)
+
+    def test_xml_rates_are_carried_over_weekends(self) -> None:
+        self.assertEqual(self._upload(ECB_XML, "eurofxref-hist.xml")["count"], 4)
+
+        convert = self._convert
+        self.assertAlmostEqual(convert(103.0, "USD", "EUR", date(2025, 1, 3)), 100.0)
+        # Saturday uses Friday's fixing, days after the last fixing use the latest one.
+        self.assertAlmostEqual(convert(103.0, "USD", "EUR", date(2025, 1, 4)), 100.0)
+        self.assertAlmostEqual(convert(104.0, "USD", "EUR"), 100.0)
+        self.assertAlmostEqual(convert(104.0, "USD", "GBP", date(2025, 1, 6)), 83.0)
+        # Currencies the ECB file does not list still use the fallback table.
+        self.assertAlmostEqual(convert(92.0, "EUR", "CHF", date(2025, 1, 6)), 85.0)
+
+    def test_csv_upload_and_vectorised_conversion(self) -> None:
+        self.assertEqual(self._upload(ECB_CSV, "eurofxref-hist.csv")["count"], 4)
+
+        converted = self.main._fx_rates().convert(
+            [105.0, 163.5, 10.0, 7.0],
+            ["USD", "JPY", "EUR", None],
+            "EUR",
+            [date(2025, 1, 7), date(2025, 1, 7), date(2025, 1, 7), date(2025, 1, 7)],
+        )
+        self.assertEqual([round(value, 6) for value in converted], [100.0, 1.0, 10.0, 7.0])
+
+        # A corrected file overrides the stored rate for the same day.
+        self._upload(b"Date,USD\n2025-01-07,1.00\n", "fix.csv")
+        self.assertAlmostEqual(self._convert(5.0, "USD", "EUR"), 5.0)
+
+    def test_upload_rejects_unknown_formats(self) -> None:
+        with self.assertRaises(HTTPException) as ctx:
+            self._upload(ECB_CSV, "rates.xlsx")
+        self.assertEqual(ctx.exception.status_code, 400)
+        with self.assertRaises(HTTPException) as ctx:
+            self._upload(b"Date,USD\n", "empty.csv")
+        self.assertEqual(ctx.exception.status_code, 400)
+
+    def test_refresh_maps_bad_provider_responses_to_502(self) -> None:
+        responses = [b"<html><body>Service unavailable", b"<?xml version='1.0'?><x/>"]
+
+        class Response:
+            def __init__(self, payload: bytes) -> None:
+                self.payload = payload
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args) -> None:
+                return None
+
+            def read(self) -> bytes:
+                return self.payload
+
+        original = self.main.urllib.request.urlopen
+        self.main.urllib.request.urlopen = lambda url, timeout: Response(responses.pop(0))
+        try:
+            for _ in range(2):
+                with self.assertRaises(HTTPException) as ctx:
+                    self.main.admin_refresh_fx_rates(authorization=self.authorization)
+                self.assertEqual(ctx.exception.status_code, 502)
+        finally:
+            self.main.urllib.request.urlopen = original
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -20,6 +20,7 @@ class GoalsSummaryTest(unittest.TestCase):
         self.goal_id = goal["id"]
 
     def tearDown(self) -> None:
+        self.main._close_db_connections()
         self.tempdir.cleanup()
 
     def test_goal_summary_with_contributions(self) -> None:
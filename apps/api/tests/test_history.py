@@ -30,6 +30,7 @@ class HistoryAggregationTest(unittest.TestCase):
         self.snapshot_date = "2025-01-10T10:00:00"
 
     def tearDown(self) -> None:
+        self.main._close_db_connections()
         self.tempdir.cleanup()
 
     def test_history_aggregates_totals_and_categories(self) -> None:
@@ -186,6 +187,154 @@ class HistoryAggregationTest(unittest.TestCase):
         self.assertAlmostEqual(row["emergency"], 2800.0, places=2)
         self.assertAlmostEqual(row["invested"], 6600.0, places=2)
 
+    def _add_xtb_snapshot(self, snapshot_date: str, current_value: float) -> int:
+        saved = self.main._save_xtb_imports(
+            self.portfolio_id,
+            [
+                self.main.XtbImportItem(
+                    filename=f"xtb-{snapshot_date}.xlsx",
+                    file_hash=f"xtb-{snapshot_date}",
+                    account_type="Broker",
+                    category="Stocks",
+                    current_value=current_value,
+                    cash_value=0.0,
+                    invested=current_value,
+                    profit_value=0.0,
+                    profit_percent=None,
+                )
+            ],
+        )
+        import_id = saved[0]["id"]
+        with self.main._db_connection() as conn:
+            conn.execute(
+                "UPDATE xtb_imports SET imported_at = ? WHERE id = ?",
+                (snapshot_date, import_id),
+            )
+        return import_id
+
+    def test_history_store_patches_only_changed_imports(self) -> None:
+        first_id = self._add_xtb_snapshot("2025-01-10T10:00:00", 1000.0)
+        self._add_xtb_snapshot("2025-02-10T10:00:00", 1200.0)
+        history = self.main._list_portfolio_history(
+            self.portfolio_id, self.settings_lookup
+        )
+        self.assertEqual([row["date"] for row in history], ["2025-01-10", "2025-02-10"])
+
+        with self.main._db_connection() as conn:
+            entry_ids = [
+                row["id"]
+                for row in conn.execute(
+                    "SELECT id FROM portfolio_history_entries WHERE portfolio_id = ?",
+                    (self.portfolio_id,),
+                ).fetchall()
+            ]
+        self._add_xtb_snapshot("2025-03-10T10:00:00", 1500.0)
+        with self.main._db_connection() as conn:
+            conn.execute("DELETE FROM xtb_imports WHERE id = ?", (first_id,))
+
+        history = self.main._list_portfolio_history(
+            self.portfolio_id, self.settings_lookup
+        )
+        self.assertEqual([row["date"] for row in history], ["2025-02-10", "2025-03-10"])
+        self.assertAlmostEqual(history[-1]["total"], 1500.0, places=2)
+        with self.main._db_connection() as conn:
+            remaining = {
+                row["id"]
+                for row in conn.execute(
+                    "SELECT id FROM portfolio_history_entries WHERE portfolio_id = ?",
+                    (self.portfolio_id,),
+                ).fetchall()
+            }
+            dirty = conn.execute(
+                "SELECT COUNT(*) FROM portfolio_history_dirty WHERE portfolio_id = ?",
+                (self.portfolio_id,),
+            ).fetchone()[0]
+        # The February entry was left untouched; only changed imports were rebuilt.
+        self.assertIn(entry_ids[1], remaining)
+        self.assertNotIn(entry_ids[0], remaining)
+        self.assertEqual(dirty, 0)
+        self.assertEqual(self.main._latest_history_date(self.portfolio_id), "2025-03-10")
+
+    def test_history_reads_do_not_write(self) -> None:
+        self._add_xtb_snapshot("2025-01-10T10:00:00", 1000.0)
+        with self.main._db_connection() as conn:
+            dirty = conn.execute(
+                "SELECT COUNT(*) FROM portfolio_history_dirty WHERE portfolio_id = ?",
+                (self.portfolio_id,),
+            ).fetchone()[0]
+        # The write transaction drained its own queue before committing.
+        self.assertEqual(dirty, 0)
+
+        statements: list[str] = []
+        conn = self.main._thread_db_connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            history = self.main._list_portfolio_history(
+                self.portfolio_id, self.settings_lookup
+            )
+            latest = self.main._latest_history_date(self.portfolio_id)
+        finally:
+            conn.set_trace_callback(None)
+        self.assertEqual([row["date"] for row in history], ["2025-01-10"])
+        self.assertEqual(latest, "2025-01-10")
+        writes = [
+            statement
+            for statement in statements
+            if statement.lstrip().split(None, 1)[0].upper() in ("INSERT", "UPDATE", "DELETE")
+        ]
+        self.assertEqual(writes, [])
+
+    def test_history_since_returns_delta(self) -> None:
+        self._add_xtb_snapshot("2025-01-10T10:00:00", 1000.0)
+        self._add_xtb_snapshot("2025-02-10T10:00:00", 1200.0)
+        self._add_xtb_snapshot("2025-03-10T10:00:00", 1500.0)
+        history = self.main._list_portfolio_history(
+            self.portfolio_id, self.settings_lookup, "2025-02-10"
+        )
+        self.assertEqual([row["date"] for row in history], ["2025-02-10", "2025-03-10"])
+
+    def test_history_delta_requires_current_revision(self) -> None:
+        authorization = f"Bearer {self.main._issue_session('user@example.com')}"
+        first_id = self._add_xtb_snapshot("2025-01-10T10:00:00", 1000.0)
+        self._add_xtb_snapshot("2025-02-10T10:00:00", 1200.0)
+        full = self.main.portfolio_history(self.portfolio_id, authorization=authorization)
+        self.assertIsNone(full["since"])
+
+        # A delta served against the revision the client already holds.
+        delta = self.main.portfolio_history(
+            self.portfolio_id,
+            since="2025-02-10",
+            revision=full["revision"],
+            authorization=authorization,
+        )
+        self.assertEqual(delta["since"], "2025-02-10")
+        self.assertEqual([row["date"] for row in delta["items"]], ["2025-02-10"])
+
+        # Deleting an older snapshot is invisible to a date-keyed delta, so
+        # the stale revision gets the full series instead.
+        with self.main._db_connection() as conn:
+            conn.execute("DELETE FROM xtb_imports WHERE id = ?", (first_id,))
+        refreshed = self.main.portfolio_history(
+            self.portfolio_id,
+            since="2025-02-10",
+            revision=full["revision"],
+            authorization=authorization,
+        )
+        self.assertGreater(refreshed["revision"], full["revision"])
+        self.assertIsNone(refreshed["since"])
+        self.assertEqual([row["date"] for row in refreshed["items"]], ["2025-02-10"])
+
+    def test_appending_snapshots_keeps_history_revision(self) -> None:
+        self._add_xtb_snapshot("2025-01-10T10:00:00", 1000.0)
+        with self.main._db_connection() as conn:
+            revision = self.main._portfolio_history_revision(conn, self.portfolio_id)
+        with self.main._db_connection() as conn:
+            self._add_xtb_snapshot("2025-02-10T10:00:00", 1200.0)
+        with self.main._db_connection() as conn:
+            self.assertEqual(
+                self.main._portfolio_history_revision(conn, self.portfolio_id), revision
+            )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -30,6 +30,7 @@ class HoldingsPriceRefreshTest(unittest.TestCase):
         self.snapshot_date = "2025-01-10T10:00:00"
 
     def tearDown(self) -> None:
+        self.main._close_db_connections()
         self.tempdir.cleanup()
 
     def test_auto_fetches_price_when_cache_missing(self) -> None:
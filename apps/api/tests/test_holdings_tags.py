@@ -32,6 +32,7 @@ class HoldingsTagsTest(unittest.TestCase):
         self.snapshot_date = "2025-01-10T10:00:00"
 
     def tearDown(self) -> None:
+        self.main._close_db_connections()
         self.tempdir.cleanup()
 
     def _seed_holdings(self) -> None:
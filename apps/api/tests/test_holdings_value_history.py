@@ -0,0 +1,119 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+
+from fastapi import HTTPException
+
+
+class HoldingsValueHistoryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.email = "user@example.com"
+        self.authorization = f"Bearer {self.main._issue_session(self.email)}"
+        portfolio = self.main._create_portfolio(self.email, "Test Portfolio", "EUR", ["Stocks"])
+        self.portfolio_id = portfolio["id"]
+        self._trade("VWCE", "buy", "2025-01-02", 10, 100.0, fee=1.0)
+        self._trade("AAPL", "buy", "2025-01-06", 2, 200.0)
+        self._trade("VWCE", "sell", "2025-01-08", 4, 112.0)
+        self.main._save_price_history(
+            [
+                ("VWCE", "2025-01-03", 105.0, "EUR"),
+                ("VWCE", "2025-01-06", 110.0, "EUR"),
+            ],
+            "test",
+        )
+        self.main._save_fx_rates([("2025-01-06", "USD", 1.05)], "test")
+
+    def tearDown(self) -> None:
+        self.main._clear_holdings_history_cache()
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _trade(self, ticker: str, operation: str, trade_date: str, shares: float,
+               price: float, fee: float | None = None) -> None:
+        self.main.create_holding_transaction(
+            self.portfolio_id,
+            self.main.HoldingTransactionRequest(
+                ticker=ticker,
+                operation=operation,
+                trade_date=trade_date,
+                shares=shares,
+                price=price,
+                fee=fee,
+            ),
+            authorization=self.authorization,
+        )
+
+    def _history(self, date_from: str | None, date_to: str, freq: str = "daily") -> dict:
+        return self.main.portfolio_holdings_history(
+            self.portfolio_id,
+            date_from=date_from,
+            date_to=date_to,
+            freq=freq,
+            authorization=self.authorization,
+        )
+
+    def test_daily_values_replay_trades_against_closes(self) -> None:
+        history = self._history("2025-01-01", "2025-01-08")
+
+        aapl = round(2 * 200.0 / 1.05, 2)
+        self.assertEqual(history["tickers"], ["AAPL", "VWCE"])
+        self.assertEqual(
+            [item["value"] for item in history["items"]],
+            [0.0, 1000.0, 1050.0, 1050.0, 1050.0, 1100.0 + aapl, 1100.0 + aapl, 672.0 + aapl],
+        )
+        self.assertEqual(history["items"][1]["invested"], 1001.0)
+        self.assertEqual(history["items"][-1]["invested"], 1000.6)
+        self.assertEqual(history["series"]["AAPL"][-1], aapl)
+        self.assertEqual(history["currency"], "EUR")
+
+    def test_weekly_and_monthly_sampling_keep_period_ends(self) -> None:
+        weekly = self._history(None, "2025-01-08", "weekly")
+        self.assertEqual(weekly["from"], "2025-01-02")
+        self.assertEqual([item["date"] for item in weekly["items"]], ["2025-01-05", "2025-01-08"])
+        self.assertEqual(weekly["items"][0]["value"], 1050.0)
+
+        monthly = self._history("2024-12-15", "2025-02-03", "monthly")
+        self.assertEqual(
+            [item["date"] for item in monthly["items"]],
+            ["2024-12-31", "2025-01-31", "2025-02-03"],
+        )
+        self.assertEqual(monthly["items"][0]["value"], 0.0)
+
+    def test_cache_is_invalidated_by_trades_and_prices(self) -> None:
+        first = self._history("2025-01-01", "2025-01-10")
+        self.assertIs(self._history("2025-01-01", "2025-01-10"), first)
+
+        self.main._save_price_history([("VWCE", "2025-01-09", 120.0, "EUR")], "test")
+        repriced = self._history("2025-01-01", "2025-01-10")
+        self.assertIsNot(repriced, first)
+        self.assertEqual(repriced["series"]["VWCE"][-1], 720.0)
+
+        self._trade("VWCE", "buy", "2025-01-10", 4, 118.0)
+        traded = self._history("2025-01-01", "2025-01-10")
+        self.assertEqual(traded["series"]["VWCE"][-1], 1180.0)
+
+    def test_invalid_parameters_are_rejected(self) -> None:
+        for date_from, date_to, freq in (
+            ("2025-01-01", "2025-01-08", "hourly"),
+            ("2025-02-01", "2025-01-08", "daily"),
+            ("yesterday", "2025-01-08", "daily"),
+        ):
+            with self.assertRaises(HTTPException) as ctx:
+                self._history(date_from, date_to, freq)
+            self.assertEqual(ctx.exception.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
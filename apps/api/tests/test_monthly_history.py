@@ -0,0 +1,151 @@
+import importlib
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+
+YEARS = 10
+SNAPSHOT_DAYS = (5, 28)
+
+
+def _month_dates(years: int) -> list[tuple[str, int, int]]:
+    months = []
+    for index in range(years * 12):
+        year = 2015 + index // 12
+        month = index % 12 + 1
+        months.append((f"{year:04d}-{month:02d}", year, month))
+    return months
+
+
+def seed_monthly_imports(main, portfolio_id: int, years: int = YEARS) -> dict[str, float]:
+    """Two snapshots per month for every source over `years`; returns expected month totals."""
+    expected: dict[str, float] = {}
+    with main._db_connection() as conn:
+        for index, (month_key, year, month) in enumerate(_month_dates(years)):
+            month_total = 0.0
+            for day in SNAPSHOT_DAYS:
+                iso = f"{year:04d}-{month:02d}-{day:02d}T10:00:00"
+                # Trade Republic manual entries use the dd-mm-yyyy format.
+                dmy = f"{day:02d}-{month:02d}-{year:04d}"
+                base = 1000.0 + index + day / 100
+                santander = conn.execute(
+                    "INSERT INTO santander_imports (portfolio_id, filename, imported_at) "
+                    "VALUES (?, ?, ?)",
+                    (portfolio_id, "santander.xlsx", iso),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO santander_items (import_id, section, account, balance, category) "
+                    "VALUES (?, 'Contas', ?, ?, 'Cash')",
+                    [(santander, "A", base), (santander, "B", base)],
+                )
+                conn.execute(
+                    "INSERT INTO trade_republic_entries (portfolio_id, available_cash, "
+                    "interests_received, invested, value, gains, currency, source, "
+                    "snapshot_date, created_at) VALUES (?, 0, 0, 0, ?, 0, 'EUR', 'manual', ?, ?)",
+                    (portfolio_id, base, dmy, iso),
+                )
+                conn.execute(
+                    "INSERT INTO save_ngrow_imports (portfolio_id, invested_total, "
+                    "current_value_total, currency, source_file, file_hash, snapshot_date, "
+                    "created_at) VALUES (?, 0, ?, 'EUR', 'save.xlsx', ?, ?, ?)",
+                    (portfolio_id, base, f"save-{iso}", iso, iso),
+                )
+                conn.execute(
+                    "INSERT INTO save_ngrow_entries (portfolio_id, invested, current_value, "
+                    "currency, source_file, file_hash, snapshot_date, created_at) "
+                    "VALUES (?, 0, 99999, 'EUR', 'save.xlsx', ?, ?, ?)",
+                    (portfolio_id, f"entry-{iso}", iso, iso),
+                )
+                conn.execute(
+                    "INSERT INTO aforronet_imports (portfolio_id, invested_total, "
+                    "current_value_total, category, currency, source_file, file_hash, "
+                    "snapshot_date, created_at) VALUES (?, 0, ?, 'Emergency Funds', 'EUR', "
+                    "'aforronet.pdf', ?, ?, ?)",
+                    (portfolio_id, base, f"aforronet-{iso}", iso, iso),
+                )
+                bancoinvest = conn.execute(
+                    "INSERT INTO bancoinvest_imports (portfolio_id, source_file, file_hash, "
+                    "snapshot_date, imported_at) VALUES (?, 'bancoinvest.xlsx', ?, ?, ?)",
+                    (portfolio_id, f"bancoinvest-{iso}", iso, iso),
+                ).lastrowid
+                conn.execute(
+                    "INSERT INTO bancoinvest_items (import_id, holder, current_value, category) "
+                    "VALUES (?, 'Holder', ?, 'Retirement Plans')",
+                    (bancoinvest, base),
+                )
+                conn.executemany(
+                    "INSERT INTO xtb_imports (portfolio_id, account_type, category, "
+                    "current_value, cash_value, invested, source_file, file_hash, imported_at) "
+                    "VALUES (?, ?, 'Stocks', ?, 0, 0, 'xtb.xlsx', ?, ?)",
+                    [
+                        (portfolio_id, "Broker", base, f"xtb-broker-{iso}", iso),
+                        (portfolio_id, "Savings", base, f"xtb-savings-{iso}", iso),
+                    ],
+                )
+                # Santander (2 items) + TR + Save'n'Grow + AforroNet + BancoInvest + XTB (2 accounts).
+                month_total = base * 8
+            expected[month_key] = round(month_total, 2)
+    return expected
+
+
+class MonthlyHistoryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        portfolio = self.main._create_portfolio(
+            "user@example.com",
+            "Test Portfolio",
+            "EUR",
+            ["Cash", "Emergency Funds", "Retirement Plans", "Stocks"],
+        )
+        self.portfolio_id = portfolio["id"]
+
+    def tearDown(self) -> None:
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def test_latest_snapshot_per_month_per_source(self) -> None:
+        expected = seed_monthly_imports(self.main, self.portfolio_id, years=1)
+        items = self.main._list_portfolio_monthly_history(self.portfolio_id)
+        self.assertEqual({item["month"]: item["total"] for item in items}, expected)
+
+    def test_entries_used_when_no_save_ngrow_imports(self) -> None:
+        with self.main._db_connection() as conn:
+            conn.execute(
+                "INSERT INTO save_ngrow_entries (portfolio_id, invested, current_value, "
+                "currency, source_file, file_hash, snapshot_date, created_at) "
+                "VALUES (?, 0, 250, 'EUR', 'save.xlsx', 'h1', '2025-03-01', '2025-03-01')",
+                (self.portfolio_id,),
+            )
+            conn.execute(
+                "INSERT INTO save_ngrow_entries (portfolio_id, invested, current_value, "
+                "currency, source_file, file_hash, snapshot_date, created_at) "
+                "VALUES (?, 0, 300, 'EUR', 'save.xlsx', 'h2', '20-03-2025', '2025-03-20')",
+                (self.portfolio_id,),
+            )
+        items = self.main._list_portfolio_monthly_history(self.portfolio_id)
+        self.assertEqual(items, [{"month": "2025-03", "total": 300.0}])
+
+    @unittest.skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run")
+    def test_benchmark_ten_years(self) -> None:
+        expected = seed_monthly_imports(self.main, self.portfolio_id)
+        runs = 20
+        started = time.perf_counter()
+        for _ in range(runs):
+            items = self.main._list_portfolio_monthly_history(self.portfolio_id)
+        elapsed = (time.perf_counter() - started) / runs
+        self.assertEqual(len(items), len(expected))
+        print(f"\n_list_portfolio_monthly_history ({YEARS} years): {elapsed * 1000:.1f} ms/call")
+
+
+if __name__ == "__main__":
+    unittest.main()
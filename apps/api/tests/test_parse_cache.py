@@ -0,0 +1,155 @@
+import hashlib
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from io import BytesIO
+
+from fastapi import HTTPException
+from openpyxl import Workbook
+from starlette.datastructures import UploadFile
+
+
+def _workbook_bytes(rows: list[list]) -> bytes:
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+SAVENGROW = _workbook_bytes(
+    [
+        ["Plano", None, None, "Investido", "Valor"],
+        ["TOTAL", None, None, 100, 110],
+        ["Fundo A", None, None, 100, 110, 10, 10, "2025-04-30"],
+    ]
+)
+BANCOINVEST = _workbook_bytes(
+    [["Carteira"], ["Titular", "Var Moeda", "Valor"], ["Holder", 15, 215], ["Data", "2025-05-31"]]
+)
+
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.email = "user@example.com"
+        self.authorization = f"Bearer {self.main._issue_session(self.email)}"
+        portfolio = self.main._create_portfolio(
+            self.email, "Test Portfolio", "EUR", ["Cash", "Stocks", "Retirement Plans"]
+        )
+        self.portfolio_id = portfolio["id"]
+
+    def tearDown(self) -> None:
+        self.main._clear_parse_cache()
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _fail_parsing(self, name: str) -> None:
+        def parse(*args, **kwargs):
+            raise AssertionError(f"{name} must not run")
+
+        setattr(self.main, name, parse)
+
+    def test_repeated_preview_skips_workbook_parsing(self) -> None:
+        def preview() -> dict:
+            return self.main.bancoinvest_preview(
+                self.portfolio_id,
+                file=UploadFile(file=BytesIO(BANCOINVEST), filename="carteira.xlsx"),
+                authorization=self.authorization,
+            )
+
+        first = preview()
+        first["items"][0]["invested"] = -1
+        self._fail_parsing("_read_bancoinvest_cells")
+
+        second = preview()
+
+        self.assertEqual(second["file_hash"], first["file_hash"])
+        self.assertEqual(second["snapshot_date"], "2025-05-31")
+        self.assertEqual(second["items"][0]["invested"], 200)
+
+    def test_committed_uploads_are_refused_before_parsing(self) -> None:
+        content = b"not really a workbook"
+        self.main._save_xtb_imports(
+            self.portfolio_id,
+            [
+                self.main.XtbImportItem(
+                    filename="xtb.xlsx",
+                    file_hash=hashlib.sha256(content).hexdigest(),
+                    account_type="Broker",
+                    category="Stocks",
+                    current_value=10.0,
+                    cash_value=0.0,
+                    invested=10.0,
+                    profit_value=0.0,
+                    profit_percent=None,
+                )
+            ],
+        )
+        self._fail_parsing("_parse_xtb_file")
+
+        with self.assertRaises(HTTPException) as ctx:
+            self.main.xtb_preview(
+                self.portfolio_id,
+                files=[UploadFile(file=BytesIO(content), filename="account_50721856_again.xlsx")],
+                authorization=self.authorization,
+            )
+
+        self.assertEqual(ctx.exception.status_code, 409)
+        self.assertIn("account_50721856_again.xlsx", ctx.exception.detail)
+
+    def test_evicted_results_spill_to_disk(self) -> None:
+        self.main.PARSE_CACHE_SIZE = 1
+        self.main.PARSE_CACHE_DIR = os.path.join(self.tempdir.name, "parse-cache")
+        parsed = self.main._read_savengrow_cells(SAVENGROW, "savengrow.xlsx")
+        self.main._put_parsed_upload("savengrow", "a" * 64, parsed)
+        self.main._put_parsed_upload("savengrow", "b" * 64, {"items": []})
+
+        self.assertEqual(len(os.listdir(self.main.PARSE_CACHE_DIR)), 1)
+        self.main._clear_parse_cache()
+        self.assertEqual(self.main._get_parsed_upload("savengrow", "a" * 64), parsed)
+        self.assertIsNone(self.main._get_parsed_upload("savengrow", "b" * 64))
+
+        self.main.PARSE_CACHE_DISK_ENTRIES = 1
+        os.utime(self.main._parse_cache_path("savengrow", "a" * 64), (0, 0))
+        stray = os.path.join(self.main.PARSE_CACHE_DIR, "notes.txt")
+        with open(stray, "w") as handle:
+            handle.write("not a cache file")
+        os.utime(stray, (0, 0))
+        self.main._put_parsed_upload("savengrow", "c" * 64, {"items": []})
+        self.main._put_parsed_upload("savengrow", "d" * 64, {"items": []})
+        self.assertEqual(
+            sorted(os.listdir(self.main.PARSE_CACHE_DIR)),
+            sorted(
+                [os.path.basename(self.main._parse_cache_path("savengrow", "c" * 64)), "notes.txt"]
+            ),
+        )
+
+    def test_spilled_entries_are_plain_json(self) -> None:
+        self.main.PARSE_CACHE_SIZE = 0
+        self.main.PARSE_CACHE_DIR = os.path.join(self.tempdir.name, "parse-cache")
+        self.main._put_parsed_upload("xtb", "e" * 64, {"current_value": 1.5, "rows": [1, "a"]})
+        path = self.main._parse_cache_path("xtb", "e" * 64)
+        with open(path, "rb") as handle:
+            self.assertEqual(handle.read(), b'{"current_value":1.5,"rows":[1,"a"]}')
+
+        with open(path, "wb") as handle:
+            handle.write(b"\x80\x04not json")
+        self.assertIsNone(self.main._get_parsed_upload("xtb", "e" * 64))
+
+
+if __name__ == "__main__":
+    unittest.main()
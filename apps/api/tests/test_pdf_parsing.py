@@ -0,0 +1,184 @@
+import importlib
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import unittest
+from io import BytesIO
+
+from fastapi import HTTPException
+from starlette.datastructures import UploadFile
+
+
+def _pdf_bytes(lines: list[str]) -> bytes:
+    """A one-page PDF that writes each line in Helvetica."""
+    text = "BT /F1 10 Tf 12 TL 40 780 Td " + " ".join(
+        f"({line}) Tj T*" for line in lines
+    ) + " ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(text), text.encode("latin-1")),
+    ]
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(output)
+
+
+def _aforronet_pdf(units: int, value: str) -> bytes:
+    return _pdf_bytes(
+        [
+            "Extrato de Certificados de Aforro",
+            f"01-01-2020 Serie E Subscricao {units} {value}",
+        ]
+    )
+
+
+def _crash_worker(file_bytes: bytes, filename: str) -> None:
+    os._exit(1)
+
+
+def _hang_worker(file_bytes: bytes, filename: str) -> None:
+    time.sleep(600)
+
+
+class PdfParsingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.main.PARSE_WORKERS = 2
+        self.email = "user@example.com"
+        self.authorization = f"Bearer {self.main._issue_session(self.email)}"
+        portfolio = self.main._create_portfolio(
+            self.email, "Test Portfolio", "EUR", ["Cash", "Emergency Funds"]
+        )
+        self.portfolio_id = portfolio["id"]
+
+    def tearDown(self) -> None:
+        self.main._shutdown_parse_pool()
+        self.main._clear_parse_cache()
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _aforronet_preview(self, files: list[tuple[str, bytes]]) -> dict:
+        return self.main.aforronet_preview(
+            self.portfolio_id,
+            files=[UploadFile(file=BytesIO(content), filename=name) for name, content in files],
+            file=None,
+            authorization=self.authorization,
+        )
+
+    def test_monthly_statements_are_parsed_in_the_pool_and_cached(self) -> None:
+        files = [
+            (f"aforronet_28-{month:02d}-2025.pdf", _aforronet_pdf(1000 * month, f"{month}050,00"))
+            for month in range(1, 4)
+        ]
+
+        preview = self._aforronet_preview(files)
+
+        self.assertEqual(
+            [item["snapshot_date"] for item in preview["items"]],
+            ["2025-01-28", "2025-02-28", "2025-03-28"],
+        )
+        self.assertEqual(
+            [item["items"][0]["current_value"] for item in preview["items"]],
+            [1050.0, 2050.0, 3050.0],
+        )
+        self.assertIsNotNone(self.main._parse_executor)
+
+        def no_pool():
+            raise AssertionError("cached statements must not be parsed again")
+
+        self.main._parse_pool = no_pool
+        again = self._aforronet_preview(list(reversed(files)))
+        self.assertEqual(
+            [item["file_hash"] for item in again["items"]],
+            [item["file_hash"] for item in reversed(preview["items"])],
+        )
+
+    def test_trade_republic_statement_uses_the_parse_service(self) -> None:
+        content = _pdf_bytes(
+            ["Checking Account EUR 1.234,50", "Interest payment EUR 3,25", "Interest tax EUR 0,80"]
+        ).replace(b"EUR", b"\\200")
+        preview = self.main.trade_republic_preview(
+            self.portfolio_id,
+            files=[UploadFile(file=BytesIO(content), filename="tr_31-03-2025.pdf")],
+            authorization=self.authorization,
+        )
+        item = preview["items"][0]
+        self.assertEqual(item["available_cash"], 1234.5)
+        self.assertEqual(item["interests_received"], 3.25)
+
+    def test_slow_extraction_times_out_and_resets_the_pool(self) -> None:
+        pool = self.main._parse_pool()
+        # Another request's parse on the same pool must survive the timeout.
+        other = pool.submit(self.main._extract_pdf_pages, _aforronet_pdf(5, "5,00"), "o.pdf")
+        self.main.PARSE_TIMEOUT_SECONDS = 1e-6
+        with self.assertRaises(HTTPException) as ctx:
+            self._aforronet_preview([("slow.pdf", _aforronet_pdf(10, "10,00"))])
+        self.assertEqual(ctx.exception.status_code, 504)
+        self.assertIsNone(self.main._parse_executor)
+        self.assertTrue(other.result(timeout=30))
+
+        self.main.PARSE_TIMEOUT_SECONDS = 60
+        preview = self._aforronet_preview([("slow.pdf", _aforronet_pdf(10, "10,00"))])
+        self.assertEqual(preview["items"][0]["items"][0]["invested"], 10.0)
+
+    def test_crashed_worker_fails_with_503_and_only_retires_its_pool(self) -> None:
+        pool = self.main._parse_pool()
+        results = dict(
+            self.main._parse_uploads("crash", _crash_worker, [("a.pdf", "a" * 64, b"x")])
+        )
+        self.assertEqual(results[0].status_code, 503)
+        self.assertIsNone(self.main._parse_executor)
+
+        fresh = self.main._parse_pool()
+        self.main._retire_parse_pool(pool)
+        self.assertIs(self.main._parse_executor, fresh)
+
+    def test_timeouts_do_not_leak_worker_processes(self) -> None:
+        before = {process.pid for process in multiprocessing.active_children()}
+        self.main.PARSE_TIMEOUT_SECONDS = 0.5
+        for attempt in range(3):
+            results = dict(
+                self.main._parse_uploads(
+                    "hang", _hang_worker, [("a.pdf", f"{attempt:064x}", b"x")]
+                )
+            )
+            self.assertEqual(results[0].status_code, 504)
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            leaked = {
+                process.pid for process in multiprocessing.active_children()
+            } - before
+            if not leaked:
+                break
+            time.sleep(0.1)
+        self.assertEqual(leaked, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
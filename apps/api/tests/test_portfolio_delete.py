@@ -52,6 +52,7 @@ class PortfolioDeleteTest(unittest.TestCase):
             )
 
     def tearDown(self) -> None:
+        self.main._close_db_connections()
         self.tempdir.cleanup()
 
     def test_delete_portfolio_removes_data(self) -> None:
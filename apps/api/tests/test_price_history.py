@@ -0,0 +1,111 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from io import BytesIO
+
+from fastapi import HTTPException
+from openpyxl import Workbook
+from starlette.datastructures import UploadFile
+
+
+class PriceHistoryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        os.environ["ADMIN_USERNAME"] = "admin@example.com"
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.authorization = f"Bearer {self.main._issue_session('admin@example.com')}"
+
+    def tearDown(self) -> None:
+        os.environ.pop("ADMIN_USERNAME", None)
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _upload(self, content: bytes, filename: str) -> dict:
+        return self.main.admin_upload_price_history(
+            file=UploadFile(file=BytesIO(content), filename=filename),
+            authorization=self.authorization,
+        )
+
+    def test_excel_and_csv_uploads_build_a_time_series(self) -> None:
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(["Ticker", "Date", "Close", "Currency"])
+        sheet.append(["aapl", datetime(2025, 1, 2), 243.85, "USD"])
+        sheet.append(["AAPL", datetime(2025, 1, 3), 243.36, "USD"])
+        sheet.append(["AAPL", "not a date", 1.0, "USD"])
+        buffer = BytesIO()
+        workbook.save(buffer)
+        self.assertEqual(self._upload(buffer.getvalue(), "aapl.xlsx")["count"], 2)
+
+        csv_text = "ticker;date;price\nVWCE;06/01/2025;130,50\nAAPL;2025-01-06;245.00\n"
+        self.assertEqual(self._upload(csv_text.encode(), "prices.csv")["count"], 2)
+
+        rows = self.main._load_price_history(["AAPL", "vwce"], "2025-01-03", "2025-01-31")
+        self.assertEqual(
+            rows,
+            [
+                ("AAPL", "2025-01-03", 243.36, "USD"),
+                ("AAPL", "2025-01-06", 245.0, None),
+                ("VWCE", "2025-01-06", 130.5, None),
+            ],
+        )
+
+        as_of = self.main._prices_as_of(["AAPL", "VWCE", "MSFT"], "2025-01-05")
+        self.assertEqual(as_of, {"AAPL": {"date": "2025-01-03", "close": 243.36, "currency": "USD"}})
+
+    def test_latest_price_writes_are_kept_as_daily_closes(self) -> None:
+        self.main._upsert_price("msft", 420.0, "USD")
+        self.main._upsert_price("MSFT", 421.5, "USD")
+        today = datetime.utcnow().date().isoformat()
+
+        self.assertEqual(
+            self.main._load_price_history(["MSFT"], today, today),
+            [("MSFT", today, 421.5, "USD")],
+        )
+
+    def test_history_endpoint_starts_from_the_previous_close(self) -> None:
+        self.main._save_price_history(
+            [
+                ("AAPL", "2024-12-31", 250.0, "USD"),
+                ("AAPL", "2025-01-02", 243.85, "USD"),
+                ("AAPL", "2025-02-03", 228.0, "USD"),
+            ],
+            "test",
+        )
+
+        result = self.main.get_price_history(
+            "AAPL, MSFT",
+            date_from="2025-01-01",
+            date_to="2025-01-31",
+            authorization=self.authorization,
+        )
+
+        self.assertEqual(result["series"]["AAPL"]["dates"], ["2024-12-31", "2025-01-02"])
+        self.assertEqual(result["series"]["AAPL"]["closes"], [250.0, 243.85])
+        self.assertEqual(result["series"]["MSFT"]["dates"], [])
+        with self.assertRaises(HTTPException) as ctx:
+            self.main.get_price_history(
+                "AAPL", date_from="2025-02-01", date_to="2025-01-01",
+                authorization=self.authorization,
+            )
+        self.assertEqual(ctx.exception.status_code, 400)
+
+    def test_upload_requires_ticker_date_and_close_columns(self) -> None:
+        with self.assertRaises(HTTPException) as ctx:
+            self._upload(b"symbol,day,value\nAAPL,2025-01-02,1\n", "prices.csv")
+        self.assertEqual(ctx.exception.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
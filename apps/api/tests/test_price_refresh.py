@@ -0,0 +1,141 @@
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+
+class PriceRefreshEngineTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+
+    def tearDown(self) -> None:
+        self.main._shutdown_price_refresh_pool()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _wait_for(self, job_id: str) -> dict:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            job = self.main._price_refresh_job_view(job_id)
+            if job["status"] == "completed":
+                return job
+            time.sleep(0.01)
+        self.fail("price refresh job did not finish")
+
+    def test_job_returns_immediately_and_reports_progress(self) -> None:
+        release = threading.Event()
+
+        def fake_fetch(ticker: str) -> float:
+            release.wait(5)
+            return {"AAPL": 10.0, "MSFT": 20.0}[ticker]
+
+        self.main._fetch_latest_price = fake_fetch
+        job = self.main._start_price_refresh_job("user@example.com", ["aapl", "MSFT"], False)
+        self.assertEqual(job["status"], "running")
+        self.assertEqual(job["total"], 2)
+        self.assertEqual([item["status"] for item in job["items"]], ["pending", "pending"])
+
+        release.set()
+        job = self._wait_for(job["job_id"])
+        self.assertEqual(job["progress"], 100)
+        self.assertEqual(
+            {item["ticker"]: item["price"] for item in job["items"]},
+            {"AAPL": 10.0, "MSFT": 20.0},
+        )
+        cached = self.main._get_cached_prices(["AAPL", "MSFT"])
+        self.assertAlmostEqual(cached["MSFT"]["price"], 20.0)
+
+    def test_shutdown_fails_jobs_left_in_flight(self) -> None:
+        release = threading.Event()
+        started = threading.Event()
+
+        def fake_fetch(ticker: str) -> float:
+            started.set()
+            release.wait(5)
+            return 10.0
+
+        self.main.PRICE_REFRESH_MAX_WORKERS = 1
+        self.main._fetch_latest_price = fake_fetch
+        job = self.main._start_price_refresh_job("user@example.com", ["AAPL", "MSFT"], False)
+        self.assertTrue(started.wait(5))
+
+        # MSFT is still queued behind AAPL, so shutdown cancels it.
+        self.main._shutdown_price_refresh_pool()
+        release.set()
+        job = self.main._price_refresh_job_view(job["job_id"])
+        self.assertEqual(job["status"], "failed")
+        self.assertIsNotNone(job["finished_at"])
+        self.assertEqual([item["status"] for item in job["items"]], ["error", "error"])
+        self.assertEqual(self.main._price_refresh_inflight, {})
+
+    def test_fresh_cached_prices_are_not_refetched(self) -> None:
+        self.main._upsert_price("AAPL", 15.0)
+        calls: list[str] = []
+        self.main._fetch_latest_price = lambda ticker: calls.append(ticker) or 1.0
+        job = self.main._start_price_refresh_job("user@example.com", ["AAPL"], False)
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual(job["items"][0]["status"], "cached")
+        self.assertEqual(calls, [])
+
+    def test_concurrent_jobs_share_inflight_fetches(self) -> None:
+        release = threading.Event()
+        calls: list[str] = []
+
+        def fake_fetch(ticker: str) -> float:
+            calls.append(ticker)
+            release.wait(5)
+            return 42.0
+
+        self.main._fetch_latest_price = fake_fetch
+        first = self.main._start_price_refresh_job("a@example.com", ["VWCE.DE"], True)
+        second = self.main._start_price_refresh_job("b@example.com", ["VWCE.DE"], True)
+        release.set()
+        self._wait_for(first["job_id"])
+        second = self._wait_for(second["job_id"])
+        self.assertEqual(calls, ["VWCE.DE"])
+        self.assertEqual(second["items"][0]["price"], 42.0)
+        self.assertIsNone(
+            self.main._get_price_refresh_job(first["job_id"], "b@example.com")
+        )
+
+    def test_twelvedata_batches_symbols(self) -> None:
+        batches: list[list[str]] = []
+
+        def fake_batch(tickers: list[str]) -> dict[str, float]:
+            batches.append(list(tickers))
+            return {ticker: 5.0 for ticker in tickers if ticker != "BAD"}
+
+        self.main.PRICE_API_PROVIDER = "twelvedata"
+        self.main.PRICE_API_KEY = "test-key"
+        self.main._fetch_prices_twelvedata = fake_batch
+        self.main._fetch_ticker_price_yfinance = lambda _ticker: None
+        job = self.main._start_price_refresh_job(
+            "user@example.com", ["AAA", "BBB", "BAD"], True
+        )
+        job = self._wait_for(job["job_id"])
+        self.assertEqual(batches, [["AAA", "BBB", "BAD"]])
+        statuses = {item["ticker"]: item["status"] for item in job["items"]}
+        self.assertEqual(statuses, {"AAA": "updated", "BBB": "updated", "BAD": "error"})
+
+    def test_token_bucket_limits_rate(self) -> None:
+        bucket = self.main._TokenBucket(rate_per_minute=600, capacity=2)
+        started = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        elapsed = time.monotonic() - started
+        self.assertGreaterEqual(elapsed, 0.15)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import importlib
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+
+# Tables that are legitimately read in full (tiny, per-user or global lookups).
+ALLOWED_SCANS = {"schema_migrations"}
+# Any SCAN is a full pass over the table, including "USING COVERING INDEX"
+# (smaller rows, still O(n)); only SEARCH seeks.
+SCAN_PATTERN = re.compile(r"^SCAN (\w+)\b")
+
+
+class QueryPlanTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        portfolio = self.main._create_portfolio(
+            "user@example.com",
+            "Test Portfolio",
+            "EUR",
+            ["Cash", "Emergency Funds", "Retirement Plans", "Stocks"],
+        )
+        self.portfolio_id = portfolio["id"]
+        settings = self.main._get_category_settings(self.portfolio_id)
+        self.settings_lookup = {
+            self.main._normalize_text(key): value for key, value in settings.items()
+        }
+
+    def tearDown(self) -> None:
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _trace_selects(self, func, *args) -> list[str]:
+        statements: list[str] = []
+        with self.main._db_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                func(*args)
+            finally:
+                conn.set_trace_callback(None)
+        return [
+            statement
+            for statement in statements
+            if statement.lstrip().upper().startswith(("SELECT", "WITH"))
+        ]
+
+    def _assert_no_full_scans(self, statements: list[str]) -> None:
+        self.assertTrue(statements)
+        with self.main._db_connection() as conn:
+            tables = {
+                row["name"]
+                for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            }
+            for statement in statements:
+                plan = conn.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+                for row in plan:
+                    detail = row["detail"]
+                    match = SCAN_PATTERN.match(detail)
+                    # CTEs and subqueries show up as scans of their own result sets.
+                    if not match or match.group(1) in ALLOWED_SCANS or match.group(1) not in tables:
+                        continue
+                    self.fail(f"Full table scan ({detail}) in query:\n{statement}")
+
+    def test_scan_pattern_flags_covering_index_scans(self) -> None:
+        for detail in (
+            "SCAN holdings_prices",
+            "SCAN holdings_prices USING COVERING INDEX sqlite_autoindex_holdings_prices_1",
+            "SCAN holdings_prices AS hp USING INDEX idx",
+        ):
+            self.assertEqual(SCAN_PATTERN.match(detail).group(1), "holdings_prices", detail)
+        self.assertIsNone(SCAN_PATTERN.match("SEARCH holdings_prices USING PRIMARY KEY (ticker=?)"))
+
+    def test_schema_version_is_recorded(self) -> None:
+        with self.main._db_connection() as conn:
+            version = self.main._schema_version(conn)
+            user_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        self.assertEqual(version, self.main.SCHEMA_MIGRATIONS[-1][0])
+        self.assertEqual(user_version, version)
+
+    def test_migrations_are_idempotent(self) -> None:
+        self.main._init_db()
+        with self.main._db_connection() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM schema_migrations").fetchone()[0]
+        self.assertEqual(count, len(self.main.SCHEMA_MIGRATIONS))
+
+    def test_holdings_queries_use_indexes(self) -> None:
+        statements = self._trace_selects(
+            self.main._list_holdings_for_portfolio, self.portfolio_id, self.settings_lookup
+        )
+        self._assert_no_full_scans(statements)
+
+    def test_monthly_history_queries_use_indexes(self) -> None:
+        statements = self._trace_selects(
+            self.main._list_portfolio_monthly_history, self.portfolio_id
+        )
+        self._assert_no_full_scans(statements)
+
+    def test_history_queries_use_indexes(self) -> None:
+        statements = self._trace_selects(
+            self.main._list_portfolio_history, self.portfolio_id, self.settings_lookup
+        )
+        self._assert_no_full_scans(statements)
+
+    def test_banking_transactions_query_uses_indexes(self) -> None:
+        statements = self._trace_selects(
+            self.main._list_banking_transactions, self.portfolio_id
+        )
+        statements += self._trace_selects(
+            lambda: self.main._list_banking_transactions(
+                self.portfolio_id,
+                month="2025-01",
+                category="Lazer",
+                after=("2025-01-31", 10),
+                limit=50,
+            )
+        )
+        self._assert_no_full_scans(statements)
+
+    def test_banking_budget_queries_use_indexes(self) -> None:
+        statements = self._trace_selects(
+            self.main._list_banking_budgets, self.portfolio_id, "2025-01", "2025-12"
+        )
+        statements += self._trace_selects(
+            self.main._banking_spend_summary, self.portfolio_id, "2025-01", "2025-12"
+        )
+        self._assert_no_full_scans(statements)
+
+    def test_cash_flow_queries_use_indexes(self) -> None:
+        statements = self._trace_selects(
+            self.main._portfolio_cash_flows,
+            self.portfolio_id,
+            {"Stocks", "Retirement Plans", "Emergency Funds"},
+        )
+        self._assert_no_full_scans(statements)
+
+    def test_price_history_queries_use_the_primary_key(self) -> None:
+        statements = self._trace_selects(
+            self.main._load_price_history, ["AAPL", "MSFT"], "2025-01-01", "2025-03-31"
+        )
+        statements += self._trace_selects(self.main._prices_as_of, ["AAPL", "MSFT"], "2025-02-15")
+        self._assert_no_full_scans(statements)
+        # The as-of lookup must be a single bounded seek per ticker: no correlated
+        # subquery re-run per row and no sort.
+        with self.main._db_connection() as conn:
+            plan = [
+                row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {statements[-1]}")
+            ]
+        self.assertEqual(
+            plan, ["SEARCH price_history USING PRIMARY KEY (ticker=? AND price_date<?)"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
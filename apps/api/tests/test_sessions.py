@@ -0,0 +1,84 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+
+
+class SessionCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.email = "user@example.com"
+        self.token = self.main._issue_session(self.email)
+        self.authorization = f"Bearer {self.token}"
+
+    def tearDown(self) -> None:
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def test_validated_session_is_served_without_writes(self) -> None:
+        self.main._require_session(self.authorization)
+        statements: list[str] = []
+        with self.main._db_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                session = self.main._require_session(self.authorization)
+            finally:
+                conn.set_trace_callback(None)
+        self.assertEqual(session["email"], self.email)
+        self.assertFalse(
+            [sql for sql in statements if sql.lstrip().upper().startswith("DELETE")]
+        )
+
+    def test_logout_invalidates_cached_session(self) -> None:
+        self.main._require_session(self.authorization)
+        self.main.logout(authorization=self.authorization)
+        with self.assertRaises(HTTPException) as ctx:
+            self.main._require_session(self.authorization)
+        self.assertEqual(ctx.exception.status_code, 401)
+
+    def test_password_reset_invalidates_all_sessions_for_email(self) -> None:
+        other = self.main._issue_session(self.email)
+        self.main._require_session(self.authorization)
+        self.main._require_session(f"Bearer {other}")
+        self.main._delete_sessions_for_email(self.email)
+        for token in (self.token, other):
+            with self.assertRaises(HTTPException):
+                self.main._require_session(f"Bearer {token}")
+
+    def test_expired_session_is_rejected(self) -> None:
+        expired = (datetime.utcnow() - timedelta(minutes=1)).isoformat()
+        with self.main._db_connection() as conn:
+            conn.execute(
+                "UPDATE sessions SET expires_at = ? WHERE token = ?",
+                (expired, self.token),
+            )
+        with self.assertRaises(HTTPException) as ctx:
+            self.main._require_session(self.authorization)
+        self.assertEqual(ctx.exception.detail, "Session expired.")
+
+    def test_cleanup_removes_expired_sessions(self) -> None:
+        expired = (datetime.utcnow() - timedelta(minutes=1)).isoformat()
+        with self.main._db_connection() as conn:
+            conn.execute(
+                "UPDATE sessions SET expires_at = ? WHERE token = ?",
+                (expired, self.token),
+            )
+        self.main._cleanup_expired_sessions()
+        self.assertIsNone(self.main._get_session(self.token))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import importlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import unittest
+from io import BytesIO
+
+from openpyxl import Workbook
+from starlette.datastructures import UploadFile
+
+
+ROWS = 200_000
+
+
+def _upload(content: bytes, filename: str) -> UploadFile:
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(content)
+    spooled.seek(0)
+    return UploadFile(file=spooled, filename=filename)
+
+
+def _workbook_bytes(rows: list[list]) -> bytes:
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+class SpreadsheetStreamingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.email = "user@example.com"
+        self.authorization = f"Bearer {self.main._issue_session(self.email)}"
+        portfolio = self.main._create_portfolio(self.email, "Test Portfolio", "EUR", ["Cash"])
+        self.portfolio_id = portfolio["id"]
+
+    def tearDown(self) -> None:
+        self.main._clear_banking_staging()
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _preview(self, upload: UploadFile) -> dict:
+        return self.main.banking_preview(
+            self.portfolio_id,
+            authorization=self.authorization,
+            institution="Santander",
+            text=None,
+            file=upload,
+        )
+
+    def test_header_detection_only_reads_the_scan_window(self) -> None:
+        pulled = 0
+
+        def rows():
+            nonlocal pulled
+            yield ["Extrato"]
+            yield ["Data", "Descricao", "Montante"]
+            for index in range(1_000_000):
+                pulled += 1
+                yield ["2025-01-02", f"Compra {index}", "-1.00"]
+
+        columns, data_rows, _, _ = self.main._build_banking_preview(rows(), "EUR")
+        self.assertEqual(columns, ["Data", "Descricao", "Montante"])
+        self.assertLessEqual(pulled, self.main.BANKING_HEADER_SCAN_ROWS)
+        self.assertEqual(next(data_rows), ["2025-01-02", "Compra 0", "-1.00"])
+
+    def test_xlsx_upload_is_streamed_into_staging(self) -> None:
+        self.main.BANKING_STAGING_MEMORY_ROWS = 10
+        content = _workbook_bytes(
+            [["Movimentos"], [None], ["Data", "Descricao", "Montante"]]
+            + [["2025-02-03", f"Pingo Doce {index}", -2.5] for index in range(60)]
+            + [["2025-02-04", None, None]]
+        )
+        upload = _upload(content, "movimentos.xlsx")
+
+        preview = self._preview(upload)
+
+        self.assertEqual(preview["total_rows"], 61)
+        self.assertEqual(preview["warnings"], ["Row 61 skipped: missing required values."])
+        self.assertEqual(preview["file_hash"], self.main.hashlib.sha256(content).hexdigest())
+        staged = self.main._get_staged_banking_rows(self.portfolio_id, preview["file_hash"])
+        self.assertEqual(len(list(staged["rows"])), 61)
+
+    def test_csv_upload_falls_back_to_latin1_per_line(self) -> None:
+        content = "Data;Descrição;Montante\n".encode("utf-8") + (
+            "2025-03-01;Padaria São João;-3,20\n".encode("latin-1")
+        )
+        preview = self._preview(_upload(content, "extrato.csv"))
+        self.assertEqual(preview["columns"], ["Data", "Descrição", "Montante"])
+        self.assertEqual(preview["rows"][0]["cells"][1], "Padaria São João")
+
+    def test_single_column_exports_are_split(self) -> None:
+        rows = [["Data,Descricao,Montante"], ["2025-01-01,Renda,-500"]]
+        self.assertEqual(
+            list(self.main._split_csv_column_rows(rows)),
+            [["Data", "Descricao", "Montante"], ["2025-01-01", "Renda", "-500"]],
+        )
+        mixed = [["Data", "Descricao"], ["a,b"]]
+        self.assertEqual(list(self.main._split_csv_column_rows(mixed)), mixed)
+
+    def test_broker_parsers_accept_uploaded_streams(self) -> None:
+        savengrow = _workbook_bytes(
+            [
+                ["Plano", None, None, "Investido", "Valor"],
+                ["TOTAL", None, None, 100, 110],
+                ["Fundo A", None, None, 100, 110, 10, 10, "2025-04-30"],
+                [None],
+            ]
+        )
+        parsed = self.main._read_savengrow_cells(
+            _upload(savengrow, "savengrow.xlsx").file, "savengrow.xlsx"
+        )
+        self.assertEqual(parsed["snapshot_date"], "2025-04-30")
+        self.assertEqual(parsed["items"][0]["current_value"], 110)
+
+        bancoinvest = _workbook_bytes(
+            [
+                ["Carteira"],
+                ["Titular", "Var Moeda", "Valor"],
+                ["Holder", 15, 215],
+                ["Data", "2025-05-31"],
+            ]
+        )
+        parsed = self.main._read_bancoinvest_cells(
+            _upload(bancoinvest, "bancoinvest.xlsx").file, "bancoinvest.xlsx"
+        )
+        self.assertEqual(parsed["snapshot_date"], "2025-05-31")
+        self.assertEqual(parsed["items"][0]["invested"], 200)
+
+    @unittest.skipUnless(os.getenv("RUN_BENCHMARKS"), "set RUN_BENCHMARKS=1 to run")
+    def test_benchmark_large_csv_peak_memory(self) -> None:
+        line = "2025-01-02;Compra cartao Pingo Doce Lisboa referencia 000123;-12,34;1234,56\n"
+        content = ("Data;Descricao;Montante;Saldo\n" + line * ROWS).encode("utf-8")
+        size = len(content)
+        upload = _upload(content, "extrato.csv")
+        del content
+        started = time.perf_counter()
+        self._preview(upload)
+        untraced = time.perf_counter() - started
+        self.main._clear_banking_staging()
+        tracemalloc.start()
+        started = time.perf_counter()
+        preview = self._preview(upload)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertEqual(preview["total_rows"], ROWS)
+        print(
+            f"\n{size / 2**20:.0f} MiB CSV preview: {untraced:.1f} s "
+            f"({elapsed:.1f} s traced), peak {peak / 2**20:.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -27,6 +27,7 @@ class SummaryAggregationTest(unittest.TestCase):
         }
 
     def tearDown(self) -> None:
+        self.main._close_db_connections()
         self.tempdir.cleanup()
 
     def _seed_aforronet_and_save(self) -> None:
@@ -123,6 +124,61 @@ class SummaryAggregationTest(unittest.TestCase):
         self.assertAlmostEqual(total_profit, 100.0, places=2)
         self.assertAlmostEqual(investment_total, 1000.0, places=2)
 
+    def test_latest_totals_are_served_from_materialized_row(self) -> None:
+        self._seed_aforronet_and_save()
+        # The import's own transaction rebuilt the row; the read only looks it up.
+        statements: list[str] = []
+        conn = self.main._thread_db_connection()
+        conn.set_trace_callback(statements.append)
+        try:
+            totals = self.main._aggregate_latest_totals(self.portfolio_id, self.settings_lookup)
+        finally:
+            conn.set_trace_callback(None)
+        self.assertEqual(
+            totals, self.main._compute_latest_totals(self.portfolio_id, self.settings_lookup)
+        )
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].lstrip().upper().startswith("SELECT"))
+        self.assertIn("portfolio_latest_totals", statements[0])
+
+    def test_latest_totals_refresh_after_import_and_clear(self) -> None:
+        self._seed_aforronet_and_save()
+        self.main._aggregate_latest_totals(self.portfolio_id, self.settings_lookup)
+        entry = self.main._build_trade_republic_entry(
+            500.0,
+            0.0,
+            "EUR",
+            category="Cash",
+            source="manual",
+        )
+        self.main._save_trade_republic_entry(self.portfolio_id, entry)
+        totals, _, _, _, _ = self.main._aggregate_latest_totals(
+            self.portfolio_id, self.settings_lookup
+        )
+        self.assertAlmostEqual(totals.get("Cash", 0), 500.0, places=2)
+
+        self.main._clear_portfolio_data(self.portfolio_id)
+        totals, _, _, _, _ = self.main._aggregate_latest_totals(
+            self.portfolio_id, self.settings_lookup
+        )
+        self.assertEqual(totals, {})
+
+    def test_latest_totals_follow_category_settings(self) -> None:
+        self._seed_aforronet_and_save()
+        _, total_invested, _, _, _ = self.main._aggregate_latest_totals(
+            self.portfolio_id, self.settings_lookup
+        )
+        self.assertAlmostEqual(total_invested, 2800.0, places=2)
+        self.main._set_category_setting(self.portfolio_id, "Emergency Funds", False)
+        settings = self.main._get_category_settings(self.portfolio_id)
+        settings_lookup = {
+            self.main._normalize_text(key): value for key, value in settings.items()
+        }
+        _, total_invested, _, _, _ = self.main._aggregate_latest_totals(
+            self.portfolio_id, settings_lookup
+        )
+        self.assertAlmostEqual(total_invested, 2000.0, places=2)
+
 
 if __name__ == "__main__":
     unittest.main()
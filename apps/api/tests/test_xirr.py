@@ -0,0 +1,149 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta
+
+
+class XirrTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+
+    def tearDown(self) -> None:
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _npv(self, flows: list[tuple[date, float]], rate: float) -> float:
+        start = min(item[0] for item in flows)
+        return sum(
+            amount / (1 + rate) ** ((when - start).days / 365.25) for when, amount in flows
+        )
+
+    def test_simple_annual_return(self) -> None:
+        flows = [(date(2021, 1, 1), -1000.0), (date(2022, 1, 1), 1100.0)]
+        rate = self.main._xirr(flows)
+        self.assertIsNotNone(rate)
+        self.assertAlmostEqual(self._npv(flows, rate), 0.0, places=6)
+
+    def test_same_sign_flows_have_no_rate(self) -> None:
+        self.assertIsNone(self.main._xirr([]))
+        self.assertIsNone(self.main._xirr([(date(2021, 1, 1), 100.0)]))
+        self.assertIsNone(
+            self.main._xirr([(date(2021, 1, 1), -100.0), (date(2022, 1, 1), -5.0)])
+        )
+
+    def test_bracketing_fallback_when_newton_diverges(self) -> None:
+        # A near-total loss: Newton from a far-off guess leaves the valid range.
+        flows = [(date(2020, 1, 1), -1000.0), (date(2025, 1, 1), 1.0)]
+        rate = self.main._xirr(flows, guess=50.0)
+        self.assertIsNotNone(rate)
+        self.assertLess(rate, -0.7)
+        self.assertAlmostEqual(self._npv(flows, rate), 0.0, places=4)
+
+    def test_batch_matches_single_solves(self) -> None:
+        series = []
+        for index in range(50):
+            flows = [
+                (date(2018, 1, 1) + timedelta(days=30 * month), -100.0)
+                for month in range(12 + index)
+            ]
+            flows.append((date(2024, 1, 1), 100.0 * (12 + index) * (1 + index / 100)))
+            series.append(flows)
+        series.append([(date(2021, 1, 1), 50.0)])
+        rates = self.main._xirr_batch(series)
+        self.assertIsNone(rates[-1])
+        for flows, rate in zip(series[:-1], rates[:-1]):
+            self.assertIsNotNone(rate)
+            self.assertAlmostEqual(rate, self.main._xirr(flows), places=9)
+            self.assertAlmostEqual(self._npv(flows, rate), 0.0, places=4)
+
+    def _snapshot_holdings(self, portfolio_id: int, snapshot_date: date) -> dict:
+        saved = self.main._save_xtb_imports(
+            portfolio_id,
+            [
+                self.main.XtbImportItem(
+                    filename="xtb.xlsx",
+                    file_hash="xtb-hash",
+                    account_type="Broker",
+                    category="Stocks",
+                    current_value=1000.0,
+                    cash_value=0.0,
+                    invested=800.0,
+                    profit_value=50.0,
+                    profit_percent=None,
+                )
+            ],
+        )
+        with self.main._db_connection() as conn:
+            conn.execute(
+                "UPDATE xtb_imports SET imported_at = ? WHERE id = ?",
+                (snapshot_date.isoformat(), saved[0]["id"]),
+            )
+        settings = self.main._get_category_settings(portfolio_id)
+        settings_lookup = {
+            self.main._normalize_text(key): value for key, value in settings.items()
+        }
+        return self.main._list_holdings_for_portfolio(portfolio_id, settings_lookup)
+
+    def _buy(self, portfolio_id: int, buy_date: date) -> None:
+        self.main._save_holding_transaction(
+            portfolio_id,
+            self.main.HoldingTransactionRequest(
+                ticker="AAPL",
+                operation="buy",
+                trade_date=buy_date.isoformat(),
+                shares=10,
+                price=100.0,
+                fee=1.0,
+                category="Stocks",
+            ),
+        )
+        self.main._upsert_price("AAPL", 120.0, "USD")
+
+    def test_holdings_report_money_weighted_return(self) -> None:
+        portfolio = self.main._create_portfolio(
+            "user@example.com", "Test Portfolio", "USD", ["Stocks"]
+        )
+        today = datetime.utcnow().date()
+        buy_date = today - timedelta(days=400)
+        self._buy(portfolio["id"], buy_date)
+
+        holdings = self._snapshot_holdings(portfolio["id"], today)
+
+        item = holdings["items"][0]
+        expected = self.main._xirr([(buy_date, -1001.0), (today, 1200.0)])
+        self.assertAlmostEqual(item["money_weighted_return"], round(expected * 100, 2))
+
+    def test_foreign_holdings_return_uses_portfolio_currency_flows(self) -> None:
+        portfolio = self.main._create_portfolio(
+            "user@example.com", "Test Portfolio", "EUR", ["Stocks"]
+        )
+        snapshot_date = datetime.utcnow().date() - timedelta(days=30)
+        buy_date = snapshot_date - timedelta(days=400)
+        self.main._save_ticker_metadata({"ticker": "AAPL", "currency": "USD"})
+        self.main._save_fx_rates(
+            [(buy_date.isoformat(), "USD", 1.10), (snapshot_date.isoformat(), "USD", 1.20)],
+            "test",
+        )
+        self._buy(portfolio["id"], buy_date)
+
+        holdings = self._snapshot_holdings(portfolio["id"], snapshot_date)
+
+        item = holdings["items"][0]
+        self.assertEqual(item["current_value"], 1000.0)
+        # Today's price values the position today, not at the month-old snapshot.
+        today = datetime.utcnow().date()
+        expected = self.main._xirr([(buy_date, -1001.0 / 1.10), (today, 1000.0)])
+        self.assertAlmostEqual(item["money_weighted_return"], round(expected * 100, 2))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import importlib
+import json
+import os
+import sys
+import tempfile
+import unittest
+from io import BytesIO
+
+from fastapi import HTTPException
+from openpyxl import Workbook
+from starlette.datastructures import UploadFile
+
+
+def _xtb_workbook(
+    current_value: float, cash_value: float, sheet: str = "CASH OPERATION HISTORY"
+) -> bytes:
+    workbook = Workbook()
+    cash = workbook.active
+    cash.title = sheet
+    cash["D8"] = cash_value
+    cash["E8"] = current_value
+    cash.append([None])
+    cash.append([1, None, "Stock purchase", "2025-01-10 10:00:00", "AAPL.US", None, -250.0])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+async def _read_stream(response) -> list[dict]:
+    lines = []
+    async for chunk in response.body_iterator:
+        lines.append(json.loads(chunk))
+    return lines
+
+
+class XtbPreviewTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(self.tempdir.name, "test.db")
+        sys.path.insert(
+            0, os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+        )
+        import app.main as main
+
+        self.main = importlib.reload(main)
+        self.main._init_db()
+        self.main.PARSE_WORKERS = 2
+        self.email = "user@example.com"
+        self.authorization = f"Bearer {self.main._issue_session(self.email)}"
+        portfolio = self.main._create_portfolio(self.email, "Test Portfolio", "EUR", ["Stocks"])
+        self.portfolio_id = portfolio["id"]
+
+    def tearDown(self) -> None:
+        self.main._shutdown_parse_pool()
+        self.main._clear_parse_cache()
+        self.main._clear_session_cache()
+        self.main._close_db_connections()
+        self.tempdir.cleanup()
+
+    def _preview(self, files: list[tuple[str, bytes]], **kwargs):
+        return self.main.xtb_preview(
+            self.portfolio_id,
+            files=[UploadFile(file=BytesIO(content), filename=name) for name, content in files],
+            authorization=self.authorization,
+            **kwargs,
+        )
+
+    def test_workbooks_are_parsed_in_parallel_and_merged_in_order(self) -> None:
+        files = [
+            (f"account_50721856_{index}.xlsx", _xtb_workbook(1000.0 * index, 10.0 * index))
+            for index in range(1, 5)
+        ]
+
+        preview = self._preview(files, format=None, accept=None)
+
+        self.assertEqual(
+            [item["filename"] for item in preview["items"]], [name for name, _ in files]
+        )
+        self.assertEqual(
+            [item["current_value"] for item in preview["items"]],
+            [1000.0, 2000.0, 3000.0, 4000.0],
+        )
+        self.assertEqual(preview["items"][0]["invested"], 250.0)
+        self.assertEqual(len(preview["warnings"]), 4)
+        self.assertIsNotNone(self.main._parse_executor)
+
+    def test_stream_reports_each_file_and_isolates_failures(self) -> None:
+        files = [
+            ("account_50727616_good.xlsx", _xtb_workbook(500.0, 5.0)),
+            ("account_50727618_bad.xlsx", _xtb_workbook(1.0, 1.0, sheet="Something else")),
+        ]
+
+        response = self._preview(files, format="ndjson", accept=None)
+        lines = sorted(asyncio.run(_read_stream(response)), key=lambda line: line["index"])
+
+        self.assertEqual(response.media_type, "application/x-ndjson")
+        self.assertEqual(lines[0]["item"]["current_value"], 500.0)
+        self.assertEqual(lines[1]["status_code"], 400)
+        self.assertIn("CASH OPERATION HISTORY", lines[1]["detail"])
+
+        with self.assertRaises(HTTPException) as ctx:
+            self._preview(files, format=None, accept=None)
+        self.assertEqual(ctx.exception.status_code, 400)
+
+    def test_inline_parsing_without_a_pool(self) -> None:
+        self.main.PARSE_WORKERS = 0
+        preview = self._preview(
+            [("account_50721856.xlsx", _xtb_workbook(42.0, 2.0))], format=None, accept=None
+        )
+        self.assertEqual(preview["items"][0]["cash_value"], 2.0)
+        self.assertIsNone(self.main._parse_executor)
+
+
+if __name__ == "__main__":
+    unittest.main()
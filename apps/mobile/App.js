@@ -1544,13 +1544,17 @@ export default function App() {
         holdingsView === "overall"
           ? "/holdings/refresh-prices"
           : `/portfolios/${activePortfolio.id}/holdings/refresh-prices`;
-      const data = await authJson(path, {
+      let data = await authJson(path, {
         method: "POST",
         headers: {
           "Content-Type": "application/json"
         },
         body: JSON.stringify({ force: true })
       });
+      while (data.status !== "completed") {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        data = await authJson(`/holdings/refresh-prices/${data.job_id}`);
+      }
       const errorItem = (data.items || []).find((item) => item.status === "error");
       if (errorItem) {
         const errorText = String(errorItem.error || "");
@@ -2445,8 +2449,8 @@ export default function App() {
     }
     if (
       bankingPreview.warnings?.length &&
-      bankingPreview.rows?.length &&
-      bankingPreview.warnings.length >= bankingPreview.rows.length
+      bankingPreview.total_rows &&
+      bankingPreview.warnings.length >= bankingPreview.total_rows
     ) {
       setBankingError("No valid rows found. Check the column detection.");
       return;
@@ -2464,9 +2468,10 @@ export default function App() {
           source_file: bankingPreview.source_file,
           file_hash: bankingPreview.file_hash,
           institution: institutionName.trim(),
-          columns: bankingPreview.columns || [],
           mapping: buildBankingMappingPayload(),
-          rows: bankingPreview.rows || []
+          excluded_rows: (bankingPreview.rows || []).flatMap((row, index) =>
+            row.include ? [] : [index]
+          )
         })
       });
       setBankingMessage("Transactions imported.");
@@ -4639,8 +4644,8 @@ export default function App() {
             {bankingPreview.warnings?.length ? (
               <View style={styles.noticeBox}>
                 <Text style={styles.noticeText}>
-                  {`Rows: ${bankingPreview.rows.length} - Valid: ${
-                    bankingPreview.rows.length -
+                  {`Rows: ${bankingPreview.total_rows} - Valid: ${
+                    bankingPreview.total_rows -
                     bankingPreview.warnings.length
                   } - Skipped: ${bankingPreview.warnings.length}`}
                 </Text>
@@ -233,6 +233,7 @@ export const translations = {
       noFile: "Select a file or paste data first.",
       institutionRequired: "Institution is required.",
       importSuccess: "Transactions imported.",
+      importSkipped: "{count} already imported transactions were skipped.",
       noSubcategory: "No subcategory",
       summary: {
         income: "Income",
@@ -261,6 +262,7 @@ export const translations = {
         empty: "No budgets yet."
       },
       filters: {
+        search: "Search",
         month: "Month",
         category: "Category",
         subcategory: "Subcategory",
@@ -1083,6 +1085,7 @@ export const translations = {
       noFile: "Escolha um ficheiro ou cole dados primeiro.",
       institutionRequired: "A instituicao e obrigatoria.",
       importSuccess: "Transacoes importadas.",
+      importSkipped: "{count} transacoes ja importadas foram ignoradas.",
       noSubcategory: "Sem subcategoria",
       summary: {
         income: "Receitas",
@@ -1111,6 +1114,7 @@ export const translations = {
         empty: "Sem orcamentos."
       },
       filters: {
+        search: "Pesquisar",
         month: "Mes",
         category: "Categoria",
         subcategory: "Subcategoria",
@@ -1932,6 +1936,7 @@ export const translations = {
       noFile: "Selecciona un archivo o pega datos primero.",
       institutionRequired: "La institucion es obligatoria.",
       importSuccess: "Transacciones importadas.",
+      importSkipped: "{count} transacciones ya importadas se omitieron.",
       noSubcategory: "Sin subcategoria",
       summary: {
         income: "Ingresos",
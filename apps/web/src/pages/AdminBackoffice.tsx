@@ -259,10 +259,26 @@ function AdminBackoffice({ token }: AdminBackofficeProps) {
         },
         body: JSON.stringify(tickersToProcess)
       });
-      const data = await response.json();
+      let data = await response.json();
       if (!response.ok) {
         throw new Error(data?.detail || "Failed to fetch metadata.");
       }
+
+      // The fetch runs as a background job; poll its progress until it finishes
+      while (data.status === "queued" || data.status === "running") {
+        setFetchProgress(data.progress || 0);
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        const jobResponse = await fetch(`${API_BASE}/admin/jobs/${data.job_id}`, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
+        data = await jobResponse.json();
+        if (!jobResponse.ok) {
+          throw new Error(data?.detail || "Failed to fetch metadata.");
+        }
+      }
+      if (data.status === "failed") {
+        throw new Error(data.error || "Failed to fetch metadata.");
+      }
       
       setFetchProgress(100);
       
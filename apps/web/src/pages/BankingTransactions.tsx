@@ -17,6 +17,7 @@ type PreviewPayload = {
   file_hash: string;
   columns: string[];
   rows: PreviewRow[];
+  total_rows: number;
   mapping: Record<string, number | null>;
   warnings: string[];
 };
@@ -92,6 +93,7 @@ function BankingTransactions({ t, token, portfolio }: BankingTransactionsProps)
   const [categoryFilter, setCategoryFilter] = useState("");
   const [subcategoryFilter, setSubcategoryFilter] = useState("");
   const [institutionFilter, setInstitutionFilter] = useState("");
+  const [searchFilter, setSearchFilter] = useState("");
   const [updatingTxId, setUpdatingTxId] = useState<number | null>(null);
   const [budgets, setBudgets] = useState<BankingBudget[]>([]);
   const [budgetsLoading, setBudgetsLoading] = useState(false);
@@ -259,6 +261,9 @@ function BankingTransactions({ t, token, portfolio }: BankingTransactionsProps)
       if (institutionFilter) {
         params.set("institution", institutionFilter);
       }
+      if (searchFilter.trim()) {
+        params.set("q", searchFilter.trim());
+      }
       const url = params.toString()
         ? `${API_BASE}/portfolios/${activePortfolio.id}/banking/transactions?${params}`
         : `${API_BASE}/portfolios/${activePortfolio.id}/banking/transactions`;
@@ -315,7 +320,8 @@ function BankingTransactions({ t, token, portfolio }: BankingTransactionsProps)
     monthFilter,
     categoryFilter,
     subcategoryFilter,
-    institutionFilter
+    institutionFilter,
+    searchFilter
   ]);
 
   useEffect(() => {
@@ -429,8 +435,8 @@ function BankingTransactions({ t, token, portfolio }: BankingTransactionsProps)
     }
     if (
       preview.warnings?.length &&
-      preview.rows?.length &&
-      preview.warnings.length >= preview.rows.length
+      preview.total_rows &&
+      preview.warnings.length >= preview.total_rows
     ) {
       setError("No valid rows found. Check the column detection.");
       return;
@@ -450,9 +456,10 @@ function BankingTransactions({ t, token, portfolio }: BankingTransactionsProps)
             source_file: preview.source_file,
             file_hash: preview.file_hash,
             institution: institutionName.trim(),
-            columns: preview.columns,
             mapping: buildMappingPayload(),
-            rows: preview.rows
+            excluded_rows: preview.rows.flatMap((row, index) =>
+              row.include ? [] : [index]
+            )
           })
         }
       );
@@ -464,7 +471,14 @@ function BankingTransactions({ t, token, portfolio }: BankingTransactionsProps)
         }
         throw new Error(detail);
       }
-      setMessage(t.bankings?.importSuccess || "Transactions imported.");
+      const imported = t.bankings?.importSuccess || "Transactions imported.";
+      setMessage(
+        data?.skipped
+          ? `${imported} ${(
+              t.bankings?.importSkipped || "{count} already imported transactions were skipped."
+            ).replace("{count}", String(data.skipped))}`
+          : imported
+      );
       setPreview(null);
       setFile(null);
       setPasteText("");
@@ -755,8 +769,8 @@ function BankingTransactions({ t, token, portfolio }: BankingTransactionsProps)
           {preview.warnings?.length ? (
             <div className="banking-warnings">
               <p>
-                {`Rows: ${preview.rows.length} - Valid: ${
-                  preview.rows.length - preview.warnings.length
+                {`Rows: ${preview.total_rows} - Valid: ${
+                  preview.total_rows - preview.warnings.length
                 } - Skipped: ${preview.warnings.length}`}
               </p>
               <button
@@ -810,7 +824,7 @@ function BankingTransactions({ t, token, portfolio }: BankingTransactionsProps)
                 </button>
               </span>
             </div>
-            {preview.rows.slice(0, 50).map((row, rowIndex) => (
+            {preview.rows.map((row, rowIndex) => (
               <div className="row" key={`${rowIndex}`}>
                 <span>
                   <input
@@ -1059,6 +1073,14 @@ function BankingTransactions({ t, token, portfolio }: BankingTransactionsProps)
 
       <section className="banking-transactions">
         <div className="banking-filters">
+          <label>
+            <span>{t.bankings?.filters?.search || "Search"}</span>
+            <input
+              type="search"
+              value={searchFilter}
+              onChange={(event) => setSearchFilter(event.target.value)}
+            />
+          </label>
           <label>
             <span>{t.bankings?.filters?.month || "Month"}</span>
             <input
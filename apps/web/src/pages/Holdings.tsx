@@ -889,18 +889,27 @@ function Holdings({ t, token, portfolio, portfolios }: HoldingsProps) {
         },
         body: JSON.stringify({ force: true })
       });
-      const data = await response.json();
+      let data = await response.json();
       if (!response.ok) {
         throw new Error(data?.detail || t.holdings.refreshError);
       }
-      
-      // Calculate average progress from results
-      const items = data.items || [];
-      if (items.length > 0) {
-        const lastProgress = items[items.length - 1]?.progress || 100;
-        setRefreshProgress(lastProgress);
+
+      // Prices are fetched by a background job; poll it until it completes
+      while (data.status !== "completed") {
+        setRefreshProgress(data.progress || 0);
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const jobResponse = await fetch(
+          `${API_BASE}/holdings/refresh-prices/${data.job_id}`,
+          { headers: { Authorization: `Bearer ${token}` } }
+        );
+        data = await jobResponse.json();
+        if (!jobResponse.ok) {
+          throw new Error(data?.detail || t.holdings.refreshError);
+        }
       }
-      
+      setRefreshProgress(100);
+
+      const items = data.items || [];
       const errorItem = items.find((item: any) => item.status === "error");
       if (errorItem) {
         const errorText = String(errorItem.error || "");